@@ -4,21 +4,85 @@
 import time
 import re
 import os
+import json
+import asyncio
+import contextvars
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from core.retrieval import HybridRetriever
 from core.generation import Generator
+from core.cache import AnswerCache, CorpusVersionWatcher
+from core.filters import MetadataFilter
+from core.startup import ComponentLoader
+from core.memory import memory_usage
+from core.metrics import metrics, span, record_span, start_trace, finish_trace, set_attribute
 
 # --- Load Configuration ---
 load_dotenv()
 CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE_THRESHOLD", 0.5))
+ABSTENTION_MESSAGE = "I'm sorry, my knowledge is limited to the history of Artificial Intelligence. I cannot answer that question based on the provided documents."
+# Retrieval is CPU-bound (torch), so it runs on its own small thread pool
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", 2))
+# How many requests may be in retrieval/generation at once, and how many may wait for a slot
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", 8))
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", 32))
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", 30))
+# /ask/batch: most queries per request, and how many of its answers are generated at once
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", 64))
+BATCH_GENERATION_CONCURRENCY = int(os.getenv("BATCH_GENERATION_CONCURRENCY", 4))
+# Answer cache: exact (normalized text) and near-duplicate (embedding similarity) hits
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+ANSWER_CACHE_MAX_MB = float(os.getenv("ANSWER_CACHE_MAX_MB", 64))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH") or None  # e.g. "answer_cache.json"
 
-# --- Load Models at Startup ---
-print("Loading models, this might take a few minutes...")
-retriever = HybridRetriever()
-generator = Generator()
-print("Models loaded successfully.")
+# --- Load Models in the Background ---
+# The server accepts connections right away; /readyz reports when the models are loaded.
+retriever = None
+generator = None
+startup = ComponentLoader()
+
+def load_retriever():
+    global retriever
+    retriever = HybridRetriever()
+
+def preload_retriever():
+    """
+    Called by serve.py before it forks the workers, so they share the loaded models and index
+    mappings copy-on-write. Each worker starts the retriever's threads in start_loading.
+    """
+    global retriever
+    retriever = HybridRetriever(start=False)
+
+def load_generator():
+    global generator
+    generator = Generator()
+    # Have Ollama load the LLM now instead of on the first question
+    generator.warm_up()
+
+corpus_version = CorpusVersionWatcher()
+
+def serving_version() -> str:
+    """The index generation answers are computed from; until the retriever is loaded, the one it will load."""
+    return retriever.snapshot.version if retriever is not None else corpus_version.current()
+
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    max_bytes=int(ANSWER_CACHE_MAX_MB * 1024 * 1024),
+    ttl_seconds=ANSWER_CACHE_TTL,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY,
+    persist_path=ANSWER_CACHE_PATH,
+    # Follows the snapshot being served, not the stamp on disk, which changes before the reload
+    version_fn=serving_version
+) if ANSWER_CACHE_ENABLED else None
 
 # --- Helper Function ---
 def parse_llm_output(raw_text: str) -> tuple[str, list[str]]:
@@ -29,31 +93,291 @@ def parse_llm_output(raw_text: str) -> tuple[str, list[str]]:
     cleaned_citations = [c.replace("[Source:", "").replace("]", "").strip() for c in citations]
     return answer_text, cleaned_citations
 
+class StreamingCitationParser:
+    """
+    Incremental version of parse_llm_output for token streams.
+    Text is released as soon as it cannot be part of a citation or a special token;
+    anything that might still become one is held back until it is complete.
+    """
+    CITATION_PREFIX = "[Source:"
+    # Give up on a marker that never closes so the stream doesn't stall forever
+    MAX_PENDING_CHARS = 300
+
+    def __init__(self):
+        self.buffer = ""
+        self.citations = []
+
+    def feed(self, token: str) -> tuple[str, list[str]]:
+        self.buffer += token
+        text_out = []
+        new_citations = []
+
+        while self.buffer:
+            match = re.search(r"\[|<", self.buffer)
+            if not match:
+                text_out.append(self.buffer)
+                self.buffer = ""
+                break
+
+            text_out.append(self.buffer[:match.start()])
+            self.buffer = self.buffer[match.start():]
+
+            if self.buffer.startswith("<"):
+                if len(self.buffer) < 2:
+                    break  # Need more text to decide
+                if not self.buffer.startswith("<|"):
+                    text_out.append("<")
+                    self.buffer = self.buffer[1:]
+                    continue
+                end = self.buffer.find("|>", 2)
+                if end == -1:
+                    if len(self.buffer) > self.MAX_PENDING_CHARS:
+                        text_out.append(self.buffer)
+                        self.buffer = ""
+                    break
+                # Drop special tokens such as <|end|>
+                self.buffer = self.buffer[end + 2:]
+                continue
+
+            # The buffer starts with '['
+            prefix_len = min(len(self.buffer), len(self.CITATION_PREFIX))
+            if self.buffer[:prefix_len] != self.CITATION_PREFIX[:prefix_len]:
+                text_out.append("[")
+                self.buffer = self.buffer[1:]
+                continue
+            end = self.buffer.find("]")
+            if end == -1:
+                if len(self.buffer) > self.MAX_PENDING_CHARS:
+                    text_out.append(self.buffer)
+                    self.buffer = ""
+                break
+            citation = self.buffer[len(self.CITATION_PREFIX):end].strip()
+            self.citations.append(citation)
+            new_citations.append(citation)
+            self.buffer = self.buffer[end + 1:]
+
+        return "".join(text_out), new_citations
+
+    def finish(self) -> str:
+        """Flushes whatever is still held back once the stream has ended."""
+        remaining = self.buffer
+        self.buffer = ""
+        return remaining
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class ConcurrencyLimiter:
+    """
+    Caps the number of requests being served at once. Extra requests wait in a bounded
+    queue; when the queue is full (or the wait times out) the request is rejected with
+    a 503 so clients can back off instead of piling up on the server.
+    """
+    def __init__(self, max_active: int, max_queued: int, queue_timeout: float):
+        self.semaphore = asyncio.Semaphore(max_active)
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+
+    async def acquire(self):
+        if self.semaphore.locked() and self.waiting >= self.max_queued:
+            raise HTTPException(status_code=503, detail="Server is busy, please retry later.", headers={"Retry-After": "1"})
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Server is busy, please retry later.", headers={"Retry-After": "1"})
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self.semaphore.release()
+
+    def release_once(self):
+        """Returns a callable that releases the slot the first time it is called."""
+        released = False
+        def _release():
+            nonlocal released
+            if not released:
+                released = True
+                self.release()
+        return _release
+
+limiter = ConcurrencyLimiter(MAX_CONCURRENT_REQUESTS, MAX_QUEUED_REQUESTS, QUEUE_TIMEOUT)
+
+async def run_in_retrieval_pool(func, *args):
+    loop = asyncio.get_running_loop()
+    # Run in a copy of the request's context so spans recorded on the pool thread join its trace
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(retrieval_executor, context.run, func, *args)
+
+async def run_retrieval(query: str, top_k: int, query_embedding=None, filters: MetadataFilter | None = None) -> list[dict]:
+    return await run_in_retrieval_pool(retriever.retrieve, query, top_k, query_embedding, filters)
+
+async def run_batch_retrieval(queries: list[str], top_k: int, query_embeddings=None, filters: MetadataFilter | None = None) -> list[list[dict]]:
+    return await run_in_retrieval_pool(retriever.retrieve_batch, queries, top_k, query_embeddings, filters)
+
+def request_filters(filters) -> MetadataFilter | None:
+    """Turns the request's filters into a MetadataFilter. Filtered answers bypass the answer cache."""
+    if filters is None:
+        return None
+    try:
+        return MetadataFilter.from_fields(**filters.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid filter: {e}")
+
+async def lookup_cached_answer(query: str):
+    """Returns (cached response or None, hit type, query embedding computed along the way)."""
+    if answer_cache is None:
+        return None, None, None
+    with span("cache_lookup"):
+        cached = answer_cache.get_exact(query)
+    if cached is not None:
+        record_cache_result("exact")
+        return cached, "exact", None
+    query_embedding = await run_in_retrieval_pool(retriever.embed_query, query)
+    with span("cache_lookup"):
+        cached = answer_cache.get_similar(query_embedding)
+    hit_type = "semantic" if cached is not None else None
+    record_cache_result(hit_type or "miss")
+    return cached, hit_type, query_embedding
+
+def record_cache_result(result: str):
+    metrics.increment("rag_answer_cache_requests_total", result=result)
+    set_attribute("cache", result)
+
+def cache_answer(query: str, query_embedding, answer: str, citations: list[str], confidence: float, version: str):
+    # Never cache failures; they should be retried next time
+    if answer_cache is None or query_embedding is None or answer.startswith("Error:"):
+        return
+    # `version` was taken before retrieval; if the indexes were swapped since, the answer is dropped
+    answer_cache.put(query, query_embedding, {
+        "answer": answer,
+        "citations": citations,
+        "confidence": float(confidence)
+    }, version)
+
 # --- Pydantic Models ---
+class QueryFilters(BaseModel):
+    source: str | list[str] | None = None  # File name(s), e.g. "milestones.csv"
+    file_type: str | list[str] | None = None  # Extension(s) without the dot, e.g. ["pdf", "md"]
+    modified_after: float | str | None = None  # Unix timestamp or ISO date, e.g. "2024-01-31"
+    modified_before: float | str | None = None
+
 class QueryRequest(BaseModel):
     query: str
+    filters: QueryFilters | None = None
 
 class QueryResponse(BaseModel):
     answer: str
     citations: list[str]
     confidence: float
     timings: dict
+    context: dict | None = None  # Token report of the context assembly (None when nothing was generated)
+
+class BatchQueryRequest(BaseModel):
+    queries: list[str]
+    filters: QueryFilters | None = None  # Applied to every query
+
+class BatchQueryResponse(BaseModel):
+    results: list[QueryResponse]
+    timings: dict
 
 # --- FastAPI Application ---
-app = FastAPI(title="RAG System API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("Loading models in the background...")
+    if retriever is not None:
+        startup.add("retriever", retriever.start)  # Preloaded by serve.py
+    else:
+        startup.add("retriever", load_retriever)
+    startup.add("generator", load_generator)
+    yield
+    startup.shutdown()
+    if retriever is not None:
+        retriever.close()
+    if generator is not None:
+        await generator.aclose()
+    if answer_cache is not None:
+        answer_cache.save()
+    retrieval_executor.shutdown(wait=False)
+
+app = FastAPI(title="RAG System API", lifespan=lifespan)
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests (models may still be loading)."""
+    return {"status": "ok", "uptime_seconds": round(time.time() - startup.started_at, 3)}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 once every component is loaded, 503 with per-component status until then."""
+    report = startup.report()
+    if retriever is not None:
+        report["components"]["retriever"]["parts"] = retriever.load_timings
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+def require_ready():
+    if not startup.is_ready():
+        raise HTTPException(status_code=503, detail="Models are still loading, please retry later.", headers={"Retry-After": "5"})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Stage latency histograms and counters in the Prometheus text format."""
+    return PlainTextResponse(metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+def get_stats():
+    return {
+        "latency": metrics.summary(),
+        "batching": retriever.batching_stats() if retriever is not None else {},
+        "retrieval_cache": retriever.cache_stats() if retriever is not None else {},
+        "indexes": retriever.index_stats() if retriever is not None else {},
+        "answer_cache": answer_cache.stats() if answer_cache is not None else {},
+        # Per process: with serve.py, each worker reports its own (compare pss_mb across workers)
+        "process": {"pid": os.getpid(), "worker": os.getenv("SERVE_WORKER_ID"), "memory": memory_usage()}
+    }
 
 @app.post("/ask", response_model=QueryResponse)
-def ask_question(request: QueryRequest):
+async def ask_question(request: QueryRequest):
+    require_ready()
+
+    trace = start_trace("ask")
+    with span("queue_wait"):
+        await limiter.acquire()
+    try:
+        response = await answer_question(request)
+    finally:
+        limiter.release()
+        finish_trace(trace, query=request.query)
+    response.timings["stages_ms"] = trace.breakdown_ms()
+    response.context = trace.attributes.get("context")
+    return response
+
+async def answer_question(request: QueryRequest) -> QueryResponse:
     start_time = time.time()
-    
-    if not retriever or not generator:
-        raise HTTPException(status_code=503, detail="Models not loaded.")
+    filters = request_filters(request.filters)
+
+    # 0. Answer Cache (cached answers were produced without filters)
+    cached, hit_type, query_embedding = await lookup_cached_answer(request.query) if filters is None else (None, None, None)
+    if cached is not None:
+        return QueryResponse(
+            **cached,
+            timings={"cache": hit_type, "total": f"{time.time() - start_time:.2f}s"}
+        )
 
     # 1. Retrieval
     retrieval_start_time = time.time()
-    retrieved_docs = retriever.retrieve(request.query, top_k=2)
+    version = retriever.snapshot.version
+    with span("retrieval"):
+        retrieved_docs = await run_retrieval(request.query, 2, query_embedding, filters)
     retrieval_time = time.time() - retrieval_start_time
 
+    return await complete_answer(request.query, retrieved_docs, query_embedding, retrieval_time, start_time, version)
+
+async def complete_answer(query: str, retrieved_docs: list[dict], query_embedding, retrieval_time: float, start_time: float,
+                          version: str) -> QueryResponse:
+    """Confidence check, abstention or generation, and caching for one retrieved query."""
     # 2. Confidence Scoring
     if not retrieved_docs:
         confidence = 0.0
@@ -63,8 +387,9 @@ def ask_question(request: QueryRequest):
     # 3. Abstention Logic
     if confidence < CONFIDENCE_THRESHOLD:
         total_time = time.time() - start_time
+        cache_answer(query, query_embedding, ABSTENTION_MESSAGE, [], confidence, version)
         return QueryResponse(
-            answer="I'm sorry, my knowledge is limited to the history of Artificial Intelligence. I cannot answer that question based on the provided documents.",
+            answer=ABSTENTION_MESSAGE,
             citations=[],
             confidence=confidence,
             timings={
@@ -76,11 +401,13 @@ def ask_question(request: QueryRequest):
 
     # 4. Generation
     generation_start_time = time.time()
-    raw_answer = generator.generate_response(request.query, retrieved_docs)
+    with span("generation"):
+        raw_answer = await generator.agenerate_response(query, retrieved_docs)
     generation_time = time.time() - generation_start_time
     
     # 5. Post-processing
     clean_answer, citations = parse_llm_output(raw_answer)
+    cache_answer(query, query_embedding, clean_answer, citations, confidence, version)
     
     total_time = time.time() - start_time
 
@@ -93,4 +420,187 @@ def ask_question(request: QueryRequest):
             "generation": f"{generation_time:.2f}s",
             "total": f"{total_time:.2f}s"
         }
-    )
\ No newline at end of file
+    )
+
+@app.post("/ask/batch", response_model=BatchQueryResponse)
+async def ask_batch(request: BatchQueryRequest):
+    """
+    Answers many queries in one request. Retrieval runs for all of them together (one
+    embedding batch, one Chroma query, one rerank batch); the answers are then generated
+    with at most BATCH_GENERATION_CONCURRENCY running at once. The whole batch holds one
+    slot of the concurrency limiter.
+    """
+    require_ready()
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_QUERIES} queries per batch.")
+
+    filters = request_filters(request.filters)
+    use_cache = answer_cache is not None and filters is None
+
+    trace = start_trace("ask_batch")
+    with span("queue_wait"):
+        await limiter.acquire()
+    try:
+        start_time = time.time()
+        queries = request.queries
+        results = [None] * len(queries)
+
+        # 0. Answer Cache (exact hits first; the rest are embedded in one batch for semantic lookups)
+        to_retrieve = []
+        for i, query in enumerate(queries):
+            cached = answer_cache.get_exact(query) if use_cache else None
+            if cached is not None:
+                record_cache_result("exact")
+                results[i] = QueryResponse(**cached, timings={"cache": "exact", "total": f"{time.time() - start_time:.2f}s"})
+            else:
+                to_retrieve.append(i)
+        embeddings = await run_in_retrieval_pool(retriever.embed_queries, [queries[i] for i in to_retrieve]) if to_retrieve else []
+        remaining = []
+        for i, embedding in zip(to_retrieve, embeddings):
+            cached = answer_cache.get_similar(embedding) if use_cache else None
+            if cached is not None:
+                record_cache_result("semantic")
+                results[i] = QueryResponse(**cached, timings={"cache": "semantic", "total": f"{time.time() - start_time:.2f}s"})
+                continue
+            if use_cache:
+                record_cache_result("miss")
+            remaining.append((i, embedding))
+
+        # 1. Retrieval, batched
+        retrieval_start_time = time.time()
+        version = retriever.snapshot.version
+        with span("retrieval"):
+            retrieved = await run_batch_retrieval([queries[i] for i, _ in remaining], 2, [e for _, e in remaining], filters)
+        retrieval_time = time.time() - retrieval_start_time
+
+        # 2-5. Abstention or generation, with bounded parallelism
+        semaphore = asyncio.Semaphore(BATCH_GENERATION_CONCURRENCY)
+
+        async def answer_one(i, embedding, retrieved_docs):
+            async with semaphore:
+                item_trace = start_trace("ask_batch_item")
+                try:
+                    # Without the embedding the answer isn't cached, which filtered answers must not be
+                    response = await complete_answer(queries[i], retrieved_docs, embedding if use_cache else None, retrieval_time, start_time, version)
+                finally:
+                    finish_trace(item_trace, query=queries[i])
+                response.context = item_trace.attributes.get("context")
+                results[i] = response
+
+        # Each task runs in its own copy of the context, so every answer gets its own trace
+        await asyncio.gather(*(asyncio.create_task(answer_one(i, e, docs)) for (i, e), docs in zip(remaining, retrieved)))
+    finally:
+        limiter.release()
+        finish_trace(trace, queries=len(request.queries))
+
+    return BatchQueryResponse(results=results, timings={
+        "retrieval": f"{retrieval_time:.2f}s",
+        "total": f"{time.time() - start_time:.2f}s",
+        "stages_ms": trace.breakdown_ms()
+    })
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: QueryRequest):
+    """
+    Same pipeline as /ask, but the answer is sent as server-sent events while it is generated:
+    a 'meta' event with the confidence, 'token' events with answer text, 'citation' events
+    as soon as a citation is complete, and a final 'done' event with the parsed answer.
+    """
+    require_ready()
+    filters = request_filters(request.filters)
+
+    trace = start_trace("ask_stream")
+    with span("queue_wait"):
+        await limiter.acquire()
+    # The slot is held until the stream finishes; the background task is a safety net
+    # for clients that disconnect before the stream starts.
+    release = limiter.release_once()
+    try:
+        start_time = time.time()
+        cached, hit_type, query_embedding = await lookup_cached_answer(request.query) if filters is None else (None, None, None)
+        if cached is None:
+            retrieval_start_time = time.time()
+            version = retriever.snapshot.version
+            with span("retrieval"):
+                retrieved_docs = await run_retrieval(request.query, 2, query_embedding, filters)
+            retrieval_time = time.time() - retrieval_start_time
+            confidence = retrieved_docs[0]['score'] if retrieved_docs else 0.0
+    except BaseException:
+        release()
+        finish_trace(trace, query=request.query)
+        raise
+
+    async def event_stream():
+        try:
+            events = cached_events() if cached is not None else generate_events()
+            async for event in events:
+                yield event
+        finally:
+            release()
+            finish_trace(trace, query=request.query)
+
+    async def cached_events():
+        yield sse_event("meta", {"confidence": cached["confidence"], "cache": hit_type})
+        yield sse_event("token", {"text": cached["answer"]})
+        for citation in cached["citations"]:
+            yield sse_event("citation", {"citation": citation})
+        yield sse_event("done", {
+            **cached,
+            "timings": {"cache": hit_type, "total": f"{time.time() - start_time:.2f}s"}
+        })
+
+    async def generate_events():
+        yield sse_event("meta", {"confidence": float(confidence)})
+
+        if confidence < CONFIDENCE_THRESHOLD:
+            cache_answer(request.query, query_embedding, ABSTENTION_MESSAGE, [], confidence, version)
+            yield sse_event("token", {"text": ABSTENTION_MESSAGE})
+            yield sse_event("done", {
+                "answer": ABSTENTION_MESSAGE,
+                "citations": [],
+                "confidence": float(confidence),
+                "timings": {
+                    "retrieval": f"{retrieval_time:.2f}s",
+                    "generation": "0.00s",
+                    "total": f"{time.time() - start_time:.2f}s"
+                }
+            })
+            return
+
+        generation_start_time = time.time()
+        first_token_time = None
+        raw_tokens = []
+        parser = StreamingCitationParser()
+        async for token in generator.astream_response(request.query, retrieved_docs):
+            if first_token_time is None:
+                first_token_time = time.time() - generation_start_time
+                record_span("first_token", first_token_time)
+            raw_tokens.append(token)
+            text, new_citations = parser.feed(token)
+            if text:
+                yield sse_event("token", {"text": text})
+            for citation in new_citations:
+                yield sse_event("citation", {"citation": citation})
+        remaining = parser.finish()
+        if remaining:
+            yield sse_event("token", {"text": remaining})
+        generation_time = time.time() - generation_start_time
+        record_span("generation", generation_time)
+
+        clean_answer, citations = parse_llm_output("".join(raw_tokens))
+        cache_answer(request.query, query_embedding, clean_answer, citations, confidence, version)
+        yield sse_event("done", {
+            "answer": clean_answer,
+            "citations": citations,
+            "confidence": float(confidence),
+            "timings": {
+                "retrieval": f"{retrieval_time:.2f}s",
+                "first_token": f"{(first_token_time or 0.0):.2f}s",
+                "generation": f"{generation_time:.2f}s",
+                "total": f"{time.time() - start_time:.2f}s",
+                "stages_ms": trace.breakdown_ms()
+            },
+            "context": trace.attributes.get("context")
+        })
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", background=BackgroundTask(release))
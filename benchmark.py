@@ -0,0 +1,488 @@
+import os
+import sys
+import json
+import time
+import string
+import asyncio
+import argparse
+import platform
+import resource
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+# Benchmarks for retrieval and end-to-end QPS, run in-process on synthetic corpora.
+# Every corpus size runs in its own subprocess, so peak RSS and loaded state don't leak
+# between sizes. Ollama is replaced by a local stub that emits tokens at a fixed rate.
+#
+#   python benchmark.py --sizes 10000,100000 --concurrency 1,4,16 --output bench.json
+#
+# --prefill instead measures prompt evaluation on a real Ollama server, comparing the old
+# prompt layout (context inside the system block) with the stable system prefix.
+# --chunking measures chunking throughput of the native splitter against LangChain's.
+
+VOCAB_SIZE = 30000
+WORDS_PER_CHUNK = 150
+CHUNKS_PER_FILE = 50
+CHROMA_BATCH = 5000
+
+
+# --- Stub Ollama server ---
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Answers /api/chat like Ollama does, at `tokens_per_second`, with Ollama-style timing stats."""
+    tokens_per_second = 50.0
+    answer_tokens = 64
+    prefill_seconds = 0.05
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._send_json({"models": [{"name": "phi3:latest"}]})
+
+    def do_POST(self):
+        if self.path.endswith("/api/tags"):
+            return self.do_GET()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if body.get("options", {}).get("num_predict") == 1:
+            # Warm-up request
+            return self._send_json({"message": {"role": "assistant", "content": ""}, "done": True})
+
+        started = time.perf_counter()
+        time.sleep(self.prefill_seconds)
+        tokens = [f"token{i} " for i in range(self.answer_tokens)] + ["[Source: synthetic_0.txt (Chunk 1)]"]
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(1.0 / self.tokens_per_second)
+                self.wfile.write((json.dumps({"message": {"role": "assistant", "content": token}, "done": False}) + "\n").encode())
+                self.wfile.flush()
+            self.wfile.write((json.dumps({"done": True, **self._stats(started)}) + "\n").encode())
+        else:
+            time.sleep(len(tokens) / self.tokens_per_second)
+            self._send_json({"message": {"role": "assistant", "content": "".join(tokens)}, "done": True, **self._stats(started)})
+
+    def _stats(self, started: float) -> dict:
+        total = time.perf_counter() - started
+        return {
+            "total_duration": int(total * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": 512,
+            "prompt_eval_duration": int(self.prefill_seconds * 1e9),
+            "eval_count": self.answer_tokens + 1,
+            "eval_duration": int((total - self.prefill_seconds) * 1e9),
+        }
+
+    def _send_json(self, data: dict):
+        payload = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_stub_ollama(tokens_per_second: float, answer_tokens: int) -> ThreadingHTTPServer:
+    StubOllamaHandler.tokens_per_second = tokens_per_second
+    StubOllamaHandler.answer_tokens = answer_tokens
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-ollama", daemon=True).start()
+    return server
+
+
+# --- Synthetic corpus ---
+def make_vocabulary(rng: np.random.Generator) -> list[str]:
+    letters = np.array(list(string.ascii_lowercase))
+    lengths = rng.integers(3, 11, size=VOCAB_SIZE)
+    return sorted({"".join(rng.choice(letters, size=n)) for n in lengths})
+
+
+def sample_words(rng: np.random.Generator, vocab: list[str], n: int) -> list[str]:
+    """Zipf-distributed word ids, so a few terms are very common and most are rare, as in real text."""
+    ids = np.minimum(rng.zipf(1.2, size=n) - 1, len(vocab) - 1)
+    return [vocab[i] for i in ids]
+
+
+def make_chunks(rng: np.random.Generator, vocab: list[str], start: int, count: int):
+    ids, texts, metadatas = [], [], []
+    for i in range(start, start + count):
+        ids.append(f"chunk-{i}")
+        texts.append(" ".join(sample_words(rng, vocab, WORDS_PER_CHUNK)))
+        metadatas.append({"source": f"synthetic_{i // CHUNKS_PER_FILE}.txt", "chunk_num": i % CHUNKS_PER_FILE + 1})
+    return ids, texts, metadatas
+
+
+def make_queries(rng: np.random.Generator, vocab: list[str], n: int) -> list[str]:
+    # Skip the most common words, as real questions mostly do
+    return [" ".join(sample_words(rng, vocab[50:], int(rng.integers(3, 8)))) for _ in range(n)]
+
+
+def build_corpus(size: int, seed: int, embedding_dim: int) -> tuple[dict, list[str]]:
+    """
+    Builds Chroma, the BM25 index, the chunk store and the vector index in the current directory.
+    Returns the build timings and a list of queries drawn from the same vocabulary.
+    """
+    import chromadb
+    from core.lexical import BM25Index
+    from core.chunk_store import ChunkStore
+    from core.vector_index import VectorIndex
+    from core.retrieval import DB_PATH, LEXICAL_INDEX_PATH, CHUNK_STORE_PATH, VECTOR_INDEX_PATH
+
+    rng = np.random.default_rng(seed)
+    vocab = make_vocabulary(rng)
+    timings = {"generate": 0.0, "chroma": 0.0}
+
+    # Vectors are random unit vectors: embedding a million synthetic chunks would only
+    # benchmark the embedding model, which ingestion caches anyway.
+    collection = chromadb.PersistentClient(path=DB_PATH).get_or_create_collection(name="ai_history")
+    all_ids, all_texts, all_metadatas, all_vectors = [], [], [], []
+    for start in range(0, size, CHROMA_BATCH):
+        t0 = time.perf_counter()
+        ids, texts, metadatas = make_chunks(rng, vocab, start, min(CHROMA_BATCH, size - start))
+        vectors = rng.standard_normal((len(ids), embedding_dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        timings["generate"] += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        collection.add(ids=ids, embeddings=vectors.tolist(), documents=texts, metadatas=metadatas)
+        timings["chroma"] += time.perf_counter() - t0
+        all_ids += ids
+        all_texts += texts
+        all_metadatas += metadatas
+        all_vectors.append(vectors)
+        print(f"  generated {len(all_ids)}/{size} chunks", end="\r")
+    print()
+
+    t0 = time.perf_counter()
+    BM25Index.build(all_ids, all_texts, [m["source"] for m in all_metadatas]).save(LEXICAL_INDEX_PATH)
+    timings["bm25"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    ChunkStore.build(all_ids, all_texts, all_metadatas).save(CHUNK_STORE_PATH)
+    timings["chunk_store"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    VectorIndex.build(all_ids, np.concatenate(all_vectors)).save(VECTOR_INDEX_PATH)  # Trains IVF lists on large corpora
+    timings["vector_index"] = time.perf_counter() - t0
+    return {name: round(seconds, 3) for name, seconds in timings.items()}, make_queries(rng, vocab, 10000)
+
+
+# --- Measurements ---
+def latency_summary(latencies: list[float], elapsed: float, errors: int = 0) -> dict:
+    values = np.array(latencies) if latencies else np.zeros(1)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "qps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {"mean": round(values.mean() * 1000, 2), "p50": round(p50 * 1000, 2),
+                       "p95": round(p95 * 1000, 2), "p99": round(p99 * 1000, 2)},
+    }
+
+
+def stage_percentiles() -> dict:
+    from core.metrics import metrics
+    stages = metrics.summary()["latency_seconds"].get("rag_stage_seconds", {})
+    return {stage: {k: round(v * 1000, 3) for k, v in s.items() if k.startswith("p")} for stage, s in stages.items()}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def bench_retrieval(retriever, queries: list[str], concurrency: int, top_k: int) -> dict:
+    from core.metrics import metrics
+    metrics.reset()
+    latencies = []
+
+    def run(query):
+        start = time.perf_counter()
+        retriever.retrieve(query, top_k)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run, queries))
+    result = latency_summary(latencies, time.perf_counter() - start)
+    return {"concurrency": concurrency, **result, "stages_ms": stage_percentiles()}
+
+
+async def bench_api(app, queries: list[str], concurrency: int) -> dict:
+    import httpx
+    from core.metrics import metrics
+    metrics.reset()
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=600) as client:
+        async def run(query):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/ask", json={"query": query})
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run(q) for q in queries))
+    result = latency_summary(latencies, time.perf_counter() - start, errors)
+    return {"concurrency": concurrency, **result, "stages_ms": stage_percentiles()}
+
+
+# --- Per-size worker (runs in a subprocess) ---
+def run_size(args) -> dict:
+    workdir = os.path.abspath(os.path.join(args.workdir, f"size_{args.size}"))
+    # Always build from scratch so build times are comparable between runs
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    stub = start_stub_ollama(args.tokens_per_second, args.answer_tokens)
+    os.environ["OLLAMA_API_URL"] = f"http://127.0.0.1:{stub.server_port}/api/chat"
+    # Every request should exercise retrieval and generation
+    os.environ["ANSWER_CACHE_ENABLED"] = "false"
+    os.environ["CONFIDENCE_THRESHOLD"] = "0"
+    os.environ["MAX_QUEUED_REQUESTS"] = str(max(args.concurrency_levels) * 2)
+
+    print(f"Building synthetic corpus of {args.size} chunks in {workdir}...")
+    build_timings, queries = build_corpus(args.size, args.seed, args.embedding_dim)
+    result = {"chunks": args.size, "build_seconds": build_timings, "rss_after_build_mb": peak_rss_mb()}
+
+    from core.retrieval import HybridRetriever
+    import core.retrieval as retrieval_config
+    from core.inference import INFERENCE_BACKEND
+    t0 = time.perf_counter()
+    retriever = HybridRetriever()
+    result["retriever_load_seconds"] = round(time.perf_counter() - t0, 3)
+    result["config"] = {
+        "inference_backend": INFERENCE_BACKEND,
+        "micro_batching": retrieval_config.ENABLE_MICRO_BATCHING,
+        "dense_backend": retrieval_config.DENSE_BACKEND,
+        "dense_ivf_nprobe": retrieval_config.DENSE_IVF_NPROBE,
+        "fusion_method": retrieval_config.FUSION_METHOD,
+        "dense_candidates": retrieval_config.DENSE_CANDIDATES,
+        "lexical_candidates": retrieval_config.LEXICAL_CANDIDATES,
+        "rerank_budget": retrieval_config.RERANK_BUDGET,
+    }
+
+    retriever.retrieve(queries[0], args.top_k)  # Warm-up
+    result["retrieval"] = []
+    for i, concurrency in enumerate(args.concurrency_levels):
+        batch = queries[i * args.queries:(i + 1) * args.queries]
+        run = bench_retrieval(retriever, batch, concurrency, args.top_k)
+        print(f"  retrieval  c={concurrency:<3} {run['qps']:>8} qps  p50 {run['latency_ms']['p50']} ms  p99 {run['latency_ms']['p99']} ms")
+        result["retrieval"].append(run)
+
+    if not args.skip_e2e:
+        import api
+        # Share the retriever that is already loaded instead of loading a second one
+        api.retriever = retriever
+        api.startup.add("retriever", lambda: None)
+        api.startup.add("generator", api.load_generator)
+        while not api.startup.is_ready():
+            time.sleep(0.05)
+        result["end_to_end"] = []
+        for i, concurrency in enumerate(args.concurrency_levels):
+            batch = queries[-(i + 1) * args.e2e_queries:][:args.e2e_queries]
+            run = asyncio.run(bench_api(api.app, batch, concurrency))
+            print(f"  end-to-end c={concurrency:<3} {run['qps']:>8} qps  p50 {run['latency_ms']['p50']} ms  p99 {run['latency_ms']['p99']} ms")
+            result["end_to_end"].append(run)
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    stub.shutdown()
+    return result
+
+
+# --- Prefill: prompt layout on a real Ollama server ---
+def legacy_prompt(query: str, context: list[dict]) -> str:
+    """The previous layout: per-request context inside the system block, so no prefix is shared."""
+    from core.generation import SYSTEM_PROMPT
+    from core.context import format_context
+    return f"<|system|>\n{SYSTEM_PROMPT}\nCONTEXT DOCUMENTS:\n{format_context(context)}\n<|end|><|user|>\n{query}\n<|end|><|assistant|>\n"
+
+
+def run_prefill(args) -> dict:
+    """
+    Sends each eval question twice, once per layout, with num_predict=1 so only prompt
+    evaluation is measured, and compares Ollama's prompt_eval_count/prompt_eval_duration.
+    Needs an ingested corpus (for real contexts) and a running Ollama.
+    """
+    import requests
+    from core.retrieval import HybridRetriever
+    from core.generation import Generator, OLLAMA_MODEL_NAME, OLLAMA_HOST, _keep_alive, _model_options
+
+    with open("eval/questions.jsonl", 'r') as f:
+        questions = [json.loads(line)["question"] for line in f][:args.prefill_questions]
+    retriever, generator = HybridRetriever(), Generator()
+    generator.warm_up()
+    options = {**_model_options(), "num_predict": 1}
+    samples = {"legacy": [], "stable_prefix": []}
+
+    for query in questions:
+        context, _ = generator.context_assembler.assemble(query, retriever.retrieve(query, args.top_k))
+        requests_by_layout = {
+            "legacy": (f"{OLLAMA_HOST}/api/generate", {"prompt": legacy_prompt(query, context), "raw": True}),
+            "stable_prefix": (f"{OLLAMA_HOST}/api/chat", {"messages": generator.build_messages(query, context)}),
+        }
+        for layout, (url, body) in requests_by_layout.items():
+            payload = {"model": OLLAMA_MODEL_NAME, "stream": False, "keep_alive": _keep_alive(), "options": options, **body}
+            stats = requests.post(url, json=payload, timeout=600).json()
+            samples[layout].append((stats.get("prompt_eval_count", 0), stats.get("prompt_eval_duration", 0) / 1e6))
+            print(f"  {layout:<14} {samples[layout][-1][0]:>5} tokens evaluated in {samples[layout][-1][1]:.1f} ms")
+
+    result = {}
+    for layout, values in samples.items():
+        counts, durations = np.array([v[0] for v in values]), np.array([v[1] for v in values])
+        result[layout] = {"requests": len(values), "prompt_eval_tokens_mean": round(float(counts.mean()), 1),
+                          "prompt_eval_ms_mean": round(float(durations.mean()), 2),
+                          "prompt_eval_ms_p50": round(float(np.percentile(durations, 50)), 2)}
+    result["prefill_ms_saved_per_request"] = round(result["legacy"]["prompt_eval_ms_mean"] - result["stable_prefix"]["prompt_eval_ms_mean"], 2)
+    result["prefill_tokens_saved_per_request"] = round(result["legacy"]["prompt_eval_tokens_mean"] - result["stable_prefix"]["prompt_eval_tokens_mean"], 1)
+    print(f"Prefill saved per request: {result['prefill_ms_saved_per_request']} ms ({result['prefill_tokens_saved_per_request']} tokens)")
+    return result
+
+
+# --- Chunking: native splitter vs. LangChain ---
+def make_document(rng: np.random.Generator, vocab: list[str], size_kb: int) -> str:
+    """Synthetic Markdown-like text: headed sections of paragraphs of sentences."""
+    parts, length = [], 0
+    while length < size_kb * 1024:
+        if rng.random() < 0.1:
+            part = "#" * int(rng.integers(1, 4)) + " " + " ".join(sample_words(rng, vocab, 3)).title() + "\n\n"
+        else:
+            sentences = [" ".join(sample_words(rng, vocab, int(rng.integers(6, 25)))).capitalize() + "."
+                         for _ in range(int(rng.integers(2, 8)))]
+            part = " ".join(sentences) + "\n\n"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+
+def run_chunking(args) -> dict:
+    """Chunks the same synthetic files with each splitter (same size and overlap) and reports MB/s."""
+    from ingestion.chunking import TextChunker, chunking_strategy_A, chunking_strategy_B, CHUNK_SIZE, CHUNK_OVERLAP
+
+    rng = np.random.default_rng(args.seed)
+    vocab = make_vocabulary(rng)
+    documents = [make_document(rng, vocab, args.chunking_file_kb) for _ in range(args.chunking_files)]
+    megabytes = sum(len(d.encode("utf-8")) for d in documents) / 1e6
+
+    splitters = {
+        "native": lambda text: TextChunker(CHUNK_SIZE, CHUNK_OVERLAP).split(text),
+        "strategy_A": lambda text: chunking_strategy_A(text, "bench.md"),
+        "strategy_B": lambda text: chunking_strategy_B(text, "bench.md"),
+    }
+    try:
+        start = time.perf_counter()
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        import_seconds = time.perf_counter() - start
+        print(f"  importing langchain took {import_seconds:.2f}s (paid by every parser process)")
+        # As ingestion used it: one splitter constructed per file
+        splitters["langchain"] = lambda text: RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=len).split_text(text)
+    except ImportError:
+        import_seconds = None
+        print("langchain is not installed; only the native splitter is measured.")
+
+    result = {"files": len(documents), "megabytes": round(megabytes, 2), "langchain_import_seconds": import_seconds}
+    for name, split in splitters.items():
+        start = time.perf_counter()
+        chunks = [split(text) for text in documents]
+        elapsed = time.perf_counter() - start
+        lengths = [len(c if isinstance(c, str) else c["text"]) for file_chunks in chunks for c in file_chunks]
+        result[name] = {"seconds": round(elapsed, 3), "mb_per_second": round(megabytes / elapsed, 2),
+                        "chunks": len(lengths), "mean_chunk_chars": round(float(np.mean(lengths)), 1)}
+        print(f"  {name:<11} {result[name]['mb_per_second']:>8.2f} MB/s, {len(lengths)} chunks of {result[name]['mean_chunk_chars']:.0f} chars on average")
+    if "langchain" in result:
+        result["speedup"] = round(result["langchain"]["seconds"] / result["native"]["seconds"], 2)
+        print(f"Native splitter is {result['speedup']}x LangChain's")
+    return result
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(args):
+    results = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_revision": git_revision(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("size", "worker_output")},
+        "runs": [],
+    }
+    for size in args.sizes:
+        worker_output = os.path.join(os.path.abspath(args.workdir), f"result_{size}.json")
+        os.makedirs(args.workdir, exist_ok=True)
+        command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--size", str(size), "--worker-output", worker_output]
+        if subprocess.run(command).returncode != 0:
+            print(f"Benchmark for {size} chunks failed.")
+            results["runs"].append({"chunks": size, "error": "worker failed"})
+            continue
+        with open(worker_output, 'r') as f:
+            results["runs"].append(json.load(f))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+def parse_int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark retrieval and end-to-end QPS on synthetic corpora.")
+    parser.add_argument("--sizes", type=parse_int_list, default=[10000, 100000], help="Corpus sizes in chunks, e.g. 10000,100000,1000000.")
+    parser.add_argument("--concurrency", dest="concurrency_levels", type=parse_int_list, default=[1, 4, 16], help="Concurrency levels to sweep.")
+    parser.add_argument("--queries", type=int, default=200, help="Retrieval queries per concurrency level.")
+    parser.add_argument("--e2e-queries", type=int, default=50, help="/ask requests per concurrency level.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--embedding-dim", type=int, default=384, help="Must match the embedding model (384 for all-MiniLM-L6-v2).")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Token rate of the stub Ollama server.")
+    parser.add_argument("--answer-tokens", type=int, default=64, help="Tokens per stub answer.")
+    parser.add_argument("--skip-e2e", action="store_true", help="Only benchmark retrieval.")
+    parser.add_argument("--prefill", action="store_true", help="Compare prompt layouts on a running Ollama instead (uses the ingested corpus).")
+    parser.add_argument("--prefill-questions", type=int, default=20, help="Eval questions used by --prefill.")
+    parser.add_argument("--chunking", action="store_true", help="Compare chunking throughput with LangChain's splitter instead.")
+    parser.add_argument("--chunking-files", type=int, default=200, help="Synthetic files chunked by --chunking.")
+    parser.add_argument("--chunking-file-kb", type=int, default=50, help="Size of each synthetic file in KB.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default="bench_data", help="Where the synthetic indexes are built.")
+    parser.add_argument("--output", default="bench_results.json")
+    # Internal: run one corpus size and write its result to --worker-output
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prefill:
+        prefill_result = {"git_revision": git_revision(), "prefill": run_prefill(args)}
+        with open(args.output, 'w') as f:
+            json.dump(prefill_result, f, indent=2)
+        print(f"Results written to {args.output}")
+    elif args.chunking:
+        chunking_result = {"git_revision": git_revision(), "chunking": run_chunking(args)}
+        with open(args.output, 'w') as f:
+            json.dump(chunking_result, f, indent=2)
+        print(f"Results written to {args.output}")
+    elif args.size is not None:
+        size_result = run_size(args)
+        with open(args.worker_output, 'w') as f:
+            json.dump(size_result, f, indent=2)
+    else:
+        main(args)
@@ -0,0 +1,118 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Sequence
+
+
+class MicroBatcher:
+    """
+    Collects small inference requests from concurrent callers and runs them as one batch.
+
+    Callers hand over a list of items (e.g. one query to embed, or all rerank pairs of one
+    query) and block until their slice of the batched result is ready. A background thread
+    waits up to `max_wait_ms` after the first pending request, or until `max_batch_size`
+    items are queued, then calls `batch_fn` once on everything it collected.
+    """
+
+    def __init__(self, batch_fn: Callable[[list], Sequence], max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, name: str = "batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+
+        self._pending = []  # (items, future, enqueued_at)
+        self._pending_items = 0
+        self._cond = threading.Condition()
+
+        # --- Metrics ---
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._largest_batch = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._requests = 0
+
+        self._worker = threading.Thread(target=self._run, name=f"{name}-worker", daemon=True)
+        self._worker.start()
+
+    def submit(self, items: list) -> Future:
+        future = Future()
+        if not items:
+            future.set_result([])
+            return future
+        with self._cond:
+            self._pending.append((items, future, time.perf_counter()))
+            self._pending_items += len(items)
+            self._cond.notify()
+        return future
+
+    def run(self, items: list):
+        """Submits the items and waits for their results."""
+        return self.submit(items).result()
+
+    def _take_batch(self) -> list:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+
+            # Wait for more work until the window closes or the batch is full
+            deadline = self._pending[0][2] + self.max_wait
+            while self._pending_items < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            # Requests are never split, but a single oversized request still runs on its own
+            batch, size = [], 0
+            while self._pending:
+                items = self._pending[0][0]
+                if batch and size + len(items) > self.max_batch_size:
+                    break
+                batch.append(self._pending.pop(0))
+                size += len(items)
+            self._pending_items -= size
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            started = time.perf_counter()
+            flat_items = [item for items, _, _ in batch for item in items]
+            try:
+                results = self.batch_fn(flat_items)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for items, future, _ in batch:
+                future.set_result(results[offset:offset + len(items)])
+                offset += len(items)
+
+            self._record(batch, len(flat_items), started)
+
+    def _record(self, batch: list, size: int, started: float):
+        waits = [started - enqueued_at for _, _, enqueued_at in batch]
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._requests += len(batch)
+            self._largest_batch = max(self._largest_batch, size)
+            self._total_wait += sum(waits)
+            self._max_wait_seen = max(self._max_wait_seen, max(waits))
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "requests": self._requests,
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+                "max_batch_size": self._largest_batch,
+                "avg_queue_wait_ms": 1000 * self._total_wait / self._requests if self._requests else 0.0,
+                "max_queue_wait_ms": 1000 * self._max_wait_seen,
+            }
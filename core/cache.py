@@ -0,0 +1,338 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Written by ingest.py after every successful run; changes whenever the corpus does
+CORPUS_VERSION_PATH = "corpus_version.json"
+
+
+def normalize_query(query: str) -> str:
+    """Lowercases, drops punctuation and collapses whitespace so trivial variants share a key."""
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return " ".join(query.split())
+
+
+class CorpusVersionWatcher:
+    """Reads the corpus version stamp, re-reading the file only when its mtime changes."""
+
+    def __init__(self, path: str = CORPUS_VERSION_PATH):
+        self.path = path
+        self._mtime = None
+        self._version = ""
+
+    def current(self) -> str:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return ""
+        if mtime != self._mtime:
+            try:
+                with open(self.path, 'r') as f:
+                    self._version = json.load(f).get("version", "")
+                self._mtime = mtime
+            except (OSError, ValueError):
+                # The stamp is being rewritten; keep the last version we saw
+                pass
+        return self._version
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of final answers.
+
+    A lookup first tries the normalized query string, then falls back to the most similar
+    cached query embedding (cosine similarity above `similarity_threshold`). The cache is
+    bounded by entry count and by an approximate memory budget, and it empties itself when
+    the corpus version changes. `version_fn` returns the version answers are served from
+    (the API passes the retriever's index generation); by default it is the stamp written
+    by ingest.py.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_seconds: float = 24 * 3600, similarity_threshold: float = 0.95,
+                 persist_path: str | None = None, version_path: str = CORPUS_VERSION_PATH,
+                 version_fn=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.persist_path = persist_path
+        self.version_fn = version_fn or CorpusVersionWatcher(version_path).current
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # normalized query -> entry dict
+        self._bytes = 0
+        self._version = self.version_fn()
+        # Embedding matrix of all entries, rebuilt lazily after the entries change
+        self._matrix = None
+        self._matrix_keys = []
+
+        self.counters = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+        if persist_path:
+            self.load()
+
+    # --- Lookups ---
+    def get_exact(self, query: str) -> dict | None:
+        key = normalize_query(query)
+        with self._lock:
+            self._check_version()
+            entry = self._live_entry(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.counters["exact_hits"] += 1
+            return entry["response"]
+
+    def get_similar(self, embedding: np.ndarray) -> dict | None:
+        """Call after get_exact missed; counts a miss when nothing is similar enough."""
+        query_vec = self._unit(embedding)
+        with self._lock:
+            self._check_version()
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_keys = list(self._entries.keys())
+                    self._matrix = np.stack([self._entries[k]["embedding"] for k in self._matrix_keys])
+                similarities = self._matrix @ query_vec
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    key = self._matrix_keys[best]
+                    entry = self._live_entry(key)
+                    if entry is not None:
+                        self._entries.move_to_end(key)
+                        self.counters["semantic_hits"] += 1
+                        return entry["response"]
+            self.counters["misses"] += 1
+            return None
+
+    # --- Updates ---
+    def put(self, query: str, embedding: np.ndarray, response: dict, version: str | None = None):
+        """`version` is the corpus version the answer was computed from; stale answers are dropped."""
+        key = normalize_query(query)
+        entry = {
+            "embedding": self._unit(embedding),
+            "response": response,
+            "created_at": time.time(),
+        }
+        entry["size"] = self._entry_size(key, entry)
+        with self._lock:
+            self._check_version()
+            if version is not None and version != self._version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry["size"]
+            self._matrix = None
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._matrix = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["exact_hits"] + self.counters["semantic_hits"] + self.counters["misses"]
+            hits = self.counters["exact_hits"] + self.counters["semantic_hits"]
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "corpus_version": self._version,
+            }
+
+    # --- Persistence ---
+    def save(self):
+        if not self.persist_path:
+            return
+        with self._lock:
+            data = {
+                "corpus_version": self._version,
+                "entries": [
+                    {"key": key, "embedding": entry["embedding"].tolist(),
+                     "response": entry["response"], "created_at": entry["created_at"]}
+                    for key, entry in self._entries.items()
+                ],
+            }
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.persist_path)
+
+    def load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        with open(self.persist_path, 'r') as f:
+            data = json.load(f)
+        # Answers computed against an older corpus are useless
+        if data.get("corpus_version") != self._version:
+            return
+        with self._lock:
+            for item in data.get("entries", []):
+                entry = {
+                    "embedding": np.asarray(item["embedding"], dtype=np.float32),
+                    "response": item["response"],
+                    "created_at": item["created_at"],
+                }
+                entry["size"] = self._entry_size(item["key"], entry)
+                self._entries[item["key"]] = entry
+                self._bytes += entry["size"]
+        print(f"Loaded {len(self._entries)} cached answers from {self.persist_path}")
+
+    # --- Internals (callers hold the lock) ---
+    def _check_version(self):
+        version = self.version_fn()
+        if version != self._version:
+            if self._entries:
+                self.counters["invalidations"] += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._matrix = None
+            self._version = version
+
+    def _live_entry(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["created_at"] > self.ttl_seconds:
+            self._remove(key)
+            self.counters["expirations"] += 1
+            return None
+        return entry
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+        self._matrix = None
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    @staticmethod
+    def _entry_size(key: str, entry: dict) -> int:
+        return len(key) + entry["embedding"].nbytes + len(json.dumps(entry["response"]))
+
+
+class RetrievalCache:
+    """
+    LRU cache of query embeddings and reranked retrieval results, so a repeated query skips
+    the embedding, search and cross-encoder passes even when its answer is regenerated.
+    Embeddings are keyed by normalized query and results by (normalized query, top_k, filter
+    key); both are dropped when the corpus version changes. `version_fn` returns the version
+    results are computed from (the retriever passes its index generation); by default it is
+    the stamp written by ingest.py.
+    """
+
+    def __init__(self, max_entries: int = 2048, version_path: str = CORPUS_VERSION_PATH, version_fn=None):
+        self.max_entries = max_entries
+        self.version_fn = version_fn or CorpusVersionWatcher(version_path).current
+
+        self._lock = threading.Lock()
+        self._embeddings = OrderedDict()  # normalized query -> embedding
+        self._results = OrderedDict()  # (normalized query, top_k, filter key) -> result list
+        self._version = self.version_fn()
+
+        self.counters = {
+            "embedding_hits": 0,
+            "embedding_misses": 0,
+            "result_hits": 0,
+            "result_misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    # --- Query embeddings ---
+    def get_embedding(self, query: str) -> np.ndarray | None:
+        key = normalize_query(query)
+        with self._lock:
+            self._check_version()
+            embedding = self._embeddings.get(key)
+            if embedding is None:
+                self.counters["embedding_misses"] += 1
+                return None
+            self._embeddings.move_to_end(key)
+            self.counters["embedding_hits"] += 1
+            return embedding
+
+    def put_embedding(self, query: str, embedding: np.ndarray):
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)  # Shared between requests
+        with self._lock:
+            self._check_version()
+            self._store(self._embeddings, normalize_query(query), embedding)
+
+    # --- Reranked results ---
+    def get_results(self, query: str, top_k: int, filter_key: tuple = ()) -> list[dict] | None:
+        key = (normalize_query(query), top_k, filter_key)
+        with self._lock:
+            self._check_version()
+            results = self._results.get(key)
+            if results is None:
+                self.counters["result_misses"] += 1
+                return None
+            self._results.move_to_end(key)
+            self.counters["result_hits"] += 1
+        # Callers get their own dicts, so editing a result can't change the cached one
+        return [{**doc, "metadata": dict(doc["metadata"])} for doc in results]
+
+    def put_results(self, query: str, top_k: int, results: list[dict], filter_key: tuple = (),
+                    version: str | None = None):
+        """`version` is the index generation the results were computed on; stale results are dropped."""
+        results = [{**doc, "metadata": dict(doc["metadata"])} for doc in results]
+        with self._lock:
+            self._check_version()
+            if version is not None and version != self._version:
+                return
+            self._store(self._results, (normalize_query(query), top_k, filter_key), results)
+
+    def clear(self):
+        with self._lock:
+            self._embeddings.clear()
+            self._results.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["result_hits"] + self.counters["result_misses"]
+            return {
+                **self.counters,
+                "embeddings": len(self._embeddings),
+                "results": len(self._results),
+                "hit_rate": self.counters["result_hits"] / lookups if lookups else 0.0,
+                "corpus_version": self._version,
+            }
+
+    # --- Internals (callers hold the lock) ---
+    def _store(self, entries: OrderedDict, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _check_version(self):
+        version = self.version_fn()
+        if version != self._version:
+            if self._embeddings or self._results:
+                self.counters["invalidations"] += 1
+            self._embeddings.clear()
+            self._results.clear()
+            self._version = version
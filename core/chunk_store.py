@@ -0,0 +1,249 @@
+import os
+import json
+import numpy as np
+
+from core.storage import fresh_directory, swap_directory
+
+MISSING_CODE = -1
+# A numeric column widens along this order when a later value needs it; any string turns it into a str column
+NUMERIC_KINDS = ("bool", "int", "float")
+
+
+def _value_kind(value) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    return "str"
+
+
+class ChunkStore:
+    """
+    Compact, array-backed store of chunk texts and metadata addressed by integer position.
+
+    All texts live in one UTF-8 byte buffer with an offsets array, and metadata is kept in
+    columns: strings are dictionary-encoded (int32 codes into a list of categories) and
+    numbers/booleans are float64 arrays with NaN for missing values. A column's kind follows
+    its values: ints widen to floats, and a string in a numeric column turns it into a string
+    column, so no value is lost when files use one name for different types. Positions line up with
+    the BM25 index, so retrieval can pass plain integers around and only materialise texts
+    and metadata dicts for the candidates it actually returns.
+
+    Updates follow the same pattern as BM25Index (remove_ids/add, then commit), so applying
+    the same operations to both keeps their positions aligned.
+    """
+
+    def __init__(self, chunk_ids: list[str], text_buffer: np.ndarray, offsets: np.ndarray,
+                 columns: dict, column_specs: dict):
+        self.chunk_ids = chunk_ids
+        self.text_buffer = text_buffer
+        self.offsets = offsets
+        # name -> array; name -> {"kind": "str", "categories": [...]} or {"kind": "int"/"float"/"bool"}
+        self.columns = columns
+        self.column_specs = column_specs
+
+        self._alive = np.ones(len(chunk_ids), dtype=bool)
+        self._pending = []  # (chunk_id, encoded text, metadata)
+
+    @classmethod
+    def empty(cls) -> "ChunkStore":
+        return cls([], np.empty(0, dtype=np.uint8), np.zeros(1, dtype=np.int64), {}, {})
+
+    @classmethod
+    def build(cls, chunk_ids: list[str], texts: list[str], metadatas: list[dict]) -> "ChunkStore":
+        store = cls.empty()
+        store.add(chunk_ids, texts, metadatas)
+        store.commit()
+        return store
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    # --- Reads ---
+    def text(self, position: int) -> str:
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return self.text_buffer[start:end].tobytes().decode('utf-8')
+
+    def metadata(self, position: int) -> dict:
+        metadata = {}
+        for name, spec in self.column_specs.items():
+            value = self._decode_value(spec, self.columns[name][position])
+            if value is not None:
+                metadata[name] = value
+        return metadata
+
+    def get(self, position: int) -> tuple[str, dict]:
+        return self.text(position), self.metadata(position)
+
+    # --- Filters (whole-column, vectorized) ---
+    def values_mask(self, name: str, values) -> np.ndarray:
+        """Positions whose `name` is one of `values`; chunks without the field never match."""
+        spec = self.column_specs.get(name)
+        if spec is None:
+            return np.zeros(len(self), dtype=bool)
+        column = np.asarray(self.columns[name])
+        if spec["kind"] == "str":
+            codes = [i for i, category in enumerate(spec["categories"]) if category in set(values)]
+            return np.isin(column, codes)
+        return np.isin(column, [float(v) for v in values])
+
+    def present_mask(self, name: str) -> np.ndarray:
+        """Positions that have a value for `name`."""
+        spec = self.column_specs.get(name)
+        if spec is None:
+            return np.zeros(len(self), dtype=bool)
+        column = np.asarray(self.columns[name])
+        return column != MISSING_CODE if spec["kind"] == "str" else ~np.isnan(column)
+
+    def range_mask(self, name: str, low: float | None = None, high: float | None = None) -> np.ndarray:
+        """Positions whose numeric `name` lies within [low, high]; missing values never match."""
+        spec = self.column_specs.get(name)
+        if spec is None or spec["kind"] == "str":
+            return np.zeros(len(self), dtype=bool)
+        column = np.asarray(self.columns[name])
+        mask = ~np.isnan(column)
+        if low is not None:
+            mask &= column >= low
+        if high is not None:
+            mask &= column <= high
+        return mask
+
+    # --- Updates ---
+    def add(self, chunk_ids: list[str], texts: list[str], metadatas: list[dict]):
+        for chunk_id, text, metadata in zip(chunk_ids, texts, metadatas):
+            self._pending.append((chunk_id, text.encode('utf-8'), metadata))
+
+    def remove_ids(self, chunk_ids) -> int:
+        chunk_ids = set(chunk_ids)
+        mask = np.fromiter((c in chunk_ids for c in self.chunk_ids), dtype=bool, count=len(self.chunk_ids))
+        removed = int((mask & self._alive).sum())
+        self._alive &= ~mask
+        return removed
+
+    def update_metadata(self, chunk_ids: list[str], metadatas: list[dict]):
+        """Overwrites the metadata of committed chunks in place (texts are unchanged)."""
+        position_of = {chunk_id: i for i, chunk_id in enumerate(self.chunk_ids)}
+        unknown = [chunk_id for chunk_id in chunk_ids if chunk_id not in position_of]
+        if unknown:
+            raise KeyError(f"{len(unknown)} chunk(s) are not in the chunk store, e.g. {unknown[0]}")
+        for chunk_id, metadata in zip(chunk_ids, metadatas):
+            position = position_of[chunk_id]
+            for name, value in metadata.items():
+                self._fit_column(name, value)
+            for name, spec in self.column_specs.items():
+                column = self.columns[name]
+                if not column.flags.writeable:
+                    column = self.columns[name] = np.array(column)
+                column[position] = self._encode_column(spec, [metadata.get(name)])[0]
+
+    def commit(self):
+        alive = self._alive
+        if alive.all() and not self._pending:
+            return
+
+        # --- Texts: keep the bytes of surviving chunks, then append the new ones ---
+        lengths = np.diff(self.offsets)
+        kept_bytes = np.asarray(self.text_buffer)[np.repeat(alive, lengths)]
+        new_bytes = [encoded for _, encoded, _ in self._pending]
+        all_lengths = np.concatenate([lengths[alive], np.array([len(b) for b in new_bytes], dtype=np.int64)])
+        offsets = np.zeros(len(all_lengths) + 1, dtype=np.int64)
+        np.cumsum(all_lengths, out=offsets[1:])
+        text_buffer = np.concatenate([kept_bytes, np.frombuffer(b"".join(new_bytes), dtype=np.uint8)])
+
+        # --- Metadata columns ---
+        new_metadatas = [metadata for _, _, metadata in self._pending]
+        for metadata in new_metadatas:
+            for name, value in metadata.items():
+                self._fit_column(name, value)
+        columns = {}
+        for name, spec in self.column_specs.items():
+            kept = np.asarray(self.columns[name])[alive]
+            new_values = [metadata.get(name) for metadata in new_metadatas]
+            columns[name] = np.concatenate([kept, self._encode_column(spec, new_values)])
+
+        self.chunk_ids = [c for c, a in zip(self.chunk_ids, alive) if a] + [c for c, _, _ in self._pending]
+        self.text_buffer = text_buffer
+        self.offsets = offsets
+        self.columns = columns
+        self._alive = np.ones(len(self.chunk_ids), dtype=bool)
+        self._pending = []
+
+    def _add_column(self, name: str, sample):
+        kind = _value_kind(sample) or "str"
+        spec = {"kind": "str", "categories": []} if kind == "str" else {"kind": kind}
+        self.column_specs[name] = spec
+        n = len(self.chunk_ids)
+        self.columns[name] = np.full(n, MISSING_CODE, dtype=np.int32) if spec["kind"] == "str" else np.full(n, np.nan)
+
+    def _fit_column(self, name: str, value):
+        """Adds the column for `name`, or widens its kind so that `value` can be stored as is."""
+        kind = _value_kind(value)
+        spec = self.column_specs.get(name)
+        if kind is None:
+            return
+        if spec is None:
+            self._add_column(name, value)
+        elif spec["kind"] == "str" or spec["kind"] == kind:
+            return
+        elif kind == "str":
+            # Re-encode the numbers stored so far as their strings
+            values = [self._decode_value(spec, v) for v in np.asarray(self.columns[name])]
+            self.column_specs[name] = {"kind": "str", "categories": []}
+            self.columns[name] = self._encode_column(self.column_specs[name], values)
+        elif NUMERIC_KINDS.index(kind) > NUMERIC_KINDS.index(spec["kind"]):
+            spec["kind"] = kind  # All numeric kinds are stored as float64
+
+    @staticmethod
+    def _decode_value(spec: dict, value):
+        if spec["kind"] == "str":
+            return None if value == MISSING_CODE else spec["categories"][value]
+        if np.isnan(value):
+            return None
+        return {"int": int, "bool": bool}.get(spec["kind"], float)(value)
+
+    @staticmethod
+    def _encode_column(spec: dict, values: list) -> np.ndarray:
+        if spec["kind"] != "str":
+            return np.array([float(v) if isinstance(v, (int, float)) else np.nan for v in values], dtype=np.float64)
+        categories = spec["categories"]
+        lookup = {c: i for i, c in enumerate(categories)}
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            if value is None:
+                codes[i] = MISSING_CODE
+                continue
+            value = str(value)
+            if value not in lookup:
+                lookup[value] = len(categories)
+                categories.append(value)
+            codes[i] = lookup[value]
+        return codes
+
+    # --- Persistence ---
+    def save(self, path: str):
+        """Commits pending changes, writes a fresh directory and swaps it in place of the old one."""
+        self.commit()
+        tmp_path = fresh_directory(path)
+        np.save(os.path.join(tmp_path, "text_buffer.npy"), np.ascontiguousarray(self.text_buffer))
+        np.save(os.path.join(tmp_path, "offsets.npy"), np.ascontiguousarray(self.offsets))
+        column_files = {}
+        for i, name in enumerate(self.column_specs):
+            # Column names come from source data (e.g. CSV headers), so files are numbered
+            column_files[name] = f"column_{i}.npy"
+            np.save(os.path.join(tmp_path, column_files[name]), np.ascontiguousarray(self.columns[name]))
+        with open(os.path.join(tmp_path, "meta.json"), 'w') as f:
+            json.dump({"chunk_ids": self.chunk_ids, "column_specs": self.column_specs, "column_files": column_files}, f)
+        swap_directory(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "ChunkStore":
+        with open(os.path.join(path, "meta.json"), 'r') as f:
+            meta = json.load(f)
+        mmap_mode = "r" if mmap else None
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+        columns = {name: load(file_name) for name, file_name in meta["column_files"].items()}
+        return cls(meta["chunk_ids"], load("text_buffer.npy"), load("offsets.npy"), columns, meta["column_specs"])
@@ -0,0 +1,156 @@
+import os
+import re
+import math
+from dotenv import load_dotenv
+
+from core.lexical import tokenize
+
+load_dotenv()
+
+# --- Configuration ---
+# Tokens the context documents may use in the prompt (Phi-3 has 4k in total, shared with the answer)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+# Chunks whose reranker score is below this are left out (the best chunk is always kept)
+CONTEXT_MIN_SCORE = float(os.getenv("CONTEXT_MIN_SCORE", 0))
+# Keep only the sentences of each chunk that share terms with the query
+CONTEXT_SENTENCE_EXTRACTION = os.getenv("CONTEXT_SENTENCE_EXTRACTION", "true").lower() == "true"
+CONTEXT_MAX_SENTENCES = int(os.getenv("CONTEXT_MAX_SENTENCES", 6))  # Per chunk, 0 = no limit
+# Optional Hugging Face tokenizer (name or local path) for exact counts, e.g. microsoft/Phi-3-mini-4k-instruct
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER")
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+# Overlap shorter than this is treated as coincidence rather than the chunker's overlap,
+# and longer overlap is not searched for (the chunker overlaps by 200 characters)
+MIN_OVERLAP_CHARS = 30
+MAX_OVERLAP_CHARS = 400
+STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from had has have how i in is it its of on or "
+    "that the their them they this to was were what when where which who whom why will with".split()
+)
+
+
+class TokenCounter:
+    """
+    Counts prompt tokens with the configured tokenizer or, without one, estimates them:
+    one token per punctuation mark and per started 4 characters of each word, which is
+    close to (and slightly above) what SentencePiece tokenizers like Phi-3's produce.
+    """
+
+    def __init__(self, tokenizer_name: str | None = CONTEXT_TOKENIZER):
+        self.tokenizer = None
+        if tokenizer_name:
+            from transformers import AutoTokenizer
+            self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+
+    def count(self, text: str) -> int:
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return sum(math.ceil(len(piece) / 4) for piece in TOKEN_PIECES.findall(text))
+
+
+def format_document(doc: dict) -> str:
+    return f"Source: {doc['metadata'].get('source', 'unknown')} (Chunk {doc['metadata'].get('chunk_num', 'N/A')})\nContent: {doc['text']}"
+
+
+def format_context(docs: list[dict]) -> str:
+    return "\n\n---\n\n".join(format_document(doc) for doc in docs)
+
+
+def split_sentences(text: str) -> list[str]:
+    return [s.strip() for s in SENTENCE_SPLIT.split(text) if s.strip()]
+
+
+def remove_overlap(text: str, other: str) -> str:
+    """
+    Drops text that neighbouring chunks share because of the chunk overlap: the start of
+    `text` if it repeats the end of `other`, and the end of `text` if it repeats the start.
+    """
+    longest = min(len(text), len(other), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if other.endswith(text[:size]):
+            text = text[size:].lstrip()
+            break
+    longest = min(len(text), len(other), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if other.startswith(text[-size:]):
+            return text[:-size].rstrip()
+    return text
+
+
+class ContextAssembler:
+    """
+    Turns the retrieved chunks into the context that goes into the prompt, within a token
+    budget: low-scoring chunks are dropped, text repeated between overlapping chunks is
+    removed, each chunk is reduced to its most query-relevant sentences, and once the
+    budget is reached the remaining chunks are trimmed sentence by sentence or left out.
+    """
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET, min_score: float = CONTEXT_MIN_SCORE,
+                 sentence_extraction: bool = CONTEXT_SENTENCE_EXTRACTION, max_sentences: int = CONTEXT_MAX_SENTENCES,
+                 counter: TokenCounter | None = None):
+        self.token_budget = token_budget
+        self.min_score = min_score
+        self.sentence_extraction = sentence_extraction
+        self.max_sentences = max_sentences
+        self.counter = counter or TokenCounter()
+
+    def assemble(self, query: str, docs: list[dict]) -> tuple[list[dict], dict]:
+        """Returns the documents to put in the prompt (same keys, shorter text) and a token report."""
+        tokens_before = self.counter.count(format_context(docs)) if docs else 0
+        chunks_in = len(docs)
+        query_terms = {t for t in tokenize(query) if t not in STOPWORDS}
+        docs = sorted(docs, key=lambda d: d.get('score', 0.0), reverse=True)
+        docs = [d for i, d in enumerate(docs) if i == 0 or d.get('score', 0.0) >= self.min_score]
+
+        selected, seen_sentences, used = [], set(), 0
+        for doc in docs:
+            text = doc['text']
+            for kept in selected:
+                if kept['metadata'].get('source') == doc['metadata'].get('source'):
+                    text = remove_overlap(text, kept['original_text'])
+            sentences = [s for s in split_sentences(text) if s.lower() not in seen_sentences]
+            if not sentences:
+                continue
+            ranked = self._rank_sentences(query_terms, sentences)
+
+            header_tokens = self.counter.count(format_document({**doc, 'text': ''}))
+            remaining = self.token_budget - used - header_tokens
+            chosen, chosen_tokens = [], 0
+            for index in ranked:
+                sentence_tokens = self.counter.count(sentences[index]) + 1
+                if chosen_tokens + sentence_tokens > remaining:
+                    continue  # A shorter, less relevant sentence may still fit
+                chosen.append(index)
+                chosen_tokens += sentence_tokens
+            if not chosen:
+                continue
+
+            chosen.sort()  # Back to reading order
+            seen_sentences.update(sentences[i].lower() for i in chosen)
+            selected.append({**doc, 'text': " ".join(sentences[i] for i in chosen), 'original_text': doc['text']})
+            used += header_tokens + chosen_tokens
+
+        context = [{k: v for k, v in doc.items() if k != 'original_text'} for doc in selected]
+        tokens_after = self.counter.count(format_context(context)) if context else 0
+        report = {
+            "chunks_in": chunks_in,
+            "chunks_used": len(context),
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "tokens_saved": tokens_before - tokens_after,
+            "budget": self.token_budget
+        }
+        return context, report
+
+    def _rank_sentences(self, query_terms: set, sentences: list[str]) -> list[int]:
+        """Sentence indices, most relevant first; limited to max_sentences when extraction is on."""
+        if not self.sentence_extraction:
+            return list(range(len(sentences)))
+        overlap = [len(query_terms.intersection(tokenize(s))) for s in sentences]
+        if not any(overlap):
+            # Nothing matches the query literally (a purely semantic hit): keep the opening sentences
+            ranked = list(range(len(sentences)))
+        else:
+            ranked = sorted((i for i in range(len(sentences)) if overlap[i]), key=lambda i: (-overlap[i], i))
+        return ranked[:self.max_sentences] if self.max_sentences else ranked
@@ -0,0 +1,64 @@
+from datetime import datetime
+import numpy as np
+
+from core.chunk_store import ChunkStore
+
+
+def to_timestamp(value) -> float | None:
+    """Accepts a Unix timestamp or an ISO 8601 date/datetime string."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class MetadataFilter:
+    """
+    Restricts retrieval to chunks whose metadata match every given condition: one of the
+    sources (file names), one of the file types (extensions without the dot) and a
+    modification time window. The same filter becomes a Chroma `where` clause for dense
+    search and a boolean mask over chunk positions for lexical search.
+    """
+
+    def __init__(self, sources=(), file_types=(), modified_after=None, modified_before=None):
+        self.sources = tuple(sorted(set(sources)))
+        self.file_types = tuple(sorted({t.lower().lstrip(".") for t in file_types}))
+        self.modified_after = to_timestamp(modified_after)
+        self.modified_before = to_timestamp(modified_before)
+
+    @classmethod
+    def from_fields(cls, source=None, file_type=None, modified_after=None, modified_before=None) -> "MetadataFilter | None":
+        """Builds a filter from request fields (single values or lists); None when nothing is set."""
+        as_list = lambda value: [value] if isinstance(value, str) else list(value or [])
+        metadata_filter = cls(as_list(source), as_list(file_type), modified_after, modified_before)
+        return metadata_filter if metadata_filter.key() != ((), (), None, None) else None
+
+    def key(self) -> tuple:
+        return (self.sources, self.file_types, self.modified_after, self.modified_before)
+
+    def where(self) -> dict | None:
+        conditions = []
+        if self.sources:
+            conditions.append({"source": {"$in": list(self.sources)}})
+        if self.file_types:
+            conditions.append({"file_type": {"$in": list(self.file_types)}})
+        if self.modified_after is not None:
+            conditions.append({"modified_at": {"$gte": self.modified_after}})
+        if self.modified_before is not None:
+            conditions.append({"modified_at": {"$lte": self.modified_before}})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def mask(self, chunks: ChunkStore) -> np.ndarray:
+        """Boolean mask over chunk store (and BM25) positions, computed from the stored metadata columns."""
+        mask = np.ones(len(chunks), dtype=bool)
+        if self.sources:
+            mask &= chunks.values_mask("source", self.sources)
+        if self.file_types:
+            mask &= chunks.values_mask("file_type", self.file_types)
+        if self.modified_after is not None or self.modified_before is not None:
+            mask &= chunks.range_mask("modified_at", self.modified_after, self.modified_before)
+        return mask
@@ -0,0 +1,59 @@
+import numpy as np
+
+FUSION_METHODS = ("rrf", "weighted")
+
+
+def reciprocal_rank_fusion(rankings: list[tuple], k: int = 60) -> list[tuple[int, float]]:
+    """
+    RRF: each retriever contributes weight / (k + rank) for every document it returned.
+    `rankings` is a list of (positions, scores, weight) with positions best first; scores are ignored.
+    The fused scores are divided by their maximum possible value, so they fall in [0, 1].
+    """
+    fused = {}
+    for positions, _, weight in rankings:
+        for rank, position in enumerate(positions, start=1):
+            fused[int(position)] = fused.get(int(position), 0.0) + weight / (k + rank)
+    best_possible = sum(weight for _, _, weight in rankings) / (k + 1)
+    return _sorted(fused, best_possible)
+
+
+def weighted_score_fusion(rankings: list[tuple]) -> list[tuple[int, float]]:
+    """
+    Min-max normalises each retriever's scores to [0, 1] and sums them with the given weights
+    (a document missing from a list contributes 0 for that retriever). Output is in [0, 1].
+    """
+    fused = {}
+    for positions, scores, weight in rankings:
+        if len(positions) == 0:
+            continue
+        scores = np.asarray(scores, dtype=np.float64)
+        spread = scores.max() - scores.min()
+        normalized = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+        for position, score in zip(positions, normalized):
+            fused[int(position)] = fused.get(int(position), 0.0) + weight * float(score)
+    return _sorted(fused, sum(weight for _, _, weight in rankings))
+
+
+def fuse(method: str, rankings: list[tuple], rrf_k: int = 60) -> list[tuple[int, float]]:
+    """Returns (position, fused score) pairs, best first."""
+    if method == "rrf":
+        return reciprocal_rank_fusion(rankings, rrf_k)
+    if method == "weighted":
+        return weighted_score_fusion(rankings)
+    raise ValueError(f"Unknown fusion method '{method}'. Expected one of {FUSION_METHODS}.")
+
+
+def is_decisive(fused: list[tuple[int, float]], top_k: int, margin: float) -> bool:
+    """
+    True when the fused ranking already separates its top_k results from the rest by at
+    least `margin` (in normalised fused-score units), i.e. reranking deeper candidates
+    could not plausibly change which documents are returned.
+    """
+    if margin <= 0 or len(fused) <= top_k:
+        return False
+    return fused[top_k - 1][1] - fused[top_k][1] >= margin
+
+
+def _sorted(fused: dict, best_possible: float) -> list[tuple[int, float]]:
+    scale = best_possible if best_possible > 0 else 1.0
+    return sorted(((position, score / scale) for position, score in fused.items()), key=lambda x: x[1], reverse=True)
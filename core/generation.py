@@ -1,59 +1,254 @@
 import os
+import time
+import asyncio
 import requests
+import httpx
 import json
+from typing import AsyncIterator, Iterator
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+from core.metrics import metrics, record_span, set_attribute, span
+from core.context import ContextAssembler, format_context
+
 # --- Load Configuration ---
 load_dotenv()
 # We can still point to the model folder for consistency, but the key is the model name for Ollama
 MODEL_PATH = os.getenv("MODEL_PATH", "models/phi-3-safetensors")
 OLLAMA_MODEL_NAME = "phi3" # The name of the model we pulled with "ollama run"
 
-# Ollama's local API endpoint
+# Ollama's local API endpoint. Answers use /api/chat on the same server.
 OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://127.0.0.1:11434/api/generate")
+OLLAMA_HOST = OLLAMA_API_URL.split("/api/")[0]
+OLLAMA_CHAT_URL = f"{OLLAMA_HOST}/api/chat"
+OLLAMA_TAGS_URL = f"{OLLAMA_HOST}/api/tags"
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", 300))
+# Size of the keep-alive connection pool shared by all requests to Ollama
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", 16))
+# How long Ollama keeps the model in memory after a request: a duration such as "30m",
+# or a negative number to keep it loaded for good (Ollama's own default is 5m)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "-1")
+# Model options sent with every request. They must never vary between requests: a different
+# num_ctx makes Ollama reload the model and drop its cached prompt prefix.
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", 4096))  # Phi-3 mini's full context; Ollama defaults to 2048
+OLLAMA_NUM_THREAD = int(os.getenv("OLLAMA_NUM_THREAD", 0))  # 0 = let Ollama decide
+
+# Statistics Ollama returns with the final response object (durations are in nanoseconds)
+OLLAMA_STAT_KEYS = ("total_duration", "load_duration", "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration")
+
+# Identical for every request, so Ollama can reuse the evaluated prefix instead of
+# prefilling the instructions again; everything request-specific goes in the user turn.
+SYSTEM_PROMPT = """You are an expert AI assistant. Answer the user's question based ONLY on the provided context documents.
+- For each claim you make, you MUST cite the source document like this: [Source: filename.pdf (Chunk 5)].
+- If the context does not contain the answer, you MUST state that you cannot answer."""
+
+CONNECTION_ERROR_MESSAGE = "Error: Could not connect to the Ollama server. Is it running?"
 
 class Generator:
     def __init__(self):
         # The __init__ is now incredibly simple! Ollama handles all the heavy lifting.
         print("Initializing generator (using Ollama)...")
+        # One session for all sync calls so TCP connections to Ollama are kept alive and reused
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_MAX_CONNECTIONS)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # The async client is created on first use so it binds to the running event loop
+        self._async_client = None
+        # Fits the retrieved chunks into the prompt's token budget
+        self.context_assembler = ContextAssembler()
+
         # We can add a quick check to see if the model is available in Ollama
         try:
-            response = requests.post("http://127.0.0.1:11434/api/tags", timeout=5)
+            response = self.session.get(OLLAMA_TAGS_URL, timeout=5)
             if OLLAMA_MODEL_NAME not in [m['name'].split(':')[0] for m in response.json().get('models', [])]:
                  print(f"WARNING: Model '{OLLAMA_MODEL_NAME}' not found in Ollama. Please run 'ollama run {OLLAMA_MODEL_NAME}'")
         except requests.exceptions.RequestException:
             print("WARNING: Could not connect to Ollama server. Please ensure it is running.")
         print("Generator initialized.")
 
-    def generate_response(self, query: str, context: list[dict]) -> str:
-        context_str = "\n\n---\n\n".join([f"Source: {doc['metadata'].get('source', 'unknown')} (Chunk {doc['metadata'].get('chunk_num', 'N/A')})\nContent: {doc['text']}" for doc in context])
+    def build_messages(self, query: str, context: list[dict]) -> list[dict]:
+        # Ollama applies Phi-3's chat template, so the system turn is the stable prompt prefix
+        context_str = format_context(context)
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"CONTEXT DOCUMENTS:\n{context_str}\n\nQUESTION: {query}"}
+        ]
 
-        # We use the same prompt format that Phi-3 expects
-        prompt = f"""<|system|>
-You are an expert AI assistant. Answer the user's question based ONLY on the provided context documents.
-- For each claim you make, you MUST cite the source document like this: [Source: filename.pdf (Chunk 5)].
-- If the context does not contain the answer, you MUST state that you cannot answer.
-CONTEXT DOCUMENTS:
-{context_str}
-<|end|><|user|>
-{query}
-<|end|><|assistant|>
-"""
-        
+    def build_payload(self, query: str, context: list[dict], stream: bool) -> dict:
         # Create the payload to send to the Ollama server
+        with span("context_assembly"):
+            context, report = self.context_assembler.assemble(query, context)
+        metrics.increment("rag_context_tokens_saved_total", report["tokens_saved"])
+        set_attribute("context", report)
+        with span("prompt_build"):
+            messages = self.build_messages(query, context)
+        return {
+            "model": OLLAMA_MODEL_NAME,
+            "messages": messages,
+            "stream": stream,
+            "keep_alive": _keep_alive(),
+            "options": _model_options()
+        }
+
+    async def abuild_payload(self, query: str, context: list[dict], stream: bool) -> dict:
+        # Context assembly is CPU work (a tokenizer pass with CONTEXT_TOKENIZER set), so it
+        # runs on a worker thread instead of blocking the event loop for every other request
+        return await asyncio.to_thread(self.build_payload, query, context, stream)
+
+    def warm_up(self) -> bool:
+        """
+        Loads the model into Ollama's memory ahead of the first question, with the same
+        options as real requests, and evaluates the system prompt once so the first
+        question already finds it cached. keep_alive keeps the model resident afterwards.
+        """
         payload = {
             "model": OLLAMA_MODEL_NAME,
-            "prompt": prompt,
-            "stream": False # We want the full response at once
+            "messages": [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": "Ready?"}],
+            "stream": False,
+            "keep_alive": _keep_alive(),
+            "options": {**_model_options(), "num_predict": 1}
         }
+        try:
+            response = self.session.post(OLLAMA_CHAT_URL, json=payload, timeout=OLLAMA_TIMEOUT)
+            response.raise_for_status()
+            return True
+        except requests.exceptions.RequestException as e:
+            print(f"WARNING: Could not warm up '{OLLAMA_MODEL_NAME}' in Ollama: {e}")
+            return False
+
+    def generate_response(self, query: str, context: list[dict]) -> str:
+        payload = self.build_payload(query, context, stream=False) # We want the full response at once
 
         try:
             # Make the web request to the local Ollama server
-            response = requests.post(OLLAMA_API_URL, json=payload, timeout=300)
+            started = time.perf_counter()
+            response = self.session.post(OLLAMA_CHAT_URL, json=payload, timeout=OLLAMA_TIMEOUT)
             response.raise_for_status()
+            body = response.json()
+            self._record_ollama_stats(body, started)
             
-            # The actual answer text is inside the 'response' key of the JSON
-            return response.json().get("response", "Error: Could not parse Ollama response.")
+            # The actual answer text is inside the 'message' object of the JSON
+            return body.get("message", {}).get("content", "Error: Could not parse Ollama response.")
         except requests.exceptions.RequestException as e:
             print(f"Error communicating with Ollama: {e}")
-            return "Error: Could not connect to the Ollama server. Is it running?"
\ No newline at end of file
+            return CONNECTION_ERROR_MESSAGE
+
+    def stream_response(self, query: str, context: list[dict]) -> Iterator[str]:
+        """
+        Yields the answer token by token as Ollama produces it.
+        Ollama streams newline-delimited JSON objects, each carrying a piece of the answer
+        in its 'message' object, until an object with "done": true arrives.
+        """
+        payload = self.build_payload(query, context, stream=True)
+
+        try:
+            started = time.perf_counter()
+            with self.session.post(OLLAMA_CHAT_URL, json=payload, stream=True, timeout=OLLAMA_TIMEOUT) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    token, done = self._parse_stream_line(line, started)
+                    if token:
+                        yield token
+                    if done:
+                        return
+        except requests.exceptions.RequestException as e:
+            print(f"Error communicating with Ollama: {e}")
+            yield CONNECTION_ERROR_MESSAGE
+
+    # --- Async API (used by the FastAPI handlers) ---
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=OLLAMA_MAX_CONNECTIONS,
+                    max_keepalive_connections=OLLAMA_MAX_CONNECTIONS
+                )
+            )
+        return self._async_client
+
+    async def agenerate_response(self, query: str, context: list[dict]) -> str:
+        payload = await self.abuild_payload(query, context, stream=False)
+
+        try:
+            started = time.perf_counter()
+            response = await self._get_async_client().post(OLLAMA_CHAT_URL, json=payload)
+            response.raise_for_status()
+            body = response.json()
+            self._record_ollama_stats(body, started)
+            return body.get("message", {}).get("content", "Error: Could not parse Ollama response.")
+        except httpx.HTTPError as e:
+            print(f"Error communicating with Ollama: {e}")
+            return CONNECTION_ERROR_MESSAGE
+
+    async def astream_response(self, query: str, context: list[dict]) -> AsyncIterator[str]:
+        """Async counterpart of stream_response; yields tokens without blocking the event loop."""
+        payload = await self.abuild_payload(query, context, stream=True)
+
+        try:
+            started = time.perf_counter()
+            async with self._get_async_client().stream("POST", OLLAMA_CHAT_URL, json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    token, done = self._parse_stream_line(line, started)
+                    if token:
+                        yield token
+                    if done:
+                        return
+        except httpx.HTTPError as e:
+            print(f"Error communicating with Ollama: {e}")
+            yield CONNECTION_ERROR_MESSAGE
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _parse_stream_line(self, line, started: float) -> tuple[str, bool]:
+        chunk = json.loads(line)
+        if chunk.get("error"):
+            print(f"Error from Ollama: {chunk['error']}")
+            return "Error: Ollama reported a problem while generating the answer.", True
+        if chunk.get("done"):
+            self._record_ollama_stats(chunk, started)
+        return chunk.get("message", {}).get("content", ""), chunk.get("done", False)
+
+    def _record_ollama_stats(self, body: dict, started: float):
+        """
+        Splits the generation time using Ollama's own timings: model load, prompt evaluation
+        (prefill) and token generation (decode). Whatever the client waited beyond Ollama's
+        total_duration is reported as queueing (time spent waiting for a busy server).
+        """
+        if "total_duration" not in body:
+            return
+        seconds = lambda key: body.get(key, 0) / 1e9
+        record_span("ollama_queue", max(time.perf_counter() - started - seconds("total_duration"), 0.0))
+        record_span("ollama_load", seconds("load_duration"))
+        record_span("ollama_prefill", seconds("prompt_eval_duration"))
+        record_span("ollama_decode", seconds("eval_duration"))
+        metrics.increment("rag_ollama_prompt_tokens_total", body.get("prompt_eval_count", 0))
+        metrics.increment("rag_ollama_generated_tokens_total", body.get("eval_count", 0))
+        stats = {key: body.get(key) for key in OLLAMA_STAT_KEYS}
+        if body.get("eval_duration"):
+            stats["tokens_per_second"] = round(body.get("eval_count", 0) / seconds("eval_duration"), 2)
+        set_attribute("ollama", stats)
+
+
+def _keep_alive():
+    # Ollama takes durations as strings but "keep forever" only as a number
+    try:
+        return float(OLLAMA_KEEP_ALIVE)
+    except ValueError:
+        return OLLAMA_KEEP_ALIVE
+
+
+def _model_options() -> dict:
+    options = {"num_ctx": OLLAMA_NUM_CTX}
+    if OLLAMA_NUM_THREAD:
+        options["num_thread"] = OLLAMA_NUM_THREAD
+    return options
@@ -0,0 +1,225 @@
+import os
+import sys
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+# "torch" (fp32, default), "torch-int8" (PyTorch dynamic quantization) or "onnx" (exported int8 ONNX Runtime models)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+# Intra-op threads per model (0 = library default)
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", 0))
+# Where `python -m core.inference export` writes the quantized ONNX models
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "models/onnx")
+# Compare the selected backend against fp32 PyTorch at startup and print the deltas
+INFERENCE_PARITY_CHECK = os.getenv("INFERENCE_PARITY_CHECK", "false").lower() == "true"
+
+EMBEDDER_MAX_LENGTH = 256  # all-MiniLM-L6-v2's max_seq_length
+RERANKER_MAX_LENGTH = 512
+
+WARMUP_TEXTS = [
+    "What was the Dartmouth workshop?",
+    "The term artificial intelligence was coined by John McCarthy in 1955.",
+]
+PARITY_QUERIES = [
+    "What was the Dartmouth workshop?",
+    "Who proposed the Turing Test?",
+    "When did Deep Blue defeat Kasparov?",
+]
+PARITY_PASSAGES = [
+    "The Dartmouth Summer Research Project on Artificial Intelligence was a 1956 summer workshop widely considered to be the founding event of AI as a field.",
+    "Alan Turing proposed an imitation game in 1950 as a test of a machine's ability to exhibit intelligent behaviour.",
+    "IBM's Deep Blue chess computer defeated world champion Garry Kasparov in a six-game match in 1997.",
+    "Expert systems encode the knowledge of human specialists as if-then rules.",
+]
+
+
+# --- PyTorch backends ---
+def _set_torch_threads():
+    if INFERENCE_THREADS:
+        import torch
+        torch.set_num_threads(INFERENCE_THREADS)
+
+
+class TorchEmbedder:
+    def __init__(self, model_name: str, quantize: bool = False):
+        from sentence_transformers import SentenceTransformer
+        _set_torch_threads()
+        self.model = SentenceTransformer(model_name, device="cpu")
+        if quantize:
+            import torch
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        return self.model.encode(texts)
+
+
+class TorchReranker:
+    def __init__(self, model_name: str, quantize: bool = False):
+        from sentence_transformers import CrossEncoder
+        _set_torch_threads()
+        self.model = CrossEncoder(model_name, device="cpu")
+        if quantize:
+            import torch
+            self.model.model = torch.quantization.quantize_dynamic(self.model.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def predict(self, pairs: list[list[str]]) -> np.ndarray:
+        return self.model.predict(pairs)
+
+
+# --- ONNX Runtime backends ---
+def _onnx_session(model_dir: str):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    if INFERENCE_THREADS:
+        options.intra_op_num_threads = INFERENCE_THREADS
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    path = os.path.join(model_dir, "model_quantized.onnx")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found. Run 'python -m core.inference export' first.")
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+def _session_inputs(session, encoded) -> dict:
+    return {i.name: encoded[i.name].astype(np.int64) for i in session.get_inputs()}
+
+
+class OnnxEmbedder:
+    """Mean pooling + L2 normalisation, matching the sentence-transformers pipeline of all-MiniLM-L6-v2."""
+
+    def __init__(self, model_dir: str):
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = _onnx_session(model_dir)
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=EMBEDDER_MAX_LENGTH, return_tensors="np")
+        token_embeddings = self.session.run(None, _session_inputs(self.session, encoded))[0]
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+
+class OnnxReranker:
+    """Returns the raw logits, like CrossEncoder.predict for ms-marco models; the retriever applies the sigmoid."""
+
+    def __init__(self, model_dir: str):
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = _onnx_session(model_dir)
+
+    def predict(self, pairs: list[list[str]]) -> np.ndarray:
+        encoded = self.tokenizer([p[0] for p in pairs], [p[1] for p in pairs], padding=True,
+                                 truncation=True, max_length=RERANKER_MAX_LENGTH, return_tensors="np")
+        return self.session.run(None, _session_inputs(self.session, encoded))[0][:, 0].astype(np.float32)
+
+
+# --- Factories ---
+def load_embedder(model_name: str, backend: str = INFERENCE_BACKEND):
+    if backend == "onnx":
+        model = OnnxEmbedder(os.path.join(ONNX_MODEL_DIR, "embedder"))
+    elif backend in ("torch", "torch-int8"):
+        model = TorchEmbedder(model_name, quantize=backend == "torch-int8")
+    else:
+        raise ValueError(f"Unknown INFERENCE_BACKEND '{backend}'")
+    _warm_up(lambda: model.encode(WARMUP_TEXTS), f"embedder ({backend})")
+    return model
+
+
+def load_reranker(model_name: str, backend: str = INFERENCE_BACKEND):
+    if backend == "onnx":
+        model = OnnxReranker(os.path.join(ONNX_MODEL_DIR, "reranker"))
+    elif backend in ("torch", "torch-int8"):
+        model = TorchReranker(model_name, quantize=backend == "torch-int8")
+    else:
+        raise ValueError(f"Unknown INFERENCE_BACKEND '{backend}'")
+    _warm_up(lambda: model.predict([[WARMUP_TEXTS[0], t] for t in WARMUP_TEXTS]), f"reranker ({backend})")
+    return model
+
+
+def _warm_up(run, label: str):
+    """The first forward pass pays for lazy allocations; do it now instead of on the first query."""
+    start = time.perf_counter()
+    run()
+    print(f"Warmed up {label} in {time.perf_counter() - start:.2f}s")
+
+
+# --- Parity check ---
+def check_parity(embedder, reranker, reference_embedder, reference_reranker) -> dict:
+    """
+    Compares a backend with fp32 PyTorch on a few fixed samples: cosine similarity of the
+    embeddings, absolute differences of the reranker scores and whether the reranker still
+    ranks the passages in the same order for every query.
+    """
+    emb = embedder.encode(PARITY_QUERIES + PARITY_PASSAGES)
+    ref_emb = reference_embedder.encode(PARITY_QUERIES + PARITY_PASSAGES)
+    cosine = (emb * ref_emb).sum(axis=1) / (np.linalg.norm(emb, axis=1) * np.linalg.norm(ref_emb, axis=1))
+
+    pairs = [[q, p] for q in PARITY_QUERIES for p in PARITY_PASSAGES]
+    scores = np.asarray(reranker.predict(pairs)).reshape(len(PARITY_QUERIES), -1)
+    ref_scores = np.asarray(reference_reranker.predict(pairs)).reshape(len(PARITY_QUERIES), -1)
+    same_order = [bool(np.array_equal(np.argsort(-s), np.argsort(-r))) for s, r in zip(scores, ref_scores)]
+
+    return {
+        "embedding_cosine_min": float(cosine.min()),
+        "embedding_cosine_mean": float(cosine.mean()),
+        "rerank_abs_diff_max": float(np.abs(scores - ref_scores).max()),
+        "rerank_abs_diff_mean": float(np.abs(scores - ref_scores).mean()),
+        "rerank_same_order": f"{sum(same_order)}/{len(same_order)}",
+    }
+
+
+def print_parity(embedder, reranker, embedding_model: str, reranker_model: str):
+    reference_embedder = TorchEmbedder(embedding_model)
+    reference_reranker = TorchReranker(reranker_model)
+    report = check_parity(embedder, reranker, reference_embedder, reference_reranker)
+    print(f"Parity of '{INFERENCE_BACKEND}' backend against fp32 PyTorch:")
+    for name, value in report.items():
+        print(f"  {name}: {value}")
+    return report
+
+
+# --- Export ---
+def export_onnx(embedding_model: str, reranker_model: str, output_dir: str = ONNX_MODEL_DIR):
+    """Exports both models to ONNX and writes dynamically int8-quantized copies next to them."""
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from sentence_transformers import SentenceTransformer, CrossEncoder
+
+    embedder = SentenceTransformer(embedding_model, device="cpu")
+    reranker = CrossEncoder(reranker_model, device="cpu")
+    targets = [
+        ("embedder", embedder[0].auto_model, embedder.tokenizer, ["A sample sentence."], {}),
+        ("reranker", reranker.model, reranker.tokenizer, ["A sample query."], {"text_pair": ["A sample passage."]}),
+    ]
+    for name, model, tokenizer, texts, extra in targets:
+        model_dir = os.path.join(output_dir, name)
+        os.makedirs(model_dir, exist_ok=True)
+        model.eval()
+        sample = tokenizer(texts, return_tensors="pt", **extra)
+        input_names = list(sample.keys())
+        dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names}
+        dynamic_axes["output"] = {0: "batch"}
+        fp32_path = os.path.join(model_dir, "model.onnx")
+        with torch.no_grad():
+            torch.onnx.export(
+                model, tuple(sample[n] for n in input_names), fp32_path,
+                input_names=input_names, output_names=["output"],
+                dynamic_axes=dynamic_axes, opset_version=14
+            )
+        quantize_dynamic(fp32_path, os.path.join(model_dir, "model_quantized.onnx"), weight_type=QuantType.QInt8)
+        tokenizer.save_pretrained(model_dir)
+        print(f"Exported {name} to {model_dir}")
+
+
+if __name__ == "__main__":
+    from core.retrieval import EMBEDDING_MODEL, RERANKER_MODEL
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "export":
+        export_onnx(EMBEDDING_MODEL, RERANKER_MODEL)
+    elif command == "parity":
+        print_parity(load_embedder(EMBEDDING_MODEL), load_reranker(RERANKER_MODEL), EMBEDDING_MODEL, RERANKER_MODEL)
+    else:
+        print("Usage: python -m core.inference [export|parity]")
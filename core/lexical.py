@@ -0,0 +1,257 @@
+import os
+import re
+import json
+from collections import Counter
+import numpy as np
+
+from core.storage import fresh_directory, swap_directory
+
+# BM25 parameters (same defaults as rank_bm25's BM25Okapi)
+K1 = 1.5
+B = 0.75
+EPSILON = 0.25
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word tokens; used for both documents and queries so they always match."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    BM25 over an inverted index stored in CSR form.
+
+    For term id t, its postings are post_docs[term_indptr[t]:term_indptr[t + 1]] (document
+    positions) and the matching post_tfs (term frequencies). A query only touches the
+    postings of its own terms, and the top-k is taken with argpartition, so query cost
+    scales with the number of matching postings instead of the corpus size.
+
+    The index can be updated in place: remove_source/remove_ids tombstone documents and
+    add_documents tokenizes only the new texts. commit() then merges everything into fresh
+    CSR arrays with a linear NumPy pass, so nothing else is re-read or re-tokenized.
+
+    On disk the index is a directory of .npy arrays (memory-mapped when loaded) plus a small
+    JSON file with the vocabulary, the chunk id of every document position and the source
+    file names.
+    """
+
+    ARRAYS = ("term_indptr", "post_docs", "post_tfs", "doc_lens", "doc_source")
+
+    def __init__(self, vocab: dict, chunk_ids: list[str], sources: list[str],
+                 term_indptr: np.ndarray, post_docs: np.ndarray, post_tfs: np.ndarray,
+                 doc_lens: np.ndarray, doc_source: np.ndarray, k1: float = K1, b: float = B):
+        self.vocab = vocab
+        self.chunk_ids = chunk_ids
+        self.sources = sources
+        self.term_indptr = term_indptr
+        self.post_docs = post_docs
+        self.post_tfs = post_tfs
+        self.doc_lens = doc_lens
+        self.doc_source = doc_source
+        self.k1 = k1
+        self.b = b
+
+        # Pending changes, applied by commit()
+        self._alive = np.ones(len(chunk_ids), dtype=bool)
+        self._pending = []  # (chunk_id, source code, term ids, term counts, length)
+        self._dirty = False
+
+        self._update_stats()
+
+    @classmethod
+    def empty(cls, k1: float = K1, b: float = B) -> "BM25Index":
+        return cls({}, [], [], np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32),
+                   np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int32),
+                   np.empty(0, dtype=np.int32), k1, b)
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def _update_stats(self):
+        """Recomputes document frequencies, IDF and length normalisation from the arrays."""
+        df = np.diff(self.term_indptr)
+        self.idf = compute_idf(df, len(self.doc_lens))
+        avgdl = float(self.doc_lens.mean()) if len(self.doc_lens) else 0.0
+        # Length normalisation is per document, so it is computed once instead of per posting
+        if avgdl:
+            self.doc_norm = (self.k1 * (1 - self.b + self.b * self.doc_lens / avgdl)).astype(np.float32)
+        else:
+            self.doc_norm = np.full(len(self.doc_lens), self.k1, dtype=np.float32)
+
+    # --- Building and incremental updates ---
+    @classmethod
+    def build(cls, chunk_ids: list[str], texts: list[str], sources: list[str],
+              k1: float = K1, b: float = B) -> "BM25Index":
+        index = cls.empty(k1, b)
+        index.add_documents(chunk_ids, texts, sources)
+        index.commit()
+        return index
+
+    def add_documents(self, chunk_ids: list[str], texts: list[str], sources: list[str]):
+        for chunk_id, text, source in zip(chunk_ids, texts, sources):
+            tokens = tokenize(text)
+            counts = Counter(tokens)
+            term_ids = np.fromiter((self.vocab.setdefault(t, len(self.vocab)) for t in counts), dtype=np.int64, count=len(counts))
+            tfs = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            self._pending.append((chunk_id, self._source_code(source), term_ids, tfs, len(tokens)))
+        self._dirty = True
+
+    def remove_source(self, source: str) -> int:
+        """Tombstones every committed document of a source file; returns how many were removed."""
+        if source not in self.sources:
+            return 0
+        return self._remove_mask(np.asarray(self.doc_source) == self.sources.index(source))
+
+    def remove_ids(self, chunk_ids) -> int:
+        chunk_ids = set(chunk_ids)
+        return self._remove_mask(np.fromiter((c in chunk_ids for c in self.chunk_ids), dtype=bool, count=len(self.chunk_ids)))
+
+    def _remove_mask(self, mask: np.ndarray) -> int:
+        removed = int((mask & self._alive).sum())
+        self._alive &= ~mask
+        self._dirty = self._dirty or removed > 0
+        return removed
+
+    def _source_code(self, source: str) -> int:
+        if source not in self.sources:
+            self.sources.append(source)
+        return self.sources.index(source)
+
+    def commit(self):
+        """Applies pending removals and additions, producing new CSR arrays."""
+        if not self._dirty:
+            return
+        alive = self._alive
+        n_terms = len(self.vocab)
+
+        # --- 1. Drop postings of removed documents and renumber the survivors ---
+        remap = np.full(len(alive), -1, dtype=np.int64)
+        remap[alive] = np.arange(int(alive.sum()))
+        old_counts_per_term = np.diff(self.term_indptr)
+        posting_terms = np.repeat(np.arange(len(old_counts_per_term)), old_counts_per_term)
+        keep = alive[self.post_docs]
+        kept_terms = posting_terms[keep]
+        kept_docs = remap[self.post_docs[keep]]
+        kept_tfs = np.asarray(self.post_tfs)[keep]
+
+        chunk_ids = [c for c, a in zip(self.chunk_ids, alive) if a]
+        doc_lens = np.asarray(self.doc_lens)[alive]
+        doc_source = np.asarray(self.doc_source)[alive]
+
+        # --- 2. Postings of the newly added documents ---
+        first_new = len(chunk_ids)
+        if self._pending:
+            new_counts_per_doc = np.array([len(p[2]) for p in self._pending], dtype=np.int64)
+            new_terms = np.concatenate([p[2] for p in self._pending])
+            new_tfs = np.concatenate([p[3] for p in self._pending])
+            new_docs = np.repeat(np.arange(first_new, first_new + len(self._pending)), new_counts_per_doc)
+            chunk_ids += [p[0] for p in self._pending]
+            doc_lens = np.concatenate([doc_lens, np.array([p[4] for p in self._pending], dtype=np.int32)])
+            doc_source = np.concatenate([doc_source, np.array([p[1] for p in self._pending], dtype=np.int32)])
+        else:
+            new_terms = np.empty(0, dtype=np.int64)
+            new_tfs = np.empty(0, dtype=np.float32)
+            new_docs = np.empty(0, dtype=np.int64)
+
+        # --- 3. Merge: within each term, old postings first, then new ones ---
+        # Both groups are already in ascending document order, so no global sort is needed.
+        order = np.argsort(new_terms, kind="stable")
+        new_terms, new_tfs, new_docs = new_terms[order], new_tfs[order], new_docs[order]
+        old_counts = np.bincount(kept_terms, minlength=n_terms)
+        new_counts = np.bincount(new_terms, minlength=n_terms)
+        term_indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(old_counts + new_counts, out=term_indptr[1:])
+
+        old_starts = np.concatenate([[0], np.cumsum(old_counts)[:-1]])
+        new_starts = np.concatenate([[0], np.cumsum(new_counts)[:-1]])
+        old_pos = term_indptr[kept_terms] + np.arange(len(kept_terms)) - old_starts[kept_terms]
+        new_pos = term_indptr[new_terms] + old_counts[new_terms] + np.arange(len(new_terms)) - new_starts[new_terms]
+
+        post_docs = np.empty(term_indptr[-1], dtype=np.int32)
+        post_tfs = np.empty(term_indptr[-1], dtype=np.float32)
+        post_docs[old_pos], post_tfs[old_pos] = kept_docs, kept_tfs
+        post_docs[new_pos], post_tfs[new_pos] = new_docs, new_tfs
+
+        self.chunk_ids = chunk_ids
+        self.term_indptr = term_indptr
+        self.post_docs = post_docs
+        self.post_tfs = post_tfs
+        self.doc_lens = doc_lens
+        self.doc_source = doc_source
+        self._alive = np.ones(len(chunk_ids), dtype=bool)
+        self._pending = []
+        self._dirty = False
+        self._update_stats()
+
+    # --- Querying ---
+    def search(self, query: str, top_k: int, mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (document positions, scores) of the best top_k documents, best first.
+        With a boolean `mask` over document positions, postings of other documents are
+        dropped before scoring, so a narrow filter makes the query cheaper.
+        """
+        query_terms = Counter(self.vocab[t] for t in tokenize(query) if t in self.vocab)
+        if not query_terms or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        docs_parts, score_parts = [], []
+        for term_id, query_count in query_terms.items():
+            start, end = self.term_indptr[term_id], self.term_indptr[term_id + 1]
+            if start == end:
+                continue
+            docs = self.post_docs[start:end]
+            tfs = self.post_tfs[start:end]
+            if mask is not None:
+                keep = mask[docs]
+                docs, tfs = docs[keep], tfs[keep]
+                if not len(docs):
+                    continue
+            weight = self.idf[term_id] * query_count
+            docs_parts.append(docs)
+            score_parts.append(weight * tfs * (self.k1 + 1) / (tfs + self.doc_norm[docs]))
+        if not docs_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        candidates, inverse = np.unique(np.concatenate(docs_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts)).astype(np.float32)
+
+        if len(candidates) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(candidates))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return candidates[best], scores[best]
+
+    # --- Persistence ---
+    def save(self, path: str):
+        """Commits pending changes, writes a fresh directory and swaps it in place of the old one."""
+        self.commit()
+        tmp_path = fresh_directory(path)
+        for name in self.ARRAYS:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(tmp_path, "meta.json"), 'w') as f:
+            json.dump({"k1": self.k1, "b": self.b, "vocab": self.vocab,
+                       "chunk_ids": self.chunk_ids, "sources": self.sources}, f)
+        swap_directory(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "BM25Index":
+        with open(os.path.join(path, "meta.json"), 'r') as f:
+            meta = json.load(f)
+        mmap_mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in cls.ARRAYS}
+        return cls(meta["vocab"], meta["chunk_ids"], meta["sources"], k1=meta["k1"], b=meta["b"], **arrays)
+
+
+def compute_idf(df: np.ndarray, n_docs: int) -> np.ndarray:
+    """Okapi IDF; negative values (very common terms) are floored at EPSILON * mean IDF, as BM25Okapi does."""
+    df = np.asarray(df, dtype=np.float64)
+    idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+    # Terms whose documents were all removed stay in the vocabulary but don't count
+    present = df > 0
+    if present.any():
+        floor = EPSILON * idf[present].mean()
+        idf = np.where(idf < 0, floor, idf)
+    return idf.astype(np.float32)
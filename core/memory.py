@@ -0,0 +1,41 @@
+import sys
+import resource
+
+# /proc/<pid>/smaps_rollup fields (in kB) and the names they are reported under (in MB)
+SMAPS_FIELDS = {
+    "Rss": "rss_mb",
+    "Pss": "pss_mb",
+    "Shared_Clean": "shared_clean_mb",
+    "Shared_Dirty": "shared_dirty_mb",
+    "Private_Clean": "private_clean_mb",
+    "Private_Dirty": "private_dirty_mb",
+    "Swap": "swap_mb",
+}
+
+
+def memory_usage(pid: int | str = "self") -> dict:
+    """
+    Resident memory of a process in MB. RSS counts every page the process maps, including
+    pages it shares with other processes (model weights inherited from serve.py's parent,
+    memory-mapped indexes); PSS divides each shared page among the processes mapping it,
+    so the PSS of all workers adds up to what they really use together. Needs Linux 4.14+;
+    elsewhere only the peak RSS of the current process is reported.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        if pid != "self":
+            return {}
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return {"peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)}
+
+    usage = {}
+    for line in lines[1:]:  # The first line is the address range of the rollup
+        name, _, value = line.partition(":")
+        if name in SMAPS_FIELDS:
+            usage[SMAPS_FIELDS[name]] = round(int(value.split()[0]) / 1024, 1)
+    usage["shared_mb"] = round(usage.get("shared_clean_mb", 0) + usage.get("shared_dirty_mb", 0), 1)
+    usage["private_mb"] = round(usage.get("private_clean_mb", 0) + usage.get("private_dirty_mb", 0), 1)
+    return usage
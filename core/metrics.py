@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+# Requests slower than this are appended to SLOW_QUERY_LOG with their full breakdown (0 = off)
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", 0))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "slow_queries.jsonl")
+# Percentiles are computed over this many most recent samples per stage
+PERCENTILE_WINDOW = int(os.getenv("METRICS_PERCENTILE_WINDOW", 2048))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """
+    Latency histogram with cumulative Prometheus buckets (over the whole process lifetime)
+    and a window of recent samples for p50/p95/p99.
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS, window: int = PERCENTILE_WINDOW):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+
+    def percentiles(self) -> dict:
+        if not self.recent:
+            return {}
+        values = np.percentile(np.fromiter(self.recent, dtype=np.float64), [q * 100 for q in QUANTILES])
+        return {f"p{int(q * 100)}": float(v) for q, v in zip(QUANTILES, values)}
+
+
+class MetricsRegistry:
+    """Process-wide stage histograms and counters, exported as JSON (/stats) or Prometheus text (/metrics)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # (metric, stage) -> Histogram
+        self.counters = {}  # (metric, labels tuple) -> value
+
+    def observe(self, stage: str, seconds: float, metric: str = "rag_stage_seconds"):
+        with self.lock:
+            histogram = self.histograms.get((metric, stage))
+            if histogram is None:
+                histogram = self.histograms[(metric, stage)] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, metric: str, value: float = 1.0, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def summary(self) -> dict:
+        with self.lock:
+            stages = {}
+            for (metric, stage), h in self.histograms.items():
+                stages.setdefault(metric, {})[stage] = {"count": h.count, "mean": h.sum / h.count if h.count else 0.0, **h.percentiles()}
+            counters = {}
+            for (metric, labels), value in self.counters.items():
+                name = metric + "".join(f"[{k}={v}]" for k, v in labels)
+                counters[name] = value
+        return {"latency_seconds": stages, "counters": counters}
+
+    def prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            for metric in sorted({m for m, _ in self.histograms}):
+                lines.append(f"# TYPE {metric} histogram")
+                for (m, stage), h in sorted(self.histograms.items()):
+                    if m != metric:
+                        continue
+                    for bound, count in zip(h.buckets, h.bucket_counts):
+                        lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                    lines.append(f'{metric}_sum{{stage="{stage}"}} {h.sum}')
+                    lines.append(f'{metric}_count{{stage="{stage}"}} {h.count}')
+                # Percentiles over the recent window, for dashboards without histogram_quantile()
+                lines.append(f"# TYPE {metric}_recent gauge")
+                for (m, stage), h in sorted(self.histograms.items()):
+                    if m != metric:
+                        continue
+                    for name, value in h.percentiles().items():
+                        lines.append(f'{metric}_recent{{stage="{stage}",quantile="0.{name[1:]}"}} {value}')
+            for metric in sorted({m for m, _ in self.counters}):
+                lines.append(f"# TYPE {metric} counter")
+                for (m, labels), value in sorted(self.counters.items()):
+                    if m != metric:
+                        continue
+                    label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f"{metric}{{{label_str}}} {value}" if label_str else f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+# --- Tracing ---
+class Trace:
+    """Stage durations and extra attributes of one request."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.time()
+        self.spans = {}  # stage -> seconds (summed if a stage runs more than once)
+        self.attributes = {}
+
+    def add(self, stage: str, seconds: float):
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def breakdown_ms(self) -> dict:
+        return {stage: round(seconds * 1000, 2) for stage, seconds in self.spans.items()}
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def start_trace(name: str) -> Trace:
+    """Makes a new trace current for this request; spans recorded in the same context attach to it."""
+    trace = Trace(name)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+def record_span(stage: str, seconds: float):
+    metrics.observe(stage, seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    """Times the enclosed block as one stage, in the process-wide histogram and the current trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - start)
+
+
+def set_attribute(key: str, value):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes[key] = value
+
+
+def finish_trace(trace: Trace, **attributes):
+    """Records the request total and writes the slow-query log entry if it took too long."""
+    total = time.time() - trace.started_at
+    metrics.observe(trace.name, total, metric="rag_request_seconds")
+    trace.attributes.update(attributes)
+    if SLOW_QUERY_SECONDS and total >= SLOW_QUERY_SECONDS:
+        entry = {
+            "time": trace.started_at,
+            "endpoint": trace.name,
+            "total_ms": round(total * 1000, 2),
+            "stages_ms": trace.breakdown_ms(),
+            **trace.attributes
+        }
+        with open(SLOW_QUERY_LOG, 'a') as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+    return total
@@ -1,77 +1,450 @@
-import pickle
-import chromadb
+import os
+import time
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer, CrossEncoder
-from rank_bm25 import BM25Okapi
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from core.batching import MicroBatcher
+from core.inference import INFERENCE_BACKEND, INFERENCE_PARITY_CHECK, load_embedder, load_reranker, print_parity
+from core.lexical import BM25Index
+from core.chunk_store import ChunkStore
+from core.vector_index import VectorIndex
+from core.fusion import fuse, is_decisive
+from core.cache import CorpusVersionWatcher, RetrievalCache
+from core.filters import MetadataFilter
+from core.metrics import span
+
+load_dotenv()
 
 # --- Constants ---
 DB_PATH = "db"
-BM25_INDEX_PATH = "bm25_index.pkl"
+LEXICAL_INDEX_PATH = "lexical_index"
+CHUNK_STORE_PATH = "chunk_store"
+VECTOR_INDEX_PATH = "vector_index"
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
 
+# Micro-batching: concurrent queries share one forward pass per model.
+# A batch runs once BATCH_WINDOW_MS have passed since the first waiting request,
+# or as soon as the item limit is reached.
+ENABLE_MICRO_BATCHING = os.getenv("ENABLE_MICRO_BATCHING", "true").lower() == "true"
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", 5))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", 32))
+RERANK_MAX_BATCH = int(os.getenv("RERANK_MAX_BATCH", 64))
+
+# --- Dense search backend ---
+# "chroma" (the Chroma collection), "flat" (exact search over the memory-mapped vector index
+# written by ingest.py) or "ivf" (the same index, searching only the DENSE_IVF_NPROBE nearest
+# IVF lists; more probes give higher recall). The local index is shared by all worker processes.
+DENSE_BACKEND = os.getenv("DENSE_BACKEND", "chroma")
+DENSE_IVF_NPROBE = int(os.getenv("DENSE_IVF_NPROBE", 16))
+if DENSE_BACKEND not in ("chroma", "flat", "ivf"):
+    raise ValueError(f"Unsupported DENSE_BACKEND: {DENSE_BACKEND}")
+
+# --- Fusion and rerank budget ---
+# Candidates fetched from each retriever (0 = use the requested top_k)
+DENSE_CANDIDATES = int(os.getenv("DENSE_CANDIDATES", 0))
+LEXICAL_CANDIDATES = int(os.getenv("LEXICAL_CANDIDATES", 0))
+# "rrf" (reciprocal rank fusion) or "weighted" (min-max normalised score fusion)
+FUSION_METHOD = os.getenv("FUSION_METHOD", "rrf")
+FUSION_RRF_K = int(os.getenv("FUSION_RRF_K", 60))
+FUSION_DENSE_WEIGHT = float(os.getenv("FUSION_DENSE_WEIGHT", 0.5))
+# At most this many fused candidates go to the cross-encoder (0 = all of them)
+RERANK_BUDGET = int(os.getenv("RERANK_BUDGET", 0))
+# If the fused top_k lead the next candidate by this margin, only the top_k are reranked (0 = off)
+RERANK_EARLY_EXIT_MARGIN = float(os.getenv("RERANK_EARLY_EXIT_MARGIN", 0))
+
+# --- Retrieval cache ---
+# Repeated queries reuse their embedding and reranked results until the corpus version changes
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", 2048))
+
+# --- Hot index reload ---
+# Seconds between checks of the corpus version stamp written by ingest.py; a new version is
+# loaded in the background and swapped in without reloading the models (0 = off)
+INDEX_RELOAD_INTERVAL = float(os.getenv("INDEX_RELOAD_INTERVAL", 5))
+
+# Filter masks kept per index generation, so repeated filters skip the column scans
+FILTER_MASK_CACHE_SIZE = int(os.getenv("FILTER_MASK_CACHE_SIZE", 128))
+
+
+class IndexSnapshot:
+    """
+    One generation of the indexes (Chroma collection or vector index, BM25 index, chunk store),
+    used together by a query. Queries hold it between acquire() and release(); once a reload
+    retires it, its Chroma client is stopped when the last of them is done.
+    """
+
+    def __init__(self, client, collection, bm25: BM25Index, chunks: ChunkStore, vectors: VectorIndex | None, version: str):
+        self.client = client
+        self.collection = collection
+        self.bm25 = bm25
+        self.chunks = chunks
+        self.vectors = vectors
+        self.version = version
+        self.loaded_at = time.time()
+        self.bm25.chunk_ids = self.chunks.chunk_ids  # Share one list instead of holding two copies
+        # Dense search returns Chroma IDs; this maps them onto store positions
+        self.position_of = {chunk_id: i for i, chunk_id in enumerate(self.chunks.chunk_ids)}
+        self._masks = {}  # filter key -> boolean mask over positions
+        self._lock = threading.Lock()
+        self._users = 0
+        self._retired = False
+        self._closed = False
+
+    def acquire(self) -> bool:
+        """Registers a query; False if the snapshot is already closed (the caller takes the new one)."""
+        with self._lock:
+            if self._closed:
+                return False
+            self._users += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            close = self._retired and not self._users and not self._closed
+            self._closed = self._closed or close
+        if close:
+            self._close_client()
+
+    def retire(self):
+        """Called once the snapshot is replaced; closes it now or when its last query finishes."""
+        with self._lock:
+            self._retired = True
+            close = not self._users and not self._closed
+            self._closed = self._closed or close
+        if close:
+            self._close_client()
+
+    def _close_client(self):
+        # Stops the Chroma System behind the client (SQLite connections, background threads).
+        # The client has no public close; clear_system_cache() only forgets the System.
+        system = getattr(self.client, "_system", None)
+        if system is not None:
+            system.stop()
+
+    def mask(self, metadata_filter: MetadataFilter) -> np.ndarray:
+        key = metadata_filter.key()
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = metadata_filter.mask(self.chunks)
+            if len(self._masks) >= FILTER_MASK_CACHE_SIZE:
+                self._masks.clear()
+            self._masks[key] = mask
+        return mask
+
+
 class HybridRetriever:
-    def __init__(self):
+    def __init__(self, start: bool = True):
+        """
+        Loads the models and indexes. With start=False the Chroma client and the background
+        threads are left for start(): serve.py loads the retriever once and forks the workers,
+        and neither threads nor Chroma's SQLite connection survive a fork.
+        """
         print("Initializing retriever (optimized hybrid mode)...")
-        self.embed_model = SentenceTransformer(EMBEDDING_MODEL)
-        self.reranker = CrossEncoder(RERANKER_MODEL)
-        
-        self.client = chromadb.PersistentClient(path=DB_PATH)
-        self.collection = self.client.get_collection(name="ai_history")
-        
-        with open(BM25_INDEX_PATH, 'rb') as f:
-            self.bm25 = pickle.load(f)
-        
-        # --- THE FIX: Load only documents and metadata into memory ---
-        # This is small and memory-safe but gives us fast lookups.
-        all_data = self.collection.get(include=["documents", "metadatas"])
-        self.bm25_doc_texts = all_data['documents']
-        self.doc_to_meta = {doc: meta for doc, meta in zip(all_data['documents'], all_data['metadatas'])}
+        # Read before the indexes, so a write that lands while they load triggers a reload
+        self.version_watcher = CorpusVersionWatcher()
+        version = self.version_watcher.current()
+        # The two models, Chroma and the local indexes are independent, so they load concurrently
+        with ThreadPoolExecutor(max_workers=4, thread_name_prefix="retriever-load") as pool:
+            # Inference backend (fp32 torch, int8 torch or int8 ONNX Runtime) comes from INFERENCE_BACKEND
+            self.load_timings = {}
+            embed_model = pool.submit(self._timed, "embedder", load_embedder, EMBEDDING_MODEL)
+            reranker = pool.submit(self._timed, "reranker", load_reranker, RERANKER_MODEL)
+            collection = pool.submit(self._timed, "chroma", self._open_collection) if start else None
+            indexes = pool.submit(self._timed, "local_indexes", self._load_indexes)
+            self.embed_model = embed_model.result()
+            self.reranker = reranker.result()
+            client, collection = collection.result() if collection else (None, None)
+            self.snapshot = IndexSnapshot(client, collection, *indexes.result(), version)
+
+        if INFERENCE_PARITY_CHECK and INFERENCE_BACKEND != "torch":
+            print_parity(self.embed_model, self.reranker, EMBEDDING_MODEL, RERANKER_MODEL)
+        self.embed_batcher = None
+        self.rerank_batcher = None
+        # Keyed to the generation being served, so a reload invalidates it in the same step as the swap
+        self.cache = RetrievalCache(RETRIEVAL_CACHE_MAX_ENTRIES, version_fn=lambda: self.snapshot.version) if RETRIEVAL_CACHE_ENABLED else None
+
+        self.reload_stats = {"reloads": 0, "failures": 0, "last_reload_seconds": None, "last_error": None}
+        self._reload_lock = threading.Lock()
+        self._stop_reload = threading.Event()
+        if start:
+            self.start()
         print("Retriever initialized.")
 
-    def retrieve(self, query: str, top_k: int = 5) -> list[dict]:
-        # 1. Dense Search
-        query_embedding = self.embed_model.encode(query).tolist()
-        dense_results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            include=["documents", "metadatas"]
+    def start(self):
+        """Opens Chroma if it isn't open yet and starts the micro-batching and index reload threads."""
+        if DENSE_BACKEND == "chroma" and self.snapshot.collection is None:
+            snapshot = self.snapshot
+            self.snapshot = IndexSnapshot(*self._open_collection(), snapshot.bm25, snapshot.chunks, snapshot.vectors, snapshot.version)
+            snapshot.retire()
+        if ENABLE_MICRO_BATCHING:
+            self.embed_batcher = MicroBatcher(self.embed_model.encode, EMBED_MAX_BATCH, BATCH_WINDOW_MS, name="embed")
+            self.rerank_batcher = MicroBatcher(self.reranker.predict, RERANK_MAX_BATCH, BATCH_WINDOW_MS, name="rerank")
+        if INDEX_RELOAD_INTERVAL > 0:
+            threading.Thread(target=self._watch_indexes, name="index-reload", daemon=True).start()
+
+    def _timed(self, name: str, load_fn, *args):
+        start = time.perf_counter()
+        result = load_fn(*args)
+        self.load_timings[name] = round(time.perf_counter() - start, 3)
+        return result
+
+    @staticmethod
+    def _open_collection(fresh: bool = False):
+        if DENSE_BACKEND != "chroma":
+            return None, None  # Dense search runs on the local vector index instead
+        import chromadb  # Deferred: importing chromadb alone takes seconds
+        if fresh:
+            # Chroma shares one System (with its in-memory vector index) per path; dropping the
+            # shared ones makes the new client read what ingest.py wrote since. Clients already
+            # open keep their System, so queries running on the old snapshot are unaffected.
+            from chromadb.api.client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+        client = chromadb.PersistentClient(path=DB_PATH)
+        return client, client.get_collection(name="ai_history")
+
+    @staticmethod
+    def _load_indexes() -> tuple[BM25Index, ChunkStore, VectorIndex | None]:
+        # The postings arrays are memory-mapped, so loading is cheap
+        bm25 = BM25Index.load(LEXICAL_INDEX_PATH)
+        # Texts and metadata come from the chunk store written by ingest.py (also memory-mapped),
+        # addressed by the same integer positions as the BM25 index
+        chunks = ChunkStore.load(CHUNK_STORE_PATH)
+        if bm25.chunk_ids != chunks.chunk_ids:
+            raise RuntimeError("Lexical index and chunk store are out of sync. Please re-run ingest.py.")
+        vectors = None
+        if DENSE_BACKEND != "chroma":
+            vectors = VectorIndex.load(VECTOR_INDEX_PATH)
+            if vectors.chunk_ids != chunks.chunk_ids:
+                raise RuntimeError("Vector index and chunk store are out of sync. Please re-run ingest.py.")
+            vectors.chunk_ids = chunks.chunk_ids
+        return bm25, chunks, vectors
+
+    # --- Hot reload ---
+    def reload_indexes(self) -> bool:
+        """
+        Loads the index generation named by the current corpus version and swaps it in.
+        Queries that already took the old snapshot finish on it. Returns False if nothing changed.
+        """
+        with self._reload_lock:
+            version = self.version_watcher.current()
+            if version == self.snapshot.version:
+                return False
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="index-reload") as pool:
+                collection = pool.submit(self._open_collection, True)
+                indexes = pool.submit(self._load_indexes)
+                snapshot = IndexSnapshot(*collection.result(), *indexes.result(), version)
+            previous, self.snapshot = self.snapshot, snapshot
+            previous.retire()
+            seconds = time.perf_counter() - start
+            self.reload_stats.update(reloads=self.reload_stats["reloads"] + 1, last_reload_seconds=round(seconds, 3), last_error=None)
+            print(f"Swapped in index generation {version[:12]} ({len(snapshot.chunks)} chunks) in {seconds:.2f}s")
+            return True
+
+    def _watch_indexes(self):
+        while not self._stop_reload.wait(INDEX_RELOAD_INTERVAL):
+            try:
+                self.reload_indexes()
+            except Exception as e:
+                # Usually ingest.py is still writing; the next check tries again
+                self.reload_stats.update(failures=self.reload_stats["failures"] + 1, last_error=str(e))
+                print(f"Index reload failed, still serving generation {self.snapshot.version[:12]}: {e}")
+
+    def index_stats(self) -> dict:
+        snapshot = self.snapshot
+        return {
+            "version": snapshot.version,
+            "chunks": len(snapshot.chunks),
+            "dense_backend": DENSE_BACKEND,
+            "loaded_at": snapshot.loaded_at,
+            **self.reload_stats
+        }
+
+    def close(self):
+        self._stop_reload.set()
+        self.snapshot.retire()
+
+    def _acquire_snapshot(self) -> IndexSnapshot:
+        while True:
+            snapshot = self.snapshot
+            # Fails only if a reload closed it after it was read here; the next read gets the new one
+            if snapshot.acquire():
+                return snapshot
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        if self.embed_batcher:
+            return self.embed_batcher.run(texts)
+        return self.embed_model.encode(texts)
+
+    def _predict(self, pairs: list[list[str]]) -> np.ndarray:
+        if self.rerank_batcher:
+            return self.rerank_batcher.run(pairs)
+        return self.reranker.predict(pairs)
+
+    def batching_stats(self) -> dict:
+        # The batchers only exist once start() has run (serve.py builds the retriever without it)
+        if self.embed_batcher is None:
+            return {}
+        return {"embed": self.embed_batcher.stats(), "rerank": self.rerank_batcher.stats()}
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats() if self.cache is not None else {}
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embed_queries([query])[0]
+
+    def embed_queries(self, queries: list[str]) -> np.ndarray:
+        if self.cache is None:
+            with span("embed"):
+                return np.asarray(self._encode(queries))
+
+        cached = [self.cache.get_embedding(q) for q in queries]
+        missing = [i for i, e in enumerate(cached) if e is None]
+        if missing:
+            with span("embed"):
+                encoded = np.asarray(self._encode([queries[i] for i in missing]))
+            for i, embedding in zip(missing, encoded):
+                self.cache.put_embedding(queries[i], embedding)
+                cached[i] = embedding
+        return np.asarray(cached)
+
+    def retrieve(self, query: str, top_k: int = 5, query_embedding: np.ndarray | None = None,
+                 filters: MetadataFilter | None = None) -> list[dict]:
+        query_embeddings = None if query_embedding is None else [query_embedding]
+        return self.retrieve_batch([query], top_k, query_embeddings, filters)[0]
+
+    def retrieve_batch(self, queries: list[str], top_k: int = 5, query_embeddings: list | None = None,
+                       filters: MetadataFilter | None = None) -> list[list[dict]]:
+        """
+        Retrieves for several queries at once: one embedding batch, one Chroma query with all
+        the query embeddings and one cross-encoder batch over every query's candidates.
+        Returns one result list per query, each the same as retrieve() would return.
+        Queries found in the retrieval cache are answered from it and left out of the batch.
+        `filters` restricts every query to matching chunks, in Chroma and in BM25 alike.
+        """
+        if not queries:
+            return []
+        # Every query in the batch uses this generation, even if a reload swaps it meanwhile
+        snapshot = self._acquire_snapshot()
+        try:
+            return self._retrieve_batch(snapshot, queries, top_k, query_embeddings, filters)
+        finally:
+            snapshot.release()
+
+    def _retrieve_batch(self, snapshot: IndexSnapshot, queries: list[str], top_k: int, query_embeddings: list | None,
+                        filters: MetadataFilter | None) -> list[list[dict]]:
+        if self.cache is None:
+            return self._retrieve_uncached(snapshot, queries, top_k, query_embeddings, filters)
+
+        filter_key = filters.key() if filters is not None else ()
+        results = [self.cache.get_results(q, top_k, filter_key) for q in queries]
+        missing = [i for i, r in enumerate(results) if r is None]
+        if missing:
+            fresh = self._retrieve_uncached(
+                snapshot, [queries[i] for i in missing], top_k,
+                None if query_embeddings is None else [query_embeddings[i] for i in missing],
+                filters
+            )
+            for i, docs in zip(missing, fresh):
+                # Dropped if a reload swapped in another generation meanwhile
+                self.cache.put_results(queries[i], top_k, docs, filter_key, version=snapshot.version)
+                results[i] = docs
+        return results
+
+    @staticmethod
+    def _dense_search(snapshot: IndexSnapshot, query_embeddings, n_dense: int, mask: np.ndarray | None,
+                      where: dict | None) -> list[tuple[list, list]]:
+        """Per query, (chunk positions, scores) of the nearest chunks, best first."""
+        if snapshot.vectors is not None:
+            # Without trained IVF lists (a small corpus) the search is exact whatever the backend
+            nprobe = DENSE_IVF_NPROBE if DENSE_BACKEND == "ivf" else 0
+            return [(positions.tolist(), scores.tolist())
+                    for positions, scores in snapshot.vectors.search(np.asarray(query_embeddings), n_dense, mask, nprobe)]
+
+        dense_results = snapshot.collection.query(
+            query_embeddings=[np.asarray(e).tolist() for e in query_embeddings],
+            n_results=n_dense,
+            where=where,  # Filtered inside Chroma, before the nearest-neighbour search
+            include=["distances"]  # Only IDs and distances; texts and metadata come from the chunk store
         )
-        
-        # 2. Lexical Search
-        tokenized_query = query.lower().split(" ")
-        bm25_scores = self.bm25.get_scores(tokenized_query)
-        top_n_indices = sorted(range(len(bm25_scores)), key=lambda i: bm25_scores[i], reverse=True)[:top_k]
-        
-        # 3. Combine Results
-        combined_docs_map = {}
-        # Add dense results
-        for doc_text, metadata in zip(dense_results['documents'][0], dense_results['metadatas'][0]):
-            combined_docs_map[doc_text] = metadata
-        
-        # Add lexical results using our fast in-memory metadata lookup
-        for i in top_n_indices:
-            doc_text = self.bm25_doc_texts[i]
-            if doc_text not in combined_docs_map:
-                combined_docs_map[doc_text] = self.doc_to_meta.get(doc_text, {"source": "unknown"})
-
-        # 4. Reranking
-        doc_meta_list = list(combined_docs_map.items())
-        if not doc_meta_list: return []
-            
-        rerank_pairs = [[query, doc_text] for doc_text, _ in doc_meta_list]
-        raw_scores = self.reranker.predict(rerank_pairs)
-        
+        results = []
+        for ids, distances in zip(dense_results['ids'], dense_results['distances']):
+            positions, scores = [], []
+            for chunk_id, distance in zip(ids, distances):
+                position = snapshot.position_of.get(chunk_id)
+                # Missing only while ingestion is in progress; the mask check keeps both sides consistent
+                if position is not None and (mask is None or mask[position]):
+                    positions.append(position)
+                    scores.append(-distance)
+            results.append((positions, scores))
+        return results
+
+    def _retrieve_uncached(self, snapshot: IndexSnapshot, queries: list[str], top_k: int, query_embeddings: list | None,
+                           filters: MetadataFilter | None = None) -> list[list[dict]]:
+        mask, where, n_dense = None, None, DENSE_CANDIDATES or top_k
+        if filters is not None:
+            with span("filter"):
+                mask = snapshot.mask(filters)
+                matching = int(mask.sum())
+            if not matching:
+                return [[] for _ in queries]
+            where = filters.where()
+            n_dense = min(n_dense, matching)  # Chroma can't return more than the filter lets through
+
+        # 1. Dense Search (callers that already embedded the queries can pass the embeddings in)
+        if query_embeddings is None:
+            query_embeddings = self.embed_queries(queries)
+        with span("dense_search"):
+            dense_results = self._dense_search(snapshot, query_embeddings, n_dense, mask, where)
+
+        all_pairs, all_fused, offsets = [], [], [0]
+        for i, query in enumerate(queries):
+            dense_positions, dense_scores = dense_results[i]
+
+            # 2. Lexical Search (only the postings of the query terms are scored)
+            with span("lexical_search"):
+                lexical_positions, lexical_scores = snapshot.bm25.search(query, LEXICAL_CANDIDATES or top_k, mask)
+
+            # 3. Fuse the two rankings (by chunk position, so chunks with identical text stay distinct)
+            with span("fusion"):
+                fused = fuse(FUSION_METHOD, [
+                    (dense_positions, dense_scores, FUSION_DENSE_WEIGHT),
+                    (lexical_positions, lexical_scores, 1.0 - FUSION_DENSE_WEIGHT),
+                ], rrf_k=FUSION_RRF_K)
+            if RERANK_BUDGET:
+                fused = fused[:max(RERANK_BUDGET, top_k)]
+            if is_decisive(fused, top_k, RERANK_EARLY_EXIT_MARGIN):
+                # The fused ranking already settled the top_k; only they still need calibrated scores
+                fused = fused[:top_k]
+
+            all_fused.append(fused)
+            all_pairs.extend([query, snapshot.chunks.text(position)] for position, _ in fused)
+            offsets.append(len(all_pairs))
+
+        # 4. Reranking (all queries' candidates in one batch)
+        if not all_pairs:
+            return [[] for _ in queries]
+        with span("rerank"):
+            raw_scores = np.asarray(self._predict(all_pairs))
+
         # Normalize scores
-        normalized_scores = 1 / (1 + np.exp(-np.array(raw_scores)))
-        
-        reranked_results = []
-        for i, (doc_text, metadata) in enumerate(doc_meta_list):
-            reranked_results.append({
-                "text": doc_text,
-                "score": normalized_scores[i],
-                "metadata": metadata
-            })
-
-        reranked_results.sort(key=lambda x: x['score'], reverse=True)
-        return reranked_results[:top_k]
\ No newline at end of file
+        normalized_all = 1 / (1 + np.exp(-raw_scores))
+
+        results = []
+        for i, fused in enumerate(all_fused):
+            pairs = all_pairs[offsets[i]:offsets[i + 1]]
+            normalized_scores = normalized_all[offsets[i]:offsets[i + 1]]
+            order = np.argsort(-normalized_scores, kind="stable")[:top_k]
+            results.append([
+                {
+                    "text": pairs[j][1],
+                    "score": normalized_scores[j],
+                    "fused_score": fused[j][1],
+                    "metadata": snapshot.chunks.metadata(fused[j][0])
+                }
+                for j in order
+            ])
+        return results
@@ -0,0 +1,55 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ComponentLoader:
+    """
+    Loads named components concurrently on background threads and records the status and
+    load time of each one, so the server can accept connections (and answer health checks)
+    while the models are still loading.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        self.started_at = time.time()
+        self.components = {}
+        self.lock = threading.Lock()
+
+    def add(self, name: str, load_fn, required: bool = True):
+        """Starts load_fn in the background. Optional components don't hold back readiness."""
+        with self.lock:
+            self.components[name] = {"status": "pending", "required": required, "seconds": None, "error": None}
+        return self.executor.submit(self._load, name, load_fn)
+
+    def _load(self, name: str, load_fn):
+        self._update(name, status="loading")
+        start = time.perf_counter()
+        try:
+            load_fn()
+        except Exception as e:
+            self._update(name, status="failed", seconds=round(time.perf_counter() - start, 3), error=str(e))
+            print(f"Failed to load {name}: {e}")
+            return
+        self._update(name, status="ready", seconds=round(time.perf_counter() - start, 3))
+        print(f"Loaded {name} in {time.perf_counter() - start:.2f}s")
+
+    def _update(self, name: str, **fields):
+        with self.lock:
+            self.components[name].update(fields)
+
+    def is_ready(self) -> bool:
+        with self.lock:
+            return all(c["status"] == "ready" for c in self.components.values() if c["required"])
+
+    def report(self) -> dict:
+        with self.lock:
+            components = {name: dict(c) for name, c in self.components.items()}
+        return {
+            "ready": self.is_ready(),
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "components": components
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,20 @@
+import os
+import shutil
+
+
+def fresh_directory(path: str) -> str:
+    """Creates an empty staging directory next to `path` and returns it."""
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    return tmp_path
+
+
+def swap_directory(tmp_path: str, path: str):
+    """Replaces `path` with the fully written staging directory using renames only."""
+    old_path = path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
@@ -0,0 +1,237 @@
+import os
+import json
+import numpy as np
+from dotenv import load_dotenv
+
+from core.storage import fresh_directory, swap_directory
+
+load_dotenv()
+
+# --- Configuration (read by ingest.py when it writes the index) ---
+# "float16" (half the size of float32, near-identical scores) or "int8" (a quarter, per-vector scale)
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float16")
+# The IVF (inverted file) partitioning is trained once the index has this many vectors
+VECTOR_INDEX_IVF_MIN_VECTORS = int(os.getenv("VECTOR_INDEX_IVF_MIN_VECTORS", 10000))
+# Number of IVF lists (0 = about 4 * sqrt(number of vectors))
+VECTOR_INDEX_IVF_LISTS = int(os.getenv("VECTOR_INDEX_IVF_LISTS", 0))
+
+# Rows scored per matrix product; bounds the float32 copy made of the stored vectors
+SEARCH_BLOCK_ROWS = 65536
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 100000
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class VectorIndex:
+    """
+    Dense vectors in one memory-mapped array, addressed by the same integer positions as
+    the chunk store and the BM25 index, so every worker process shares the OS page cache
+    instead of holding its own copy, and filter masks apply to it directly.
+
+    Vectors are L2-normalised and stored as float16, or as int8 with a per-vector scale.
+    Search is an exact inner product computed block-wise over the whole matrix (batched over
+    queries), or, once the IVF partitioning is trained, over the lists of the `nprobe`
+    nearest centroids only: more probes give higher recall at a higher cost.
+
+    Updates follow the same pattern as ChunkStore (remove_ids/add, then commit).
+    """
+
+    ARRAYS = ("vectors", "scales", "centroids", "list_ids", "list_order", "list_indptr")
+
+    def __init__(self, chunk_ids: list[str], vectors: np.ndarray, dtype: str = VECTOR_INDEX_DTYPE,
+                 scales: np.ndarray | None = None, centroids: np.ndarray | None = None,
+                 list_ids: np.ndarray | None = None, trained_size: int = 0):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported vector index dtype: {dtype}")
+        self.chunk_ids = chunk_ids
+        self.vectors = vectors
+        self.dtype = dtype
+        self.scales = scales  # int8 only: the float value of one quantization step, per vector
+        self.centroids = centroids
+        self.list_ids = list_ids  # IVF list of every vector
+        self.trained_size = trained_size
+        self.list_order = None
+        self.list_indptr = None
+
+        self._alive = np.ones(len(chunk_ids), dtype=bool)
+        self._pending = []  # (chunk_id, unit vector)
+
+    @classmethod
+    def empty(cls, dim: int = 0, dtype: str = VECTOR_INDEX_DTYPE) -> "VectorIndex":
+        vectors = np.empty((0, dim), dtype=np.int8 if dtype == "int8" else np.float16)
+        scales = np.empty(0, dtype=np.float32) if dtype == "int8" else None
+        return cls([], vectors, dtype, scales)
+
+    @classmethod
+    def build(cls, chunk_ids: list[str], embeddings, dtype: str = VECTOR_INDEX_DTYPE) -> "VectorIndex":
+        index = cls.empty(np.asarray(embeddings).shape[-1] if len(chunk_ids) else 0, dtype)
+        index.add(chunk_ids, embeddings)
+        index.commit()
+        return index
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    # --- Updates ---
+    def add(self, chunk_ids: list[str], embeddings):
+        if not len(chunk_ids):
+            return
+        for chunk_id, vector in zip(chunk_ids, _unit_rows(embeddings)):
+            self._pending.append((chunk_id, vector))
+
+    def remove_ids(self, chunk_ids) -> int:
+        chunk_ids = set(chunk_ids)
+        mask = np.fromiter((c in chunk_ids for c in self.chunk_ids), dtype=bool, count=len(self.chunk_ids))
+        removed = int((mask & self._alive).sum())
+        self._alive &= ~mask
+        return removed
+
+    def commit(self):
+        alive = self._alive
+        if alive.all() and not self._pending:
+            return
+        new_vectors = np.stack([v for _, v in self._pending]) if self._pending else np.empty((0, self.dim), dtype=np.float32)
+        if not len(self) and len(new_vectors):
+            self.vectors = self.vectors.reshape(0, new_vectors.shape[1])
+        encoded, scales = self._encode(new_vectors)
+
+        self.vectors = np.concatenate([np.asarray(self.vectors)[alive], encoded])
+        if self.scales is not None:
+            self.scales = np.concatenate([np.asarray(self.scales)[alive], scales])
+        if self.centroids is not None:
+            # New vectors join their nearest list; retraining happens in save() when the index has grown a lot
+            self.list_ids = np.concatenate([np.asarray(self.list_ids)[alive], self._assign(new_vectors)])
+        self.chunk_ids = [c for c, a in zip(self.chunk_ids, alive) if a] + [c for c, _ in self._pending]
+        self._alive = np.ones(len(self.chunk_ids), dtype=bool)
+        self._pending = []
+
+    def _encode(self, unit_vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        if self.dtype == "float16":
+            return unit_vectors.astype(np.float16), None
+        scales = np.maximum(np.abs(unit_vectors).max(axis=1), 1e-12) / 127.0
+        codes = np.clip(np.rint(unit_vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _decode(self, rows) -> np.ndarray:
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= np.asarray(self.scales[rows])[:, None]
+        return block
+
+    # --- IVF partitioning ---
+    def train(self, n_lists: int = VECTOR_INDEX_IVF_LISTS, seed: int = 0):
+        """Spherical k-means on a sample of the vectors, then assigns every vector to its nearest centroid."""
+        self.commit()
+        n = len(self)
+        n_lists = n_lists or int(4 * np.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+        rng = np.random.default_rng(seed)
+        sample = self._decode(np.sort(rng.choice(n, size=min(n, max(KMEANS_SAMPLE, n_lists)), replace=False)))
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind="stable")
+            counts = np.bincount(assignment, minlength=n_lists)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            filled = counts > 0
+            sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+            # Empty lists are re-seeded with random sample vectors
+            sums[~filled] = sample[rng.choice(len(sample), size=int((~filled).sum()))]
+            centroids = _unit_rows(sums)
+        self.centroids = centroids.astype(np.float32)
+        self.list_ids = np.concatenate([self._assign(self._decode(slice(start, start + SEARCH_BLOCK_ROWS)))
+                                        for start in range(0, n, SEARCH_BLOCK_ROWS)])
+        self.trained_size = n
+
+    def _assign(self, unit_vectors: np.ndarray) -> np.ndarray:
+        if not len(unit_vectors):
+            return np.empty(0, dtype=np.int32)
+        return np.argmax(unit_vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _build_lists(self):
+        """CSR layout of the IVF lists: the positions of list l are list_order[list_indptr[l]:list_indptr[l + 1]]."""
+        self.list_order = np.argsort(self.list_ids, kind="stable").astype(np.int64)
+        counts = np.bincount(self.list_ids, minlength=len(self.centroids))
+        self.list_indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    # --- Search ---
+    def search(self, queries, top_k: int, mask: np.ndarray | None = None, nprobe: int = 0) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns (positions, cosine similarities) per query, best first. `mask` limits the
+        search to the allowed positions; `nprobe` > 0 searches only that many IVF lists.
+        """
+        queries = _unit_rows(queries)
+        if not len(self) or top_k <= 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+        if nprobe and self.list_order is not None:
+            nprobe = min(nprobe, len(self.centroids))
+            probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+            results = []
+            for query, lists in zip(queries, probes):
+                rows = np.concatenate([self.list_order[self.list_indptr[l]:self.list_indptr[l + 1]] for l in lists])
+                if mask is not None:
+                    rows = rows[mask[rows]]
+                results.extend(self._exact(query[None, :], top_k, np.sort(rows)))
+            return results
+        return self._exact(queries, top_k, None if mask is None else np.flatnonzero(mask))
+
+    def _exact(self, queries: np.ndarray, top_k: int, rows: np.ndarray | None) -> list[tuple[np.ndarray, np.ndarray]]:
+        m = len(queries)
+        total = len(self) if rows is None else len(rows)
+        best_scores = np.empty((m, 0), dtype=np.float32)
+        best_positions = np.empty((m, 0), dtype=np.int64)
+        for start in range(0, total, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, total)
+            positions = np.arange(start, end) if rows is None else rows[start:end]
+            # Contiguous slices read straight from the memory map; row lists gather
+            block = self._decode(slice(start, end) if rows is None else positions)
+            scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+            candidates = np.concatenate([best_positions, np.broadcast_to(positions, (m, len(positions)))], axis=1)
+            if scores.shape[1] > top_k:
+                keep = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+                scores = np.take_along_axis(scores, keep, axis=1)
+                candidates = np.take_along_axis(candidates, keep, axis=1)
+            best_scores, best_positions = scores, candidates
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return [(best_positions[i, order[i]], best_scores[i, order[i]]) for i in range(m)]
+
+    # --- Persistence ---
+    def save(self, path: str):
+        """Commits pending changes, (re)trains the IVF lists if due, and swaps in a fresh directory."""
+        self.commit()
+        if len(self) >= VECTOR_INDEX_IVF_MIN_VECTORS and (self.centroids is None or len(self) > 2 * self.trained_size):
+            self.train()
+        if self.centroids is not None:
+            self._build_lists()
+        tmp_path = fresh_directory(path)
+        for name in self.ARRAYS:
+            value = getattr(self, name)
+            if value is not None:
+                np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(value))
+        with open(os.path.join(tmp_path, "meta.json"), 'w') as f:
+            json.dump({"dtype": self.dtype, "dim": self.dim, "trained_size": self.trained_size, "chunk_ids": self.chunk_ids}, f)
+        swap_directory(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "VectorIndex":
+        with open(os.path.join(path, "meta.json"), 'r') as f:
+            meta = json.load(f)
+        mmap_mode = "r" if mmap else None
+        arrays = {}
+        for name in cls.ARRAYS:
+            file_path = os.path.join(path, f"{name}.npy")
+            arrays[name] = np.load(file_path, mmap_mode=mmap_mode) if os.path.exists(file_path) else None
+        index = cls(meta["chunk_ids"], arrays["vectors"], meta["dtype"], arrays["scales"],
+                    arrays["centroids"], arrays["list_ids"], meta.get("trained_size", 0))
+        index.list_order, index.list_indptr = arrays["list_order"], arrays["list_indptr"]
+        return index
@@ -1,46 +1,87 @@
 import requests
 import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 
 API_URL = "http://127.0.0.1:8000/ask"
+BATCH_API_URL = "http://127.0.0.1:8000/ask/batch"
 EVAL_QUESTIONS_PATH = "eval/questions.jsonl"
 
-def main():
-    try:
-        with open(EVAL_QUESTIONS_PATH, 'r') as f:
-            eval_data = [json.loads(line) for line in f]
-    except FileNotFoundError:
-        print(f"Error: Evaluation file not found at {EVAL_QUESTIONS_PATH}")
-        return
+def score_item(item: dict, data: dict, latency: float) -> dict:
+    # Check if the system correctly abstained
+    is_correct_abstention = (item['gold_answer'] == "ABSTAIN" and "cannot answer" in data['answer'])
+
+    return {
+        "question": item['question'],
+        "generated_answer": data['answer'],
+        "gold_answer": item['gold_answer'],
+        "confidence": data['confidence'],
+        "correct_abstention": is_correct_abstention,
+        "latency": latency
+    }
 
+def run_sequential(eval_data: list[dict]) -> list[dict]:
     results = []
-    print(f"Running evaluation against {len(eval_data)} questions...")
     for item in eval_data:
         question = item['question']
-        
+
         try:
             payload = {"query": question}
+            start = time.perf_counter()
             response = requests.post(API_URL, json=payload, timeout=900)
             response.raise_for_status()
-            data = response.json()
-            
-            # Check if the system correctly abstained
-            is_correct_abstention = (item['gold_answer'] == "ABSTAIN" and "cannot answer" in data['answer'])
-            
-            results.append({
-                "question": question,
-                "generated_answer": data['answer'],
-                "gold_answer": item['gold_answer'],
-                "confidence": data['confidence'],
-                "correct_abstention": is_correct_abstention
-            })
+            results.append(score_item(item, response.json(), time.perf_counter() - start))
         except requests.exceptions.RequestException as e:
             print(f"Failed to process question: '{question}'. Error: {e}")
+    return results
+
+def run_concurrent(eval_data: list[dict], batch_size: int, workers: int) -> list[dict]:
+    """
+    Sends the questions to /ask/batch, `batch_size` per request and `workers` requests at a time.
+    A question's latency is the time from its batch's arrival until its own answer was ready.
+    """
+    batches = [eval_data[i:i + batch_size] for i in range(0, len(eval_data), batch_size)]
+
+    def run_batch(batch):
+        try:
+            response = requests.post(BATCH_API_URL, json={"queries": [item['question'] for item in batch]}, timeout=900)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to process a batch of {len(batch)} questions. Error: {e}")
+            return []
+        return [
+            score_item(item, data, float(data['timings']['total'].rstrip('s')))
+            for item, data in zip(batch, response.json()['results'])
+        ]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [result for batch_results in pool.map(run_batch, batches) for result in batch_results]
+
+def main(args):
+    try:
+        with open(EVAL_QUESTIONS_PATH, 'r') as f:
+            eval_data = [json.loads(line) for line in f]
+    except FileNotFoundError:
+        print(f"Error: Evaluation file not found at {EVAL_QUESTIONS_PATH}")
+        return
+
+    print(f"Running evaluation against {len(eval_data)} questions...")
+    start = time.perf_counter()
+    if args.concurrent:
+        results = run_concurrent(eval_data, args.batch_size, args.workers)
+    else:
+        results = run_sequential(eval_data)
+    wall_time = time.perf_counter() - start
+    if not results:
+        print("No questions were answered.")
+        return
 
     # Display results
     df = pd.DataFrame(results)
     print("\n--- Evaluation Results ---")
-    print(df[['question', 'confidence', 'correct_abstention']])
+    print(df[['question', 'confidence', 'correct_abstention', 'latency']])
 
     # Calculate overall metrics
     abstain_questions = df[df['gold_answer'] == 'ABSTAIN']
@@ -50,5 +91,13 @@ def main():
     else:
         print("\nNo abstention questions in eval set.")
 
+    latency = df['latency']
+    print(f"Latency: p50 {latency.quantile(0.5):.2f}s, p95 {latency.quantile(0.95):.2f}s, max {latency.max():.2f}s")
+    print(f"Wall time: {wall_time:.2f}s for {len(df)} questions")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Evaluate the RAG API on eval/questions.jsonl.")
+    parser.add_argument("--concurrent", action="store_true", help="Use /ask/batch with several batches in flight.")
+    parser.add_argument("--batch-size", type=int, default=8, help="Questions per /ask/batch request.")
+    parser.add_argument("--workers", type=int, default=2, help="Batch requests in flight at once.")
+    main(parser.parse_args())
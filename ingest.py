@@ -1,18 +1,29 @@
 import os
 import json
+import time
+import argparse
 import hashlib
-import pickle
-import chromadb
-from sentence_transformers import SentenceTransformer
-from rank_bm25 import BM25Okapi
 
 from ingestion.parsers import PARSER_MAPPING
-from ingestion.chunking import chunking_strategy_A # Or chunking_strategy_B
+from ingestion.pipeline import IngestionPipeline, chunk_file, file_metadata
+from ingestion.embedding_cache import EmbeddingCache
+from ingestion.incremental import LocalIndexes, diff_file_chunks, apply_file_diff, backfill_file_metadata
 
 CORPUS_PATH = "corpus"
 DB_PATH = "db"
 HASHES_PATH = "hashes.json"
-BM25_INDEX_PATH = "bm25_index.pkl"
+LEXICAL_INDEX_PATH = "lexical_index"
+# Texts and metadata for the retriever, aligned with the BM25 index positions
+CHUNK_STORE_PATH = "chunk_store"
+# Memory-mapped embeddings (and IVF lists) for DENSE_BACKEND=flat/ivf, same positions again
+VECTOR_INDEX_PATH = "vector_index"
+# Embeddings keyed by (model, chunk content hash), reused across files and runs
+EMBEDDING_CACHE_PATH = "embedding_cache.sqlite"
+# Stamp read by the API's caches; a new version invalidates everything cached before it
+CORPUS_VERSION_PATH = "corpus_version.json"
+# Part of the version stamp; bumped when stored chunk metadata changes shape (2: file_type and
+# modified_at), so serving processes reload the backfilled indexes although no file changed
+METADATA_VERSION = 2
 # This is the model we'll use to create numerical representations of our text
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
@@ -28,6 +39,16 @@ def save_hashes(hashes):
     with open(HASHES_PATH, 'w') as f:
         json.dump(hashes, f, indent=4)
 
+def save_corpus_version(hashes):
+    """Writes a version stamp derived from the file hashes so readers can detect corpus changes."""
+    stamped = {"hashes": hashes, "metadata_version": METADATA_VERSION}
+    version = hashlib.sha256(json.dumps(stamped, sort_keys=True).encode('utf-8')).hexdigest()
+    tmp_path = CORPUS_VERSION_PATH + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"version": version, "updated_at": time.time()}, f, indent=4)
+    os.replace(tmp_path, CORPUS_VERSION_PATH)
+    return version
+
 def get_file_hash(file_path):
     """Calculates the SHA256 hash of a file's content."""
     hasher = hashlib.sha256()
@@ -36,7 +57,41 @@ def get_file_hash(file_path):
         hasher.update(buf)
     return hasher.hexdigest()
 
-def main():
+def run_pipelined(files_to_process, collection, model, embedding_cache, indexes, processed_files_hashes, current_files_hashes, args):
+    """
+    Parses on a process pool and embeds/upserts in batches, checkpointing as files complete.
+    Returns the files that are done (stored, or skipped as unsupported), or None if the run stopped early.
+    """
+    supported = [f for f in files_to_process if os.path.splitext(f)[1].lower() in PARSER_MAPPING]
+    for file_path in files_to_process:
+        if file_path not in supported:
+            print(f"--> Skipping {file_path} (unsupported)")
+            processed_files_hashes[file_path] = current_files_hashes[file_path]
+
+    def checkpoint(completed_files):
+        # Only fully stored files are marked as processed, so an interrupted run resumes where it stopped
+        for file_path in completed_files:
+            processed_files_hashes[file_path] = current_files_hashes[file_path]
+        indexes.save()
+        save_hashes(processed_files_hashes)
+        save_corpus_version(processed_files_hashes)
+
+    pipeline = IngestionPipeline(
+        collection, model, embedding_cache, indexes, checkpoint,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size
+    )
+    if not pipeline.run(supported):
+        return None
+    return pipeline.finished_files | (set(files_to_process) - set(supported))
+
+def main(args):
+    # Heavy imports live here so '--help' and the spawned parser workers (which re-import
+    # this module) don't pay for torch and chromadb
+    import chromadb
+    from sentence_transformers import SentenceTransformer
+
     print("Starting ingestion process...")
     
     # Initialize ChromaDB client and collection
@@ -46,6 +101,7 @@ def main():
     # Load the embedding model (this will download it on the first run)
     print(f"Loading embedding model: {EMBEDDING_MODEL}...")
     model = SentenceTransformer(EMBEDDING_MODEL)
+    embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_MODEL)
     print("Model loaded.")
 
     processed_files_hashes = load_hashes()
@@ -66,10 +122,41 @@ def main():
                 print(f"  - DETECTED CHANGE in {file_name}")
                 files_to_process.append(file_path)
     
+    # Indexes written before the vector index existed get it built from the stored embeddings
+    vector_index_missing = not os.path.exists(os.path.join(VECTOR_INDEX_PATH, "meta.json"))
+    indexes = LocalIndexes.load(collection, LEXICAL_INDEX_PATH, CHUNK_STORE_PATH, VECTOR_INDEX_PATH)
+
+    # Chunks of unchanged files stored by an older version lack the fields filters match on
+    unchanged_files = [f for f in current_files_hashes if f not in files_to_process]
+    backfilled = backfill_file_metadata(collection, indexes, {os.path.basename(f): file_metadata(f) for f in unchanged_files})
+    if backfilled:
+        print(f"Added file_type and modified_at to {backfilled} previously stored chunks.")
+
     if not files_to_process:
+        if vector_index_missing or backfilled:
+            indexes.save()
+            print(f"Indexes saved to {LEXICAL_INDEX_PATH}, {CHUNK_STORE_PATH} and {VECTOR_INDEX_PATH}")
+            version = save_corpus_version(processed_files_hashes)
+            print(f"Corpus version is now {version[:12]}")
         print("No file changes detected. Ingestion is up-to-date.")
         return
 
+    if args.pipelined:
+        finished = run_pipelined(files_to_process, collection, model, embedding_cache, indexes, processed_files_hashes, current_files_hashes, args)
+        if finished is None:
+            print("Ingestion stopped early; run it again to resume.")
+            return
+        # Files that failed to parse keep no hash, so the next run retries them
+        failed = [f for f in files_to_process if f not in finished]
+        if failed:
+            print(f"{len(failed)} file(s) failed and will be retried on the next run.")
+        hashes = {f: h for f, h in current_files_hashes.items() if f not in failed}
+        save_hashes(hashes)
+        version = save_corpus_version(hashes)
+        print(f"Corpus version is now {version[:12]}")
+        print("Ingestion process finished successfully.")
+        return
+
     # --- 2. Process and chunk changed files ---
     for file_path in files_to_process:
         file_ext = os.path.splitext(file_path)[1].lower()
@@ -77,49 +164,50 @@ def main():
             print(f"--> Skipping {file_path} (unsupported)")
             continue
         
-        # Delete old chunks from this file if it was processed before
-        if file_path in processed_files_hashes:
-            print(f"  - Deleting old entries for {os.path.basename(file_path)}...")
-            collection.delete(where={"source": os.path.basename(file_path)})
-
         print(f"--> Parsing and chunking {file_path}...")
-        parser_func = PARSER_MAPPING[file_ext]
-        text, _ = parser_func(file_path)
-        
-        # We choose our chunking strategy here
-        chunks = chunking_strategy_A(text, source=os.path.basename(file_path))
-        all_chunked_docs.extend(chunks)
-        print(f"    - Created {len(chunks)} chunks.")
+        # Text files go through the chunking strategy, tables are split into row groups
+        chunks = chunk_file(file_path)
+
+        # Only chunks whose content changed are deleted, embedded and added
+        new_chunks, removed_ids, kept_chunks = diff_file_chunks(collection, indexes, os.path.basename(file_path), chunks)
+        apply_file_diff(collection, indexes, removed_ids, kept_chunks)
+        all_chunked_docs.extend(new_chunks)
+        print(f"    - Created {len(chunks)} chunks ({len(new_chunks)} new, {len(kept_chunks)} unchanged, {len(removed_ids)} removed).")
 
     # --- 3. Generate embeddings and add to ChromaDB ---
+    embeddings = []
     if all_chunked_docs:
         print(f"Generating embeddings for {len(all_chunked_docs)} chunks...")
         
-        chunk_texts = [doc['text'] for doc in all_chunked_docs]
-        embeddings = model.encode(chunk_texts, show_progress_bar=True).tolist()
+        embeddings = embedding_cache.embed(model, all_chunked_docs)
+        print(f"    - {embedding_cache.hits} embeddings reused from cache, {embedding_cache.misses} computed.")
         
         print("Adding documents to vector store...")
-        collection.add(
+        # Upsert: a chunk stored by an interrupted run may already be in Chroma
+        collection.upsert(
             ids=[doc['id'] for doc in all_chunked_docs],
             documents=[doc['text'] for doc in all_chunked_docs],
             metadatas=[doc['metadata'] for doc in all_chunked_docs],
             embeddings=embeddings
         )
     
-    # --- 4. Create and save BM25 index ---
-    print("Updating lexical (BM25) index...")
-    # We need all documents in the collection for a complete BM25 index
-    all_docs_in_db = collection.get(include=["documents"])
-    tokenized_corpus = [doc.split(" ") for doc in all_docs_in_db['documents']]
-    bm25 = BM25Okapi(tokenized_corpus)
-    
-    with open(BM25_INDEX_PATH, 'wb') as f:
-        pickle.dump(bm25, f)
-    print(f"BM25 index saved to {BM25_INDEX_PATH}")
+    # --- 4. Update and save BM25 index, chunk store and vector index ---
+    # Only new chunks are tokenized; vanished ones were removed in step 2
+    print("Updating lexical (BM25) index, chunk store and vector index...")
+    indexes.add_chunks(all_chunked_docs, embeddings)
+    indexes.save()
+    print(f"BM25 index ({len(indexes)} documents, {len(indexes.bm25.vocab)} terms) saved to {LEXICAL_INDEX_PATH}, chunks to {CHUNK_STORE_PATH}, vectors to {VECTOR_INDEX_PATH}")
         
     # --- 5. Save the new hashes ---
     save_hashes(current_files_hashes)
+    version = save_corpus_version(current_files_hashes)
+    print(f"Corpus version is now {version[:12]}")
     print("Ingestion process finished successfully.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ingest the corpus into the vector store and BM25 index.")
+    parser.add_argument("--pipelined", action="store_true", help="Parse files in parallel and embed/upsert in streaming batches.")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes for --pipelined (default: CPU count).")
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks per embedding/upsert batch for --pipelined.")
+    parser.add_argument("--queue-size", type=int, default=8, help="Parsed files allowed to wait for embedding in --pipelined mode.")
+    main(parser.parse_args())
\ No newline at end of file
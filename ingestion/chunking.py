@@ -1,34 +1,209 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import os
 import re
+import hashlib
+from collections import deque
+from dotenv import load_dotenv
 
-def chunking_strategy_A(text: str, source: str) -> list[dict]:
+load_dotenv()
+
+# --- Chunking settings ---
+# Chunk size and overlap, measured in CHUNK_LENGTH units: "chars", or "tokens" of CHUNK_TOKENIZER
+# (the embedding model's tokenizer; all-MiniLM-L6-v2 reads at most 256 tokens, so use CHUNK_SIZE=256)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 1000))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 200))
+CHUNK_LENGTH = os.getenv("CHUNK_LENGTH", "chars")
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "sentence-transformers/all-MiniLM-L6-v2")
+
+# Break points from coarse to fine: paragraphs, lines, sentences (ending punctuation and any
+# closing quotes/brackets), words. The separator stays with the text before it.
+BOUNDARIES = [
+    re.compile(r"\n[ \t]*\n\s*"),
+    re.compile(r"\n\s*"),
+    re.compile(r"(?<=[.!?])[\"')\]]*\s+"),
+    re.compile(r"\s+"),
+]
+# Parsers write Markdown and HTML headings as "#"-prefixed lines
+HEADING = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+SECTION_SEPARATOR = " > "
+
+
+def chunk_hash(text: str) -> str:
+    """Content address of a chunk; identical text gets the same hash in every file."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def build_chunk_docs(chunks: list[str], source: str, metadatas: list[dict] | None = None) -> list[dict]:
+    """
+    Structures chunk texts with metadata. IDs are derived from the chunk content, so an
+    unchanged chunk keeps its ID when the rest of the file is edited. A repeated chunk
+    within the same file gets an occurrence suffix to keep IDs unique.
     """
-    Strategy A: Simple sliding window using RecursiveCharacterTextSplitter.
-    """
-    # This splitter tries to keep paragraphs, then sentences, then words together.
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len,
-    )
-    chunks = splitter.split_text(text)
-    
-    # Structure the chunks with metadata
     chunked_docs = []
+    seen = {}
     for i, chunk_text in enumerate(chunks):
+        digest = chunk_hash(chunk_text)
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        chunk_id = f"{source}-{digest[:16]}" + (f"-{occurrence}" if occurrence else "")
         chunked_docs.append({
-            "id": f"{source}-{i}",
+            "id": chunk_id,
             "text": chunk_text,
-            "metadata": {"source": source, "chunk_num": i}
+            "metadata": {"source": source, "chunk_num": i, "chunk_hash": digest, **(metadatas[i] if metadatas else {})}
         })
     return chunked_docs
 
+
+class TextChunker:
+    """
+    Single-pass splitter. The text is cut into paragraphs; only a paragraph longer than a
+    chunk is cut further, into lines, then sentences, then words (and an over-long word by
+    characters). Each piece is measured once and the pieces are packed greedily into chunks
+    of at most `chunk_size`; the trailing pieces of a chunk (up to `chunk_overlap`) start
+    the next one.
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP, length_function=len):
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"Chunk overlap ({chunk_overlap}) must be smaller than the chunk size ({chunk_size}).")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length = length_function
+
+    def split(self, text: str) -> list[str]:
+        chunks = []
+        window = deque()  # (piece, length) of the chunk being built
+        total = 0
+        fresh = 0  # Pieces in the window that no earlier chunk contains
+        for piece, length in self._pieces(text):
+            if total + length > self.chunk_size:
+                if fresh:
+                    self._emit(chunks, window)
+                    fresh = 0
+                    # Keep the tail as overlap, as long as the next piece still fits after it
+                    while window and (total > self.chunk_overlap or total + length > self.chunk_size):
+                        total -= window.popleft()[1]
+                else:
+                    while window and total + length > self.chunk_size:
+                        total -= window.popleft()[1]
+            window.append((piece, length))
+            total += length
+            fresh += 1
+        if fresh:
+            self._emit(chunks, window)
+        return chunks
+
+    @staticmethod
+    def _emit(chunks: list[str], window: deque):
+        chunk = "".join(piece for piece, _ in window).strip()
+        if chunk:
+            chunks.append(chunk)
+
+    def _pieces(self, text: str, level: int = 0):
+        start = 0
+        for match in BOUNDARIES[level].finditer(text):
+            piece = text[start:match.end()]
+            start = match.end()
+            length = self.length(piece)
+            if length <= self.chunk_size:
+                yield piece, length  # The common case, kept inline: most paragraphs fit
+            else:
+                yield from self._split_piece(piece, length, level + 1)
+        if start < len(text):
+            piece = text[start:]
+            length = self.length(piece)
+            if length <= self.chunk_size:
+                yield piece, length
+            else:
+                yield from self._split_piece(piece, length, level + 1)
+
+    def _split_piece(self, piece: str, length: int, level: int):
+        if level < len(BOUNDARIES):
+            yield from self._pieces(piece, level)
+            return
+        # No break point at all (a URL, a table cell run together): cut by characters
+        step = max(1, len(piece) * self.chunk_size // length)
+        for i in range(0, len(piece), step):
+            yield piece[i:i + step], self.length(piece[i:i + step])
+
+
+def split_sections(text: str) -> list[tuple[tuple, str]]:
+    """Splits text at heading lines into (heading path, section text); each section starts with its heading."""
+    sections, stack, start = [], [], 0
+    for match in HEADING.finditer(text):
+        if match.start() > start:
+            sections.append((tuple(title for _, title in stack), text[start:match.start()]))
+        level = len(match.group(1))
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+        stack.append((level, match.group(2).strip()))
+        start = match.start()
+    sections.append((tuple(title for _, title in stack), text[start:]))
+    return sections
+
+
+def _common_path(paths: list[tuple]) -> tuple:
+    common = paths[0]
+    for path in paths[1:]:
+        size = 0
+        while size < min(len(common), len(path)) and common[size] == path[size]:
+            size += 1
+        common = common[:size]
+    return common
+
+
+_default_chunker = None
+
+def default_chunker() -> TextChunker:
+    """The configured chunker, built once per process (loading a tokenizer is not free)."""
+    global _default_chunker
+    if _default_chunker is None:
+        length_function = len
+        if CHUNK_LENGTH == "tokens":
+            from core.context import TokenCounter
+            length_function = TokenCounter(CHUNK_TOKENIZER).count
+        _default_chunker = TextChunker(CHUNK_SIZE, CHUNK_OVERLAP, length_function)
+    return _default_chunker
+
+def chunking_strategy_A(text: str, source: str) -> list[dict]:
+    """
+    Strategy A: Sliding window over sentence and line boundaries.
+    """
+    return build_chunk_docs(default_chunker().split(text), source)
+
 def chunking_strategy_B(text: str, source: str) -> list[dict]:
     """
     Strategy B: Heading-aware splitting.
-    First splits by markdown/HTML headings, then uses recursive splitting on those sections.
-    This is a placeholder for a more complex strategy. For now, it's the same as A.
-    In a real project, you would add regex splitting for headings here.
+    Chunks never span two sections unless whole small sections fit in one chunk together;
+    a section longer than a chunk is split with strategy A's chunker. Each chunk records
+    the headings it sits under as section_path ("Title > Section > Subsection"), the
+    common part of the sections it holds.
     """
-    
-    return chunking_strategy_A(text, source) # Fallback to Strategy A for simplicity
\ No newline at end of file
+    chunker = default_chunker()
+    chunks, paths = [], []
+    group, group_paths, group_length = [], [], 0
+
+    def flush():
+        nonlocal group, group_paths, group_length
+        if group:
+            chunks.append("".join(group).strip())
+            paths.append(_common_path(group_paths))
+        group, group_paths, group_length = [], [], 0
+
+    for path, section in split_sections(text):
+        if not section.strip():
+            continue
+        length = chunker.length(section)
+        if length > chunker.chunk_size:
+            flush()
+            pieces = chunker.split(section)
+            chunks.extend(pieces)
+            paths.extend([path] * len(pieces))
+            continue
+        if group_length + length > chunker.chunk_size:
+            flush()
+        group.append(section)
+        group_paths.append(path)
+        group_length += length
+    flush()
+
+    metadatas = [{"section_path": SECTION_SEPARATOR.join(path)} for path in paths]
+    return build_chunk_docs(chunks, source, metadatas)
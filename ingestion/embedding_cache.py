@@ -0,0 +1,70 @@
+import sqlite3
+import threading
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding store keyed by (embedding model, chunk content hash).
+
+    Chunks whose text has been embedded before, in this file or any other, are served
+    from the cache, so re-ingestion only runs the model on genuinely new text.
+    """
+
+    def __init__(self, path: str, model_name: str):
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        # The pipelined ingester calls in from its embedding thread
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, chunk_hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, chunk_hash))"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, hashes: list[str]) -> dict[str, np.ndarray]:
+        found = {}
+        unique = list(set(hashes))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT chunk_hash, vector FROM embeddings WHERE model = ? AND chunk_hash IN ({placeholders})",
+                    [self.model_name, *part]
+                )
+                for digest, blob in rows:
+                    found[digest] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, hashes: list[str], vectors: np.ndarray):
+        rows = [(self.model_name, digest, np.asarray(vec, dtype=np.float32).tobytes()) for digest, vec in zip(hashes, vectors)]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (model, chunk_hash, vector) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def embed(self, model, chunks: list[dict], batch_size: int = 32) -> list[list[float]]:
+        """Returns one embedding per chunk, running the model only on cache misses."""
+        hashes = [chunk['metadata']['chunk_hash'] for chunk in chunks]
+        cached = self.get_many(hashes)
+
+        # Identical texts are embedded once even within the same batch
+        missing = {}
+        for chunk, digest in zip(chunks, hashes):
+            if digest not in cached and digest not in missing:
+                missing[digest] = chunk['text']
+        if missing:
+            vectors = model.encode(list(missing.values()), batch_size=batch_size, show_progress_bar=len(missing) > batch_size)
+            self.put_many(list(missing.keys()), vectors)
+            cached.update({digest: np.asarray(vec, dtype=np.float32) for digest, vec in zip(missing.keys(), vectors)})
+
+        self.hits += len(chunks) - len(missing)
+        self.misses += len(missing)
+        return [cached[digest].tolist() for digest in hashes]
+
+    def close(self):
+        self._conn.close()
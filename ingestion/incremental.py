@@ -0,0 +1,145 @@
+import os
+import numpy as np
+
+from core.lexical import BM25Index
+from core.chunk_store import ChunkStore
+from core.vector_index import VectorIndex
+
+
+# Per-chunk unique values that retrieval never reads; storing them would only bloat the store
+STORE_EXCLUDED_METADATA = ("chunk_hash",)
+
+# Set on every chunk from its file (see ingestion.pipeline.file_metadata)
+FILE_METADATA_FIELDS = ("file_type", "modified_at")
+
+def _store_metadata(metadata: dict) -> dict:
+    return {k: v for k, v in metadata.items() if k not in STORE_EXCLUDED_METADATA}
+
+
+class LocalIndexes:
+    """
+    The indexes ingest.py maintains next to Chroma: the BM25 index, the chunk store and the
+    memory-mapped vector index. Every change is applied to all three in the same order,
+    which keeps their positions aligned.
+    """
+
+    def __init__(self, bm25: BM25Index, chunk_store: ChunkStore, vectors: VectorIndex,
+                 lexical_path: str, chunk_store_path: str, vector_path: str):
+        self.bm25 = bm25
+        self.chunk_store = chunk_store
+        self.vectors = vectors
+        self.lexical_path = lexical_path
+        self.chunk_store_path = chunk_store_path
+        self.vector_path = vector_path
+
+    @classmethod
+    def load(cls, collection, lexical_path: str, chunk_store_path: str, vector_path: str) -> "LocalIndexes":
+        """Loads the indexes, or builds them from the vector store if they are missing or out of sync."""
+        if os.path.exists(os.path.join(lexical_path, "meta.json")) and os.path.exists(os.path.join(chunk_store_path, "meta.json")):
+            bm25 = BM25Index.load(lexical_path, mmap=False)
+            chunk_store = ChunkStore.load(chunk_store_path, mmap=False)
+            if bm25.chunk_ids == chunk_store.chunk_ids:
+                vectors = cls._load_vectors(collection, vector_path, chunk_store.chunk_ids)
+                return cls(bm25, chunk_store, vectors, lexical_path, chunk_store_path, vector_path)
+            print("Lexical index and chunk store disagree; rebuilding both.")
+        # First run (or indexes written by an older version): index what's already stored
+        existing = collection.get(include=["documents", "metadatas", "embeddings"])
+        sources = [meta.get("source", "unknown") for meta in existing['metadatas']]
+        bm25 = BM25Index.build(existing['ids'], existing['documents'], sources)
+        chunk_store = ChunkStore.build(existing['ids'], existing['documents'], [_store_metadata(m) for m in existing['metadatas']])
+        vectors = VectorIndex.build(existing['ids'], existing['embeddings'])
+        return cls(bm25, chunk_store, vectors, lexical_path, chunk_store_path, vector_path)
+
+    @staticmethod
+    def _load_vectors(collection, vector_path: str, chunk_ids: list[str]) -> VectorIndex:
+        if os.path.exists(os.path.join(vector_path, "meta.json")):
+            vectors = VectorIndex.load(vector_path, mmap=False)
+            if vectors.chunk_ids == chunk_ids:
+                return vectors
+        # Written before the vector index existed: copy the embeddings Chroma already holds
+        print("Building the vector index from the vector store...")
+        existing = collection.get(ids=chunk_ids, include=["embeddings"]) if chunk_ids else {"ids": [], "embeddings": []}
+        embedding_of = dict(zip(existing['ids'], existing['embeddings']))
+        return VectorIndex.build(chunk_ids, [embedding_of[chunk_id] for chunk_id in chunk_ids])
+
+    def source_ids(self, source: str) -> set[str]:
+        """IDs of one file's chunks in the local indexes (what search actually sees)."""
+        positions = np.flatnonzero(self.chunk_store.values_mask("source", [source]))
+        return {self.chunk_store.chunk_ids[p] for p in positions}
+
+    def remove_ids(self, chunk_ids: list[str]):
+        self.bm25.remove_ids(chunk_ids)
+        self.chunk_store.remove_ids(chunk_ids)
+        self.vectors.remove_ids(chunk_ids)
+
+    def update_metadata(self, chunks: list[dict]):
+        self.chunk_store.update_metadata([c['id'] for c in chunks], [_store_metadata(c['metadata']) for c in chunks])
+
+    def add_chunks(self, chunks: list[dict], embeddings):
+        ids = [c['id'] for c in chunks]
+        texts = [c['text'] for c in chunks]
+        self.bm25.add_documents(ids, texts, [c['metadata']['source'] for c in chunks])
+        self.chunk_store.add(ids, texts, [_store_metadata(c['metadata']) for c in chunks])
+        self.vectors.add(ids, embeddings)
+
+    def save(self):
+        self.bm25.save(self.lexical_path)
+        self.chunk_store.save(self.chunk_store_path)
+        self.vectors.save(self.vector_path)
+
+    def __len__(self) -> int:
+        return len(self.chunk_store)
+
+
+def diff_file_chunks(collection, indexes: LocalIndexes, source: str, chunks: list[dict]) -> tuple[list[dict], list[str], list[dict]]:
+    """
+    Compares freshly chunked file contents with what the vector store and the local indexes
+    hold for that file. Returns (new chunks to embed, ids of chunks to remove, unchanged chunks).
+    Chunk IDs are content hashes, so an unchanged chunk has the same ID as before.
+
+    A chunk counts as unchanged only if both sides hold it. An interrupted run can leave a
+    chunk in Chroma but not yet in the local indexes (or the reverse); such a chunk is stored
+    again, after its partial copy is removed from the local indexes.
+    """
+    stored_ids = set(collection.get(where={"source": source}, include=[])['ids'])
+    local_ids = indexes.source_ids(source)
+    complete_ids = stored_ids & local_ids
+
+    new_ids = {chunk['id'] for chunk in chunks}
+    new_chunks = [chunk for chunk in chunks if chunk['id'] not in complete_ids]
+    kept_chunks = [chunk for chunk in chunks if chunk['id'] in complete_ids]
+    removed_ids = sorted((stored_ids - new_ids) | (local_ids - complete_ids))
+    return new_chunks, removed_ids, kept_chunks
+
+def apply_file_diff(collection, indexes: LocalIndexes, removed_ids: list[str], kept_chunks: list[dict]):
+    """Deletes vanished chunks and refreshes metadata (e.g. chunk_num) of unchanged ones without re-embedding."""
+    if removed_ids:
+        collection.delete(ids=removed_ids)
+        indexes.remove_ids(removed_ids)
+    if kept_chunks:
+        collection.update(
+            ids=[chunk['id'] for chunk in kept_chunks],
+            metadatas=[chunk['metadata'] for chunk in kept_chunks]
+        )
+        indexes.update_metadata(kept_chunks)
+
+def backfill_file_metadata(collection, indexes: LocalIndexes, metadata_of: dict[str, dict]) -> int:
+    """
+    Adds the per-file metadata (file_type, modified_at) to chunks stored before ingestion
+    recorded it; filters on those fields would never match such chunks. `metadata_of` maps
+    a source to its file's metadata. Returns the number of chunks updated.
+    """
+    store = indexes.chunk_store
+    complete = np.ones(len(store), dtype=bool)
+    for name in FILE_METADATA_FIELDS:
+        complete &= store.present_mask(name)
+    positions = np.flatnonzero(~complete & store.values_mask("source", list(metadata_of)))
+    chunk_ids = [store.chunk_ids[p] for p in positions]
+    if not chunk_ids:
+        return 0
+    # Chroma's stored metadata also holds the fields the chunk store leaves out
+    stored = collection.get(ids=chunk_ids, include=["metadatas"])
+    metadatas = [{**metadata, **metadata_of[metadata["source"]]} for metadata in stored['metadatas']]
+    collection.update(ids=stored['ids'], metadatas=metadatas)
+    store.update_metadata(stored['ids'], [_store_metadata(m) for m in metadatas])
+    return len(stored['ids'])
@@ -1,6 +1,7 @@
 
 import os
-import pandas as pd
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from pypdf import PdfReader
 from PIL import Image
 import pytesseract
@@ -8,35 +9,140 @@ from pdf2image import convert_from_path
 from bs4 import BeautifulSoup
 from markdown_it import MarkdownIt
 
+from ingestion.tabular import read_csv_batches, format_rows
+
+# --- OCR settings ---
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "ocr_cache")
+OCR_DPI = int(os.getenv("OCR_DPI", 200))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+# Pages rasterized per pdftoppm call; bounds how many page images are held in memory
+OCR_RASTER_BATCH = int(os.getenv("OCR_RASTER_BATCH", 16))
+
+def _page_fingerprint(page, file_hash: str, page_num: int) -> str:
+    """
+    Hashes what a page is drawn from (its content stream and embedded image data), so an
+    unchanged page keeps its OCR cache entry even when other pages of the PDF are edited.
+    Falls back to the file hash and page number if the page structure can't be read.
+    """
+    try:
+        hasher = hashlib.sha256()
+        contents = page.get_contents()
+        if contents is not None:
+            hasher.update(contents.get_data())
+        xobjects = page.get("/Resources", {}).get_object().get("/XObject", {})
+        for name in sorted(xobjects.get_object().keys()):
+            hasher.update(name.encode("utf-8"))
+            hasher.update(xobjects[name].get_object().get_data())
+        return hasher.hexdigest()
+    except Exception:
+        return hashlib.sha256(f"{file_hash}:{page_num}".encode("utf-8")).hexdigest()
+
+def _ocr_cache_path(fingerprint: str) -> str:
+    key = hashlib.sha256(f"{fingerprint}:{OCR_DPI}:{OCR_LANG}".encode("utf-8")).hexdigest()
+    return os.path.join(OCR_CACHE_DIR, key[:2], f"{key}.txt")
+
+def _read_ocr_cache(path: str) -> str | None:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _write_ocr_cache(path: str, text: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def _page_runs(page_indices: list[int], max_run: int) -> list[tuple[int, int]]:
+    """Groups sorted page indices into contiguous (first, last) runs of at most max_run pages."""
+    runs = []
+    for i in page_indices:
+        if runs and i == runs[-1][1] + 1 and i - runs[-1][0] < max_run:
+            runs[-1] = (runs[-1][0], i)
+        else:
+            runs.append((i, i))
+    return runs
+
+def _ocr_pages(file_path: str, page_indices: list[int]) -> dict[int, str]:
+    """Rasterizes the pages in contiguous runs and OCRs them on a thread pool."""
+    results = {}
+
+    def ocr_image(i, image):
+        try:
+            return i, pytesseract.image_to_string(image, lang=OCR_LANG)
+        except Exception as e:
+            print(f"Warning: OCR failed for page {i+1} in {file_path}: {e}")
+            return i, None
+
+    with ThreadPoolExecutor(max_workers=OCR_WORKERS) as pool:
+        previous = []
+        for first, last in _page_runs(page_indices, OCR_RASTER_BATCH):
+            try:
+                # One pdftoppm call per run instead of one per page
+                images = convert_from_path(file_path, dpi=OCR_DPI, first_page=first + 1, last_page=last + 1)
+            except Exception as e:
+                print(f"Warning: could not rasterize pages {first+1}-{last+1} in {file_path}: {e}")
+                continue
+            current = [pool.submit(ocr_image, first + offset, image) for offset, image in enumerate(images)]
+            # Let this run's OCR overlap with rasterizing the next one, but no further,
+            # so at most two runs of page images are alive at a time
+            for future in previous:
+                i, text = future.result()
+                results[i] = text
+            previous = current
+        for future in previous:
+            i, text = future.result()
+            results[i] = text
+    return results
+
 def parse_pdf_ocr(file_path: str) -> tuple[str, dict]:
     """
     Parses a PDF file, attempting OCR as a fallback for scanned pages.
+    OCR output is cached per page under OCR_CACHE_DIR, so re-ingesting skips pages already seen.
     Returns the text content and metadata.
     """
     reader = PdfReader(file_path)
-    text_content = ""
-    is_scanned = False
+    with open(file_path, 'rb') as f:
+        file_hash = hashlib.sha256(f.read()).hexdigest()
 
+    page_texts = []
+    to_ocr = []  # (page index, cache path)
+    is_scanned = False
     for i, page in enumerate(reader.pages):
         page_text = page.extract_text()
         # If text extraction is poor (e.g., < 100 chars), assume it's scanned
         if page_text is None or len(page_text.strip()) < 100:
             is_scanned = True
-            try:
-                # Convert PDF page to an image
-                images = convert_from_path(file_path, first_page=i + 1, last_page=i + 1)
-                if images:
-                    # Perform OCR on the image
-                    page_text = pytesseract.image_to_string(images[0])
-            except Exception as e:
-                print(f"Warning: OCR failed for page {i+1} in {file_path}: {e}")
-                page_text = "" # Assign empty string if OCR fails
-        
-        text_content += page_text + "\n"
+            cache_path = _ocr_cache_path(_page_fingerprint(page, file_hash, i))
+            cached = _read_ocr_cache(cache_path)
+            if cached is None:
+                to_ocr.append((i, cache_path))
+            page_text = cached
+        page_texts.append(page_text)
+
+    if to_ocr:
+        print(f"    - Running OCR on {len(to_ocr)} page(s) of {os.path.basename(file_path)}...")
+        ocr_results = _ocr_pages(file_path, [i for i, _ in to_ocr])
+        for i, cache_path in to_ocr:
+            text = ocr_results.get(i)
+            if text is not None:
+                _write_ocr_cache(cache_path, text)
+            page_texts[i] = text or "" # Assign empty string if OCR fails
 
+    text_content = "".join(page_text + "\n" for page_text in page_texts)
     metadata = {"source": os.path.basename(file_path), "is_scanned": is_scanned}
     return text_content, metadata
 
+def _mark_headings(soup: BeautifulSoup):
+    """Rewrites <h1>-<h6> as "#"-prefixed lines, so heading-aware chunking can find them in the text."""
+    for heading in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6"]):
+        title = heading.get_text(" ", strip=True)
+        if title:
+            heading.string = "#" * int(heading.name[1]) + " " + title
+
 def parse_html(file_path: str) -> tuple[str, dict]:
     """Parses an HTML file, extracts text and title."""
     with open(file_path, 'r', encoding='utf-8') as f:
@@ -45,6 +151,7 @@ def parse_html(file_path: str) -> tuple[str, dict]:
     # Remove script and style elements
     for script_or_style in soup(['script', 'style']):
         script_or_style.decompose()
+    _mark_headings(soup)
     
     text_content = soup.get_text(separator='\n', strip=True)
     title = soup.title.string if soup.title else "No Title"
@@ -59,17 +166,19 @@ def parse_md(file_path: str) -> tuple[str, dict]:
     md = MarkdownIt()
     html_content = md.render(md_content)
     soup = BeautifulSoup(html_content, 'html.parser')
+    _mark_headings(soup)
     text_content = soup.get_text(separator='\n', strip=True)
     metadata = {"source": os.path.basename(file_path)}
     return text_content, metadata
 
 def parse_csv(file_path: str) -> tuple[str, dict]:
-    """Parses a CSV file, converting each row into a text string."""
-    df = pd.read_csv(file_path)
-    text_content = ""
-    for index, row in df.iterrows():
-        row_text = ", ".join([f"{col}: {val}" for col, val in row.items()])
-        text_content += row_text + "\n\n"
+    """
+    Parses a CSV file, converting each row into a text string. Ingestion chunks CSVs by
+    row groups instead (ingestion/tabular.py); this is the plain-text view of the table.
+    """
+    text_content = "".join(
+        "".join(format_rows(df) + "\n\n") for df in read_csv_batches(file_path)
+    )
     metadata = {"source": os.path.basename(file_path)}
     return text_content, metadata
 
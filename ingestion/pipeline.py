@@ -0,0 +1,232 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from ingestion import parsers
+from ingestion.parsers import PARSER_MAPPING
+from ingestion.chunking import chunking_strategy_A, chunking_strategy_B
+from ingestion.tabular import chunk_csv
+from ingestion.incremental import diff_file_chunks, apply_file_diff
+
+_DONE = object()
+
+# Tabular files are chunked by row groups straight from the table instead of from its text
+TABULAR_CHUNKERS = {
+    ".csv": chunk_csv,
+}
+# Parsers of structured documents keep their headings, so those are split by section
+CHUNKING_STRATEGIES = {
+    ".md": chunking_strategy_B,
+    ".html": chunking_strategy_B,
+}
+
+
+def file_metadata(file_path: str) -> dict:
+    """Per-file metadata every chunk records; retrieval filters on it (in Chroma and in the chunk store)."""
+    return {"file_type": os.path.splitext(file_path)[1].lower().lstrip("."), "modified_at": os.path.getmtime(file_path)}
+
+
+def chunk_file(file_path: str) -> list[dict]:
+    """Parses and chunks one supported file; every chunk also records the file's type and modification time."""
+    file_ext = os.path.splitext(file_path)[1].lower()
+    source = os.path.basename(file_path)
+    if file_ext in TABULAR_CHUNKERS:
+        chunks = TABULAR_CHUNKERS[file_ext](file_path, source)
+    else:
+        text, _ = PARSER_MAPPING[file_ext](file_path)
+        chunks = CHUNKING_STRATEGIES.get(file_ext, chunking_strategy_A)(text, source=source)
+    metadata = file_metadata(file_path)
+    for chunk in chunks:
+        chunk["metadata"].update(metadata)
+    return chunks
+
+
+def init_parser_worker(ocr_workers: int):
+    """Runs once in each worker process, before it parses anything."""
+    parsers.OCR_WORKERS = ocr_workers
+
+
+def parse_and_chunk(file_path: str) -> tuple[str, list[dict] | None, str | None]:
+    """Runs in a worker process: parses one file and returns (file_path, chunks, error)."""
+    try:
+        return file_path, chunk_file(file_path), None
+    except Exception as e:
+        return file_path, None, str(e)
+
+
+class IngestionPipeline:
+    """
+    Parses files on a process pool and streams their chunks through a bounded queue into
+    fixed-size embedding batches that are upserted to Chroma one batch at a time.
+
+    Only chunks whose content changed are embedded (through the embedding cache) and stored.
+    A file counts as done only once all of its new chunks are stored; then they are added
+    to the BM25 index and chunk store, and its hash becomes eligible for the next checkpoint.
+    Interrupting the run (Ctrl+C) writes a final checkpoint, so the next run only redoes
+    unfinished files.
+    """
+
+    def __init__(self, collection, model, embedding_cache, indexes, checkpoint_fn, workers: int | None = None,
+                 batch_size: int = 64, queue_size: int = 8, checkpoint_seconds: float = 30.0):
+        self.collection = collection
+        self.model = model
+        self.embedding_cache = embedding_cache
+        self.indexes = indexes
+        # Called with the list of files completed since the previous checkpoint
+        self.checkpoint_fn = checkpoint_fn
+        self.workers = workers or os.cpu_count() or 1
+        # Every parser process runs its own OCR thread pool, so the cores are split between
+        # them (an explicit OCR_WORKERS still applies per process)
+        self.ocr_workers = int(os.getenv("OCR_WORKERS", 0)) or max(1, (os.cpu_count() or 1) // self.workers)
+        self.batch_size = batch_size
+        self.checkpoint_seconds = checkpoint_seconds
+
+        # Each item is one parsed file; the bound keeps parsed-but-not-embedded text in check
+        self.file_queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.error = None
+
+        # Per-file bookkeeping for files whose chunks are still being embedded
+        self.remaining = {}
+        self.file_chunks = {}
+        self.file_embeddings = {}  # file -> {chunk id: embedding}, until the file is complete
+        self.completed_files = []
+        self.finished_files = set()  # Every file fully stored this run (files that failed to parse are not)
+        self.files_done = 0
+        self.chunks_done = 0
+        self.started_at = None
+        self.last_checkpoint = None
+        self.last_report = 0.0
+
+    def run(self, files: list[str]) -> bool:
+        """Ingests the files; returns False if the run was interrupted or failed."""
+        self.started_at = self.last_checkpoint = time.time()
+        self.total_files = len(files)
+        consumer = threading.Thread(target=self._consume, name="embed-upsert", daemon=True)
+        consumer.start()
+
+        interrupted = False
+        try:
+            self._produce(files)
+        except KeyboardInterrupt:
+            print("\nInterrupted, finishing the current batch and saving progress...")
+            self.stop_event.set()
+            interrupted = True
+        finally:
+            self.file_queue.put(_DONE)
+            consumer.join()
+            self._checkpoint()
+
+        if self.error is not None:
+            print(f"Ingestion failed: {self.error}")
+            return False
+        self._report(final=True)
+        return not interrupted
+
+    # --- Producer: parse files in worker processes ---
+    def _produce(self, files: list[str]):
+        # 'spawn' avoids forking a parent that already holds torch threads
+        context = multiprocessing.get_context("spawn")
+        pending_files = list(files)
+        in_flight = set()
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                 initializer=init_parser_worker, initargs=(self.ocr_workers,)) as pool:
+            try:
+                while (pending_files or in_flight) and not self.stop_event.is_set():
+                    # Keep a bounded number of files in flight so parsed text can't pile up
+                    while pending_files and len(in_flight) < 2 * self.workers:
+                        in_flight.add(pool.submit(parse_and_chunk, pending_files.pop(0)))
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        file_path, chunks, error = future.result()
+                        if error is not None:
+                            print(f"--> Failed to parse {file_path}: {error}")
+                            continue
+                        print(f"--> Parsed {file_path} ({len(chunks)} chunks)")
+                        self.file_queue.put((file_path, chunks))
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+    # --- Consumer: embed and upsert fixed-size batches ---
+    def _consume(self):
+        batch = []
+        try:
+            while True:
+                item = self.file_queue.get()
+                if item is _DONE:
+                    break
+                if self.stop_event.is_set():
+                    continue
+                file_path, chunks = item
+                chunks = self._start_file(file_path, chunks)
+                if not chunks:
+                    self._finish_file(file_path)
+                for chunk in chunks:
+                    batch.append((file_path, chunk))
+                    if len(batch) >= self.batch_size:
+                        self._flush(batch)
+                        batch = []
+            if batch and not self.stop_event.is_set():
+                self._flush(batch)
+        except Exception as e:
+            self.error = e
+            self.stop_event.set()
+            # Keep draining so the producer never blocks on a full queue
+            while self.file_queue.get() is not _DONE:
+                pass
+
+    def _start_file(self, file_path: str, chunks: list[dict]) -> list[dict]:
+        """Drops chunks that vanished from the file and returns the ones that still need storing."""
+        new_chunks, removed_ids, kept_chunks = diff_file_chunks(self.collection, self.indexes, os.path.basename(file_path), chunks)
+        apply_file_diff(self.collection, self.indexes, removed_ids, kept_chunks)
+        self.remaining[file_path] = len(new_chunks)
+        self.file_chunks[file_path] = new_chunks
+        self.file_embeddings[file_path] = {}
+        return new_chunks
+
+    def _flush(self, batch: list):
+        chunks = [chunk for _, chunk in batch]
+        embeddings = self.embedding_cache.embed(self.model, chunks, batch_size=self.batch_size)
+        self.collection.upsert(
+            ids=[c['id'] for c in chunks],
+            documents=[c['text'] for c in chunks],
+            metadatas=[c['metadata'] for c in chunks],
+            embeddings=embeddings
+        )
+        self.chunks_done += len(chunks)
+        for (file_path, chunk), embedding in zip(batch, embeddings):
+            self.file_embeddings[file_path][chunk['id']] = embedding
+            self.remaining[file_path] -= 1
+            if self.remaining[file_path] == 0:
+                self._finish_file(file_path)
+        self._report()
+        if time.time() - self.last_checkpoint >= self.checkpoint_seconds:
+            self._checkpoint()
+
+    def _finish_file(self, file_path: str):
+        chunks = self.file_chunks.pop(file_path)
+        embedding_of = self.file_embeddings.pop(file_path)
+        del self.remaining[file_path]
+        self.indexes.add_chunks(chunks, [embedding_of[c['id']] for c in chunks])
+        self.completed_files.append(file_path)
+        self.finished_files.add(file_path)
+        self.files_done += 1
+
+    def _checkpoint(self):
+        completed, self.completed_files = self.completed_files, []
+        self.checkpoint_fn(completed)
+        self.last_checkpoint = time.time()
+
+    def _report(self, final: bool = False, interval: float = 2.0):
+        now = time.time()
+        if not final and now - self.last_report < interval:
+            return
+        self.last_report = now
+        elapsed = max(now - self.started_at, 1e-9)
+        prefix = "Finished:" if final else "   "
+        print(f"{prefix} {self.files_done}/{self.total_files} files, {self.chunks_done} chunks "
+              f"({self.files_done / elapsed:.2f} files/s, {self.chunks_done / elapsed:.1f} chunks/s)")
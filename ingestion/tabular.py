@@ -0,0 +1,92 @@
+import os
+import re
+import pandas as pd
+
+from ingestion.chunking import build_chunk_docs
+
+# --- Tabular settings ---
+# Rows read from the file at a time, so large CSVs never sit in memory as one DataFrame
+CSV_READ_ROWS = int(os.getenv("CSV_READ_ROWS", 50000))
+# Rows are packed into chunks of about this many characters (never splitting a row)
+CSV_CHUNK_CHARS = int(os.getenv("CSV_CHUNK_CHARS", 1000))
+# Longer text values (descriptions and the like) stay in the chunk text only, not in metadata
+CSV_METADATA_MAX_CHARS = int(os.getenv("CSV_METADATA_MAX_CHARS", 64))
+
+# Metadata keys set by the chunker; a CSV column with one of these names gets a "col_" prefix
+RESERVED_METADATA = ("source", "chunk_num", "chunk_hash", "row_start", "row_end",
+                     "file_type", "modified_at", "section_path")
+
+
+def read_csv_batches(file_path: str, rows: int = CSV_READ_ROWS):
+    return pd.read_csv(file_path, chunksize=rows)
+
+
+def format_rows(df: pd.DataFrame) -> pd.Series:
+    """Formats every row as "col: value, col: value" with column-wise string operations."""
+    parts = [col + ": " + df[col].astype(str).where(df[col].notna(), "") for col in df.columns.astype(str)]
+    return parts[0].str.cat(parts[1:], sep=", ") if len(parts) > 1 else parts[0]
+
+
+def metadata_key(column: str) -> str:
+    key = re.sub(r"\W+", "_", str(column).strip().lower()).strip("_") or "column"
+    return f"col_{key}" if key in RESERVED_METADATA else key
+
+
+def _group_metadata(df: pd.DataFrame, groups: pd.Series) -> list[dict]:
+    """
+    Per row group: each column's value if the whole group shares it (short strings only),
+    and for numeric columns the group's range as <column>_min / <column>_max.
+    """
+    grouped = df.groupby(groups, sort=False)
+    first = grouped.first()
+    uniform = grouped.nunique(dropna=False) == 1
+    numeric = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])]
+    minimum, maximum = grouped[numeric].min(), grouped[numeric].max()
+
+    # Column by column; tolist() gives the int/float/bool/str values Chroma and the chunk store accept
+    metadatas = [{} for _ in range(len(first))]
+    for col in df.columns:
+        key = metadata_key(col)
+        keep = uniform[col] & first[col].notna()
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            keep &= first[col].astype(str).str.len() <= CSV_METADATA_MAX_CHARS
+        for metadata, value, kept in zip(metadatas, first[col].tolist(), keep.tolist()):
+            if kept:
+                metadata[key] = value
+        if col in numeric:
+            for metadata, low, high in zip(metadatas, minimum[col].tolist(), maximum[col].tolist()):
+                if low == low:  # NaN when the whole group is missing the value
+                    metadata[f"{key}_min"] = low
+                    metadata[f"{key}_max"] = high
+    return metadatas
+
+
+def chunk_csv(file_path: str, source: str) -> list[dict]:
+    """
+    Row-group chunking for CSV files. Rows are formatted like parse_csv does and packed in
+    file order into chunks of about CSV_CHUNK_CHARS characters, so no row is ever cut in half.
+    Each chunk records its rows (row_start/row_end, 1-based data rows) and the column values
+    it holds in its metadata, which lets retrieval filter on them. Groups restart at each
+    read batch of CSV_READ_ROWS rows.
+    """
+    texts, metadatas, row_offset = [], [], 0
+    for df in read_csv_batches(file_path):
+        if df.empty:
+            continue
+        df = df.reset_index(drop=True)
+        rows = format_rows(df)
+        # A row starts a new group when the text before it crosses the next multiple of the budget
+        starts = (rows.str.len() + 2).cumsum().shift(fill_value=0)
+        groups = starts // max(CSV_CHUNK_CHARS, 1)
+
+        grouped_rows = rows.groupby(groups, sort=False)
+        group_texts = grouped_rows.agg("\n\n".join)
+        bounds = pd.Series(df.index, index=df.index).groupby(groups, sort=False).agg(["min", "max"])
+        for metadata, start, end in zip(_group_metadata(df, groups), bounds["min"], bounds["max"]):
+            metadata["row_start"] = row_offset + int(start) + 1
+            metadata["row_end"] = row_offset + int(end) + 1
+            metadatas.append(metadata)
+        texts.extend(group_texts.tolist())
+        row_offset += len(df)
+
+    return build_chunk_docs(texts, source, metadatas)
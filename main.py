@@ -35,13 +35,17 @@ def main():
         # for i, doc in enumerate(retrieved_docs):
         #     print(f"  {i+1}. Source: {doc['metadata']['source']}, Score: {doc['score']:.4f}")
 
-        # 2. Generation
+        # 2. Generation (tokens are printed as soon as Ollama produces them)
         start_time = time.time()
-        answer = generator.generate_response(query, retrieved_docs)
+        first_token_time = None
+        print("\nAnswer:")
+        for token in generator.stream_response(query, retrieved_docs):
+            if first_token_time is None:
+                first_token_time = time.time() - start_time
+            print(token, end="", flush=True)
         generation_time = time.time() - start_time
         
-        print(f"\nAnswer (generated in {generation_time:.2f} seconds):")
-        print(answer)
+        print(f"\n\n(first token after {(first_token_time or 0.0):.2f} seconds, generated in {generation_time:.2f} seconds)")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,183 @@
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+import threading
+from dotenv import load_dotenv
+
+# Multi-process API server. The parent loads the retriever once (models, BM25 index, chunk
+# store, vector index), then forks the workers, which all accept connections on one shared
+# socket. Model weights are shared copy-on-write; the indexes are memory-mapped files, so
+# they are shared through the page cache. Each worker loads its own generator (an HTTP
+# client for Ollama), answer cache and metrics.
+#
+#   python serve.py --workers 4 --port 8000
+#
+# Per-worker RSS and PSS are printed every SERVE_MEMORY_REPORT_INTERVAL seconds and reported
+# by each worker's /stats under "process". PSS splits shared pages between the processes
+# mapping them, so the sum over the parent and workers is what the deployment really uses.
+
+load_dotenv()
+
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", 8000))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", 2))
+SERVE_MEMORY_REPORT_INTERVAL = float(os.getenv("SERVE_MEMORY_REPORT_INTERVAL", 60))
+# Seconds a worker gets to finish its requests on shutdown before it is killed
+SERVE_SHUTDOWN_TIMEOUT = float(os.getenv("SERVE_SHUTDOWN_TIMEOUT", 30))
+
+# A tokenizer thread pool started in the parent would not exist in the workers
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def configure_threads(workers: int) -> int:
+    """
+    Splits the cores between the workers (unless INFERENCE_THREADS is set) and returns the
+    inference threads per worker. The parent loads the torch models single-threaded, so no
+    intra-op thread pool exists yet when it forks; each worker sizes its own after the fork.
+    ONNX Runtime sessions own their threads from creation, so with that backend every
+    worker loads its own sessions instead.
+    """
+    threads = int(os.getenv("INFERENCE_THREADS", 0)) or max(1, (os.cpu_count() or 1) // workers)
+    backend = os.getenv("INFERENCE_BACKEND", "torch")
+    os.environ["INFERENCE_THREADS"] = str(threads if backend == "onnx" else 1)
+    return threads
+
+
+def _exit_with_parent(parent_pid: int):
+    # Workers run in their own process group, so they would outlive a parent that was killed
+    while os.getppid() == parent_pid:
+        time.sleep(1)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def run_worker(worker_id: int, sock: socket.socket, threads: int, preloaded: bool, log_level: str):
+    import uvicorn
+    import api
+
+    # Ctrl+C reaches only the parent, which then stops every worker with one SIGTERM
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)  # The parent's handlers; uvicorn installs its own
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    os.environ["SERVE_WORKER_ID"] = str(worker_id)
+    threading.Thread(target=_exit_with_parent, args=(os.getppid(),), daemon=True).start()
+    if preloaded:
+        import torch
+        torch.set_num_threads(threads)
+
+    server = uvicorn.Server(uvicorn.Config(api.app, log_level=log_level))
+    server.run(sockets=[sock])
+
+
+def spawn_worker(worker_id: int, sock: socket.socket, threads: int, preloaded: bool, log_level: str) -> int:
+    sys.stdout.flush()  # Otherwise both processes would print what is still buffered
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        run_worker(worker_id, sock, threads, preloaded, log_level)
+    except BaseException as e:
+        print(f"Worker {worker_id} failed: {e}")
+        code = 1
+    finally:
+        # Skip the parent's exit handlers, which would run a second time here
+        sys.stdout.flush()
+        os._exit(code)
+
+
+def reap_worker() -> tuple[int, int]:
+    """(pid, status) of a worker that exited, or (0, 0)."""
+    try:
+        return os.waitpid(-1, os.WNOHANG)
+    except ChildProcessError:
+        return 0, 0
+
+
+def print_memory_report(workers: dict):
+    from core.memory import memory_usage
+    rows = [("parent", os.getpid())] + [(f"worker {worker_id}", pid) for pid, worker_id in sorted(workers.items(), key=lambda w: w[1])]
+    total_pss = 0.0
+    print("Memory (MB):")
+    for name, pid in rows:
+        usage = memory_usage(pid)
+        if "pss_mb" not in usage:
+            print(f"  {name:<10} pid {pid}: {usage or 'unavailable'}")
+            continue
+        total_pss += usage["pss_mb"]
+        print(f"  {name:<10} pid {pid}: RSS {usage['rss_mb']:>8}  PSS {usage['pss_mb']:>8}  "
+              f"shared {usage['shared_mb']:>8}  private {usage['private_mb']:>8}")
+    print(f"  total PSS: {round(total_pss, 1)}")
+
+
+def main(args):
+    threads = configure_threads(args.workers)
+    from core.inference import INFERENCE_BACKEND
+    import api
+
+    preloaded = INFERENCE_BACKEND != "onnx"
+    if preloaded:
+        start = time.perf_counter()
+        api.preload_retriever()
+        print(f"Retriever loaded in the parent in {time.perf_counter() - start:.2f}s")
+    else:
+        print("INFERENCE_BACKEND=onnx: every worker loads its own ONNX Runtime sessions.")
+    # Objects loaded so far are never touched by the garbage collector again, which would
+    # otherwise write to their pages and turn shared memory into per-worker copies
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.create_server((args.host, args.port), backlog=2048)
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers, {threads} inference thread(s) each")
+
+    stopping = threading.Event()
+    def handle_signal(signum, frame):
+        stopping.set()
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    workers = {}  # pid -> worker id
+    for worker_id in range(args.workers):
+        workers[spawn_worker(worker_id, sock, threads, preloaded, args.log_level)] = worker_id
+
+    next_report = time.time() + args.memory_report_interval
+    while not stopping.is_set():
+        pid, status = reap_worker()
+        if pid and pid in workers:
+            worker_id = workers.pop(pid)
+            print(f"Worker {worker_id} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}; restarting it")
+            time.sleep(1)  # Don't spin if it fails right away
+            workers[spawn_worker(worker_id, sock, threads, preloaded, args.log_level)] = worker_id
+        if args.memory_report_interval > 0 and time.time() >= next_report:
+            print_memory_report(workers)
+            next_report = time.time() + args.memory_report_interval
+        stopping.wait(0.5)
+
+    print("Stopping workers...")
+    for pid in workers:
+        os.kill(pid, signal.SIGTERM)
+    deadline = time.time() + SERVE_SHUTDOWN_TIMEOUT
+    while workers and time.time() < deadline:
+        pid, _ = reap_worker()
+        workers.pop(pid, None)
+        if not pid:
+            time.sleep(0.1)
+    for pid in workers:
+        os.kill(pid, signal.SIGKILL)
+    sock.close()
+
+
+if __name__ == "__main__":
+    if not hasattr(os, "fork"):
+        sys.exit("serve.py needs os.fork (Linux or macOS); run 'uvicorn api:app' instead.")
+    parser = argparse.ArgumentParser(description="Run the API in several worker processes that share the loaded models and indexes.")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--memory-report-interval", type=float, default=SERVE_MEMORY_REPORT_INTERVAL,
+                        help="Seconds between per-worker memory reports (0 = off).")
+    parser.add_argument("--log-level", default="info")
+    main(parser.parse_args())
@@ -0,0 +1,48 @@
+import numpy as np
+
+from core.cache import AnswerCache, RetrievalCache
+
+RESPONSE = {"answer": "1956", "citations": [], "confidence": 0.9}
+
+
+def make_cache(version: dict) -> AnswerCache:
+    return AnswerCache(version_fn=lambda: version["current"])
+
+
+def test_answer_from_an_older_generation_is_not_cached():
+    version = {"current": "v1"}
+    cache = make_cache(version)
+    version["current"] = "v2"  # The indexes were swapped while the answer was generated
+    cache.put("When was Dartmouth?", np.ones(4), RESPONSE, version="v1")
+    assert cache.get_exact("When was Dartmouth?") is None
+
+    cache.put("When was Dartmouth?", np.ones(4), RESPONSE, version="v2")
+    assert cache.get_exact("when was dartmouth") == RESPONSE
+
+
+def test_generation_change_empties_the_cache():
+    version = {"current": "v1"}
+    cache = make_cache(version)
+    cache.put("When was Dartmouth?", np.ones(4), RESPONSE, version="v1")
+    assert cache.get_similar(np.ones(4)) == RESPONSE
+    version["current"] = "v2"
+    assert cache.get_exact("When was Dartmouth?") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_results_from_a_swapped_out_generation_are_not_cached():
+    served = {"current": "v1"}
+    cache = RetrievalCache(version_fn=lambda: served["current"])
+    docs = [{"text": "Dartmouth, 1956", "metadata": {"source": "a.txt"}}]
+    cache.put_results("When was Dartmouth?", 5, docs, version="v1")
+    assert cache.get_results("When was Dartmouth?", 5) == docs
+
+    # A reload swaps the generation while a query on the old one is still running
+    served["current"] = "v2"
+    cache.put_results("Who coined AI?", 5, docs, version="v1")
+    assert cache.get_results("Who coined AI?", 5) is None
+    assert cache.get_results("When was Dartmouth?", 5) is None
+    assert cache.stats()["invalidations"] == 1
+
+    cache.put_results("Who coined AI?", 5, docs, version="v2")
+    assert cache.get_results("Who coined AI?", 5) == docs
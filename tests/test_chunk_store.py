@@ -0,0 +1,90 @@
+import numpy as np
+
+from core.chunk_store import ChunkStore
+
+
+def make_chunks(n: int, seed: int = 0) -> tuple[list[str], list[str], list[dict]]:
+    rng = np.random.default_rng(seed)
+    ids = [f"c{i}" for i in range(n)]
+    texts = [f"chunk {i} – Dartmouth ✓ " + "x" * int(rng.integers(0, 40)) for i in range(n)]
+    metadatas = []
+    for i in range(n):
+        metadata = {"source": f"file{i % 3}.{'pdf' if i % 2 else 'md'}", "chunk_num": i,
+                    "modified_at": 1000.0 + i, "has_table": bool(i % 2)}
+        if i % 4 == 0:
+            metadata["section_path"] = f"Intro > Part {i % 8}"
+        metadatas.append(metadata)
+    return ids, texts, metadatas
+
+
+def assert_store_holds(store: ChunkStore, ids: list[str], texts: list[str], metadatas: list[dict]):
+    assert store.chunk_ids == ids
+    for position, (text, metadata) in enumerate(zip(texts, metadatas)):
+        assert store.get(position) == (text, metadata)
+
+
+def test_texts_and_metadata_round_trip(tmp_path):
+    ids, texts, metadatas = make_chunks(30)
+    store = ChunkStore.build(ids, texts, metadatas)
+    assert_store_holds(store, ids, texts, metadatas)
+    assert isinstance(store.metadata(1)["chunk_num"], int) and store.metadata(1)["has_table"] is True
+
+    store.save(str(tmp_path / "store"))
+    assert_store_holds(ChunkStore.load(str(tmp_path / "store")), ids, texts, metadatas)
+
+
+def test_incremental_updates_equal_a_rebuild(tmp_path):
+    ids, texts, metadatas = make_chunks(40, seed=1)
+    store = ChunkStore.build(ids[:30], texts[:30], metadatas[:30])
+    store.save(str(tmp_path / "store"))
+
+    # Remove some chunks, add new ones, and renumber a surviving one (on a memory-mapped store)
+    store = ChunkStore.load(str(tmp_path / "store"))
+    assert store.remove_ids(ids[5:15] + ["unknown"]) == 10
+    store.add(ids[30:], texts[30:], metadatas[30:])
+    metadatas[20] = {**metadatas[20], "chunk_num": 0, "file_type": "pdf"}
+    store.update_metadata([ids[20]], [metadatas[20]])
+    store.save(str(tmp_path / "store"))
+
+    kept = [i for i in range(40) if not 5 <= i < 15]
+    expected = ([ids[i] for i in kept], [texts[i] for i in kept], [metadatas[i] for i in kept])
+    assert_store_holds(store, *expected)
+    assert_store_holds(ChunkStore.load(str(tmp_path / "store")), *expected)
+
+
+def test_filter_masks():
+    ids, texts, metadatas = make_chunks(50, seed=2)
+    store = ChunkStore.build(ids, texts, metadatas)
+
+    expected = [m["source"] in ("file0.md", "file1.pdf") for m in metadatas]
+    np.testing.assert_array_equal(store.values_mask("source", ["file0.md", "file1.pdf", "missing.txt"]), expected)
+    np.testing.assert_array_equal(store.values_mask("has_table", [True]), [m["has_table"] for m in metadatas])
+    np.testing.assert_array_equal(store.range_mask("modified_at", 1010.0, 1020.0),
+                                  [1010.0 <= m["modified_at"] <= 1020.0 for m in metadatas])
+    np.testing.assert_array_equal(store.range_mask("modified_at", low=1045.0), [m["modified_at"] >= 1045.0 for m in metadatas])
+    np.testing.assert_array_equal(store.present_mask("section_path"), ["section_path" in m for m in metadatas])
+
+    # Unknown fields and range filters on strings match nothing
+    assert not store.values_mask("file_type", ["pdf"]).any()
+    assert not store.range_mask("source", 0, 1).any()
+    assert not store.present_mask("file_type").any()
+
+
+def test_columns_widen_to_fit_mixed_types(tmp_path):
+    # CSV files can use one column name for different types, in the value and in <column>_min/_max
+    store = ChunkStore.build(["a", "b"], ["year 1956", "year 1997"],
+                             [{"year": 1956, "flag": True, "code": 7}, {"year_min": 1997}])
+    store.add(["c", "d"], ["year 1956.5", "code AI-7"], [{"year": 1956.5, "flag": 2, "year_min": 1950.25}, {"code": "AI-7"}])
+    store.update_metadata(["b"], [{"year_min": 1997, "year": "unknown"}])
+    store.save(str(tmp_path / "store"))
+
+    for loaded in (store, ChunkStore.load(str(tmp_path / "store"))):
+        assert [loaded.metadata(p) for p in range(4)] == [
+            {"year": "1956", "flag": 1, "code": "7"},
+            {"year": "unknown", "year_min": 1997.0},
+            {"year": "1956.5", "flag": 2, "year_min": 1950.25},
+            {"code": "AI-7"},
+        ]
+        np.testing.assert_array_equal(loaded.range_mask("year_min", 1950.0, 1951.0), [False, False, True, False])
+        np.testing.assert_array_equal(loaded.values_mask("code", ["7", "AI-7"]), [True, False, False, True])
+        np.testing.assert_array_equal(loaded.values_mask("flag", [2]), [False, False, True, False])
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from core.fusion import fuse, is_decisive
+
+
+def test_rrf_ranks_by_summed_reciprocal_ranks():
+    dense = (np.array([1, 2, 3]), np.array([0.9, 0.8, 0.7]), 1.0)
+    lexical = (np.array([3, 1, 4]), np.array([12.0, 8.0, 1.0]), 1.0)
+    fused = dict(fuse("rrf", [dense, lexical], rrf_k=60))
+    expected = {1: 1 / 61 + 1 / 62, 2: 1 / 62, 3: 1 / 63 + 1 / 61, 4: 1 / 63}
+    best_possible = 2 / 61
+    assert fused.keys() == expected.keys()
+    for position, score in expected.items():
+        assert fused[position] == pytest.approx(score / best_possible)
+    assert [p for p, _ in fuse("rrf", [dense, lexical], rrf_k=60)] == [1, 3, 2, 4]
+
+
+def test_rrf_ignores_scores_and_applies_weights():
+    dense = (np.array([1, 2]), np.array([0.1, 0.0]), 3.0)
+    lexical = (np.array([2, 1]), np.array([100.0, 1.0]), 1.0)
+    fused = fuse("rrf", [dense, lexical])
+    assert [p for p, _ in fused] == [1, 2]
+    assert fused[0][1] <= 1.0
+
+
+def test_weighted_fusion_min_max_normalises_each_list():
+    dense = (np.array([1, 2, 3]), np.array([0.9, 0.5, 0.1]), 0.5)
+    lexical = (np.array([3, 2]), np.array([30.0, 10.0]), 0.5)
+    fused = fuse("weighted", [dense, lexical])
+    # Normalised: dense 1.0/0.5/0.0, lexical 1.0/0.0 for positions 3/2
+    assert fused == [(1, pytest.approx(0.5)), (3, pytest.approx(0.5)), (2, pytest.approx(0.25))]
+
+
+def test_weighted_fusion_with_equal_scores_and_empty_lists():
+    dense = (np.array([5, 6]), np.array([0.4, 0.4]), 1.0)
+    lexical = (np.array([], dtype=np.int64), np.array([]), 1.0)
+    fused = fuse("weighted", [dense, lexical])
+    assert sorted(p for p, _ in fused) == [5, 6]
+    assert all(score == pytest.approx(0.5) for _, score in fused)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        fuse("borda", [])
+
+
+def test_is_decisive():
+    fused = [(1, 0.9), (2, 0.85), (3, 0.4), (4, 0.3)]
+    assert is_decisive(fused, top_k=2, margin=0.3)
+    assert not is_decisive(fused, top_k=1, margin=0.3)
+    assert not is_decisive(fused, top_k=2, margin=0.0)
+    assert not is_decisive(fused[:2], top_k=2, margin=0.1)
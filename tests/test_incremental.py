@@ -0,0 +1,139 @@
+import hashlib
+import numpy as np
+import pytest
+
+from core.chunk_store import ChunkStore
+from core.filters import MetadataFilter
+from ingestion.chunking import build_chunk_docs
+from ingestion.incremental import LocalIndexes, diff_file_chunks, apply_file_diff, backfill_file_metadata
+
+
+class FakeCollection:
+    """The part of a Chroma collection that ingestion uses, kept in a dict."""
+
+    def __init__(self):
+        self.rows = {}  # id -> (document, metadata, embedding)
+
+    def get(self, ids=None, where=None, include=()):
+        selected = [i for i in (ids if ids is not None else self.rows) if i in self.rows]
+        if where is not None:
+            (name, value), = where.items()
+            selected = [i for i in selected if self.rows[i][1].get(name) == value]
+        return {
+            "ids": selected,
+            "documents": [self.rows[i][0] for i in selected],
+            "metadatas": [self.rows[i][1] for i in selected],
+            "embeddings": [self.rows[i][2] for i in selected],
+        }
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        for chunk_id, document, metadata, embedding in zip(ids, documents, metadatas, embeddings):
+            self.rows[chunk_id] = (document, dict(metadata), embedding)
+
+    def update(self, ids, metadatas):
+        for chunk_id, metadata in zip(ids, metadatas):
+            document, _, embedding = self.rows[chunk_id]
+            self.rows[chunk_id] = (document, dict(metadata), embedding)
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.rows.pop(chunk_id, None)
+
+
+def embed(text: str) -> np.ndarray:
+    seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+    return np.random.default_rng(seed).standard_normal(8).astype(np.float32)
+
+
+def file_chunks(source: str, paragraphs: list[str]) -> list[dict]:
+    return build_chunk_docs(paragraphs, source)
+
+
+def ingest_file(collection, indexes: LocalIndexes, source: str, chunks: list[dict], interrupted: bool = False):
+    """The steps ingest.py and the pipeline take per file; `interrupted` stops after the Chroma upsert."""
+    new_chunks, removed_ids, kept_chunks = diff_file_chunks(collection, indexes, source, chunks)
+    apply_file_diff(collection, indexes, removed_ids, kept_chunks)
+    embeddings = [embed(c['text']) for c in new_chunks]
+    if new_chunks:
+        collection.upsert([c['id'] for c in new_chunks], [c['text'] for c in new_chunks],
+                          [c['metadata'] for c in new_chunks], embeddings)
+    if not interrupted:
+        indexes.add_chunks(new_chunks, embeddings)
+
+
+def load_indexes(collection, tmp_path) -> LocalIndexes:
+    return LocalIndexes.load(collection, str(tmp_path / "lexical"), str(tmp_path / "store"), str(tmp_path / "vectors"))
+
+
+def test_resume_adds_chunks_stored_only_in_chroma(tmp_path):
+    collection = FakeCollection()
+    indexes = load_indexes(collection, tmp_path)
+    ingest_file(collection, indexes, "a.txt", file_chunks("a.txt", ["alpha one", "alpha two", "alpha three"]))
+    indexes.save()
+
+    # The run stops after b.txt's chunks reached Chroma but before the local indexes
+    indexes = load_indexes(collection, tmp_path)
+    b_chunks = file_chunks("b.txt", ["beta one", "beta two"])
+    ingest_file(collection, indexes, "b.txt", b_chunks, interrupted=True)
+    indexes.save()
+    assert len(collection.rows) == 5 and len(indexes) == 3
+
+    # The resumed run must store them locally instead of treating them as unchanged
+    indexes = load_indexes(collection, tmp_path)
+    ingest_file(collection, indexes, "b.txt", b_chunks)
+    indexes.save()
+
+    indexes = load_indexes(collection, tmp_path)
+    assert sorted(indexes.chunk_store.chunk_ids) == sorted(collection.rows)
+    assert indexes.bm25.chunk_ids == indexes.chunk_store.chunk_ids == indexes.vectors.chunk_ids
+    positions, _ = indexes.bm25.search("beta", 10)
+    assert {indexes.chunk_store.chunk_ids[p] for p in positions} == {c['id'] for c in b_chunks}
+
+
+def test_unchanged_and_removed_chunks(tmp_path):
+    collection = FakeCollection()
+    indexes = load_indexes(collection, tmp_path)
+    ingest_file(collection, indexes, "a.txt", file_chunks("a.txt", ["kept text", "dropped text"]))
+    indexes.save()
+
+    indexes = load_indexes(collection, tmp_path)
+    chunks = file_chunks("a.txt", ["added text", "kept text"])
+    new_chunks, removed_ids, kept_chunks = diff_file_chunks(collection, indexes, "a.txt", chunks)
+    assert [c['text'] for c in new_chunks] == ["added text"]
+    assert [c['text'] for c in kept_chunks] == ["kept text"]
+    assert len(removed_ids) == 1
+
+    ingest_file(collection, indexes, "a.txt", chunks)
+    indexes.save()
+    kept = indexes.chunk_store.chunk_ids.index(kept_chunks[0]['id'])
+    assert indexes.chunk_store.metadata(kept)["chunk_num"] == 1
+    assert sorted(indexes.chunk_store.chunk_ids) == sorted(collection.rows)
+
+
+def test_backfill_adds_file_metadata_to_old_chunks(tmp_path):
+    # Chunks stored before ingestion recorded file_type/modified_at
+    collection = FakeCollection()
+    indexes = load_indexes(collection, tmp_path)
+    ingest_file(collection, indexes, "a.pdf", file_chunks("a.pdf", ["old pdf text"]))
+    ingest_file(collection, indexes, "b.md", file_chunks("b.md", ["old md text"]))
+    indexes.save()
+    pdf_only = MetadataFilter(file_types=["pdf"])
+    assert not pdf_only.mask(indexes.chunk_store).any()
+
+    indexes = load_indexes(collection, tmp_path)
+    metadata_of = {"a.pdf": {"file_type": "pdf", "modified_at": 100.0}}
+    assert backfill_file_metadata(collection, indexes, metadata_of) == 1
+    assert backfill_file_metadata(collection, indexes, metadata_of) == 0
+    indexes.save()
+
+    indexes = load_indexes(collection, tmp_path)
+    positions = np.flatnonzero(pdf_only.mask(indexes.chunk_store))
+    assert [indexes.chunk_store.text(p) for p in positions] == ["old pdf text"]
+    (metadata,) = [m for _, m, _ in collection.rows.values() if m["source"] == "a.pdf"]
+    assert metadata["file_type"] == "pdf" and "chunk_hash" in metadata
+
+
+def test_update_metadata_rejects_unknown_ids():
+    store = ChunkStore.build(["a"], ["text"], [{"source": "a.txt"}])
+    with pytest.raises(KeyError):
+        store.update_metadata(["missing"], [{"source": "a.txt"}])
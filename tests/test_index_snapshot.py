@@ -0,0 +1,39 @@
+from core.chunk_store import ChunkStore
+from core.lexical import BM25Index
+from core.retrieval import IndexSnapshot
+
+
+class FakeSystem:
+    def __init__(self):
+        self.stopped = 0
+
+    def stop(self):
+        self.stopped += 1
+
+
+class FakeClient:
+    def __init__(self):
+        self._system = FakeSystem()
+
+
+def make_snapshot() -> IndexSnapshot:
+    ids, texts = ["a", "b"], ["first text", "second text"]
+    return IndexSnapshot(FakeClient(), None, BM25Index.build(ids, texts, ["a.txt", "b.txt"]),
+                         ChunkStore.build(ids, texts, [{"source": "a.txt"}, {"source": "b.txt"}]), None, "v1")
+
+
+def test_retired_snapshot_closes_after_its_last_query():
+    snapshot = make_snapshot()
+    assert snapshot.acquire()
+    snapshot.retire()
+    assert snapshot.client._system.stopped == 0  # Still in use
+    snapshot.release()
+    assert snapshot.client._system.stopped == 1
+    assert not snapshot.acquire()
+
+
+def test_idle_snapshot_closes_when_retired():
+    snapshot = make_snapshot()
+    snapshot.retire()
+    snapshot.retire()
+    assert snapshot.client._system.stopped == 1
@@ -0,0 +1,76 @@
+import numpy as np
+
+from core.inference import OnnxReranker, TorchReranker, check_parity
+
+
+def logit(query: str, passage: str) -> float:
+    """Stands in for the cross-encoder: raw, unbounded relevance logits (mostly negative)."""
+    overlap = len(set(query.lower().split()) & set(passage.lower().split()))
+    return 3.0 * overlap - 6.0 + 0.01 * len(passage)
+
+
+class FakeTokenizer:
+    """Encodes each pair as its row number, so the fake session can look the pair up."""
+
+    def __init__(self):
+        self.pairs = []
+
+    def __call__(self, queries, passages, **kwargs):
+        self.pairs = list(zip(queries, passages))
+        return {"input_ids": np.arange(len(queries))[:, None], "attention_mask": np.ones((len(queries), 1))}
+
+
+class FakeInput:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeSession:
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def get_inputs(self):
+        return [FakeInput("input_ids"), FakeInput("attention_mask")]
+
+    def run(self, outputs, inputs):
+        rows = inputs["input_ids"][:, 0]
+        return [np.array([[logit(*self.tokenizer.pairs[i])] for i in rows], dtype=np.float32)]
+
+
+class FakeCrossEncoder:
+    # ms-marco cross-encoders use an identity activation, so predict() returns logits
+    def predict(self, pairs):
+        return np.array([logit(q, p) for q, p in pairs], dtype=np.float32)
+
+
+class FakeEmbedder:
+    def encode(self, texts):
+        return np.array([[len(t), t.count(" ") + 1.0] for t in texts], dtype=np.float32)
+
+
+def onnx_reranker() -> OnnxReranker:
+    reranker = OnnxReranker.__new__(OnnxReranker)
+    reranker.tokenizer = FakeTokenizer()
+    reranker.session = FakeSession(reranker.tokenizer)
+    return reranker
+
+
+def torch_reranker() -> TorchReranker:
+    reranker = TorchReranker.__new__(TorchReranker)
+    reranker.model = FakeCrossEncoder()
+    return reranker
+
+
+def test_onnx_and_torch_rerankers_return_logits_on_the_same_scale():
+    pairs = [["Who proposed the Turing Test?", "Alan Turing proposed an imitation game in 1950."],
+             ["Who proposed the Turing Test?", "Expert systems encode rules."]]
+    onnx_scores = onnx_reranker().predict(pairs)
+    np.testing.assert_allclose(onnx_scores, torch_reranker().predict(pairs), rtol=1e-6)
+    # Logits, not probabilities: the retriever applies the sigmoid once
+    assert onnx_scores.min() < 0
+
+
+def test_parity_report_compares_like_with_like():
+    report = check_parity(FakeEmbedder(), onnx_reranker(), FakeEmbedder(), torch_reranker())
+    assert report["rerank_abs_diff_max"] < 1e-5
+    assert report["rerank_same_order"] == "3/3"
@@ -0,0 +1,134 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from core.lexical import BM25Index, tokenize, K1, B, EPSILON
+
+WORDS = ["model", "neural", "network", "perceptron", "symbolic", "logic", "expert", "system",
+         "winter", "funding", "darpa", "lisp", "machine", "learning", "backprop", "vision"]
+QUERIES = ["neural network", "expert system winter", "lisp lisp machine", "model", "darpa funding vision"]
+
+
+def make_corpus(n_docs: int, seed: int = 0) -> list[str]:
+    # Skewed word frequencies, so some terms appear in most documents (negative Okapi IDF)
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, len(WORDS) + 1)
+    weights /= weights.sum()
+    return [" ".join(rng.choice(WORDS, size=rng.integers(3, 15), p=weights)) for _ in range(n_docs)]
+
+
+def okapi_scores(texts: list[str], query: str) -> np.ndarray:
+    """BM25Okapi as rank_bm25 computes it, for every document."""
+    docs = [Counter(tokenize(text)) for text in texts]
+    lengths = [sum(doc.values()) for doc in docs]
+    avgdl = sum(lengths) / len(docs)
+    df = Counter(term for doc in docs for term in doc)
+    idf = {term: math.log(len(docs) - n + 0.5) - math.log(n + 0.5) for term, n in df.items()}
+    floor = EPSILON * sum(idf.values()) / len(idf)
+    idf = {term: floor if value < 0 else value for term, value in idf.items()}
+    scores = np.zeros(len(docs))
+    for term in tokenize(query):
+        for i, doc in enumerate(docs):
+            tf = doc.get(term, 0)
+            scores[i] += idf.get(term, 0.0) * tf * (K1 + 1) / (tf + K1 * (1 - B + B * lengths[i] / avgdl))
+    return scores
+
+
+def dense_scores(index: BM25Index, query: str, mask=None) -> np.ndarray:
+    positions, scores = index.search(query, len(index), mask)
+    dense = np.zeros(len(index))
+    dense[positions] = scores
+    return dense
+
+
+def build(texts: list[str]) -> BM25Index:
+    return BM25Index.build([f"c{i}" for i in range(len(texts))], texts, ["a.txt"] * len(texts))
+
+
+def test_scores_match_okapi():
+    texts = make_corpus(80)
+    index = build(texts)
+    for query in QUERIES:
+        np.testing.assert_allclose(dense_scores(index, query), okapi_scores(texts, query), rtol=1e-5, atol=1e-6)
+
+
+def test_scores_match_rank_bm25():
+    rank_bm25 = pytest.importorskip("rank_bm25")
+    texts = make_corpus(80, seed=1)
+    reference = rank_bm25.BM25Okapi([tokenize(text) for text in texts])
+    index = build(texts)
+    for query in QUERIES:
+        np.testing.assert_allclose(dense_scores(index, query), reference.get_scores(tokenize(query)), rtol=1e-5, atol=1e-6)
+
+
+def test_top_k_is_the_best_k_in_order():
+    texts = make_corpus(200, seed=2)
+    index = build(texts)
+    for query in QUERIES:
+        positions, scores = index.search(query, 5)
+        expected = np.sort(okapi_scores(texts, query))[::-1][:5]
+        np.testing.assert_allclose(scores, expected, rtol=1e-5)
+        assert list(scores) == sorted(scores, reverse=True)
+        np.testing.assert_allclose(okapi_scores(texts, query)[positions], scores, rtol=1e-5)
+
+
+def test_mask_only_drops_documents():
+    texts = make_corpus(80, seed=3)
+    index = build(texts)
+    mask = np.arange(len(texts)) % 3 == 0
+    for query in QUERIES:
+        # Corpus statistics stay those of the whole index; other documents just don't score
+        np.testing.assert_allclose(dense_scores(index, query, mask), np.where(mask, dense_scores(index, query), 0.0), rtol=1e-6)
+
+
+def test_unknown_terms_and_empty_queries():
+    index = build(make_corpus(10))
+    for query in ("", "quantum", "?!"):
+        positions, scores = index.search(query, 5)
+        assert len(positions) == len(scores) == 0
+
+
+def test_save_and_load_memory_mapped(tmp_path):
+    texts = make_corpus(50, seed=4)
+    index = build(texts)
+    index.save(str(tmp_path / "lexical"))
+    loaded = BM25Index.load(str(tmp_path / "lexical"))
+    assert loaded.chunk_ids == index.chunk_ids
+    for query in QUERIES:
+        np.testing.assert_array_equal(dense_scores(loaded, query), dense_scores(index, query))
+
+
+def assert_same_index(index: BM25Index, rebuilt: BM25Index):
+    assert index.chunk_ids == rebuilt.chunk_ids
+    np.testing.assert_array_equal(index.doc_lens, rebuilt.doc_lens)
+    assert [index.sources[s] for s in index.doc_source] == [rebuilt.sources[s] for s in rebuilt.doc_source]
+    for query in QUERIES:
+        np.testing.assert_allclose(dense_scores(index, query), dense_scores(rebuilt, query), rtol=1e-6)
+
+
+def test_incremental_updates_equal_a_rebuild(tmp_path):
+    texts = make_corpus(120, seed=5)
+    ids = [f"c{i}" for i in range(len(texts))]
+    sources = [f"file{i % 4}.txt" for i in range(len(texts))]
+    index = BM25Index.build(ids[:100], texts[:100], sources[:100])
+
+    # A changed file: some chunks removed by id, one whole source dropped, new chunks added
+    index.remove_ids(ids[10:20])
+    assert index.remove_source("file3.txt") == 22  # 25, less three already removed by id
+    index.add_documents(ids[100:], texts[100:], sources[100:])
+    index.save(str(tmp_path / "lexical"))
+
+    kept = [i for i in range(120) if not (10 <= i < 20) and not (i < 100 and sources[i] == "file3.txt")]
+    rebuilt = BM25Index.build([ids[i] for i in kept], [texts[i] for i in kept], [sources[i] for i in kept])
+    assert_same_index(index, rebuilt)
+    assert_same_index(BM25Index.load(str(tmp_path / "lexical")), rebuilt)
+
+
+def test_removing_every_document_of_a_term():
+    index = BM25Index.build(["a", "b"], ["lisp machine", "neural network"], ["a.txt", "b.txt"])
+    index.remove_source("a.txt")
+    index.commit()
+    assert len(index.search("lisp", 5)[0]) == 0
+    assert_same_index(index, BM25Index.build(["b"], ["neural network"], ["b.txt"]))
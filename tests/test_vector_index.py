@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+import core.vector_index as vector_index
+from core.vector_index import VectorIndex
+
+DTYPES = ("float16", "int8")
+
+
+def make_embeddings(n: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def brute_force(index: VectorIndex, queries: np.ndarray, top_k: int, mask=None) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Full scoring over the stored (quantized) vectors."""
+    stored = index._decode(slice(0, len(index)))
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    results = []
+    for scores in queries @ stored.T:
+        allowed = np.arange(len(index)) if mask is None else np.flatnonzero(mask)
+        best = allowed[np.argsort(-scores[allowed], kind="stable")[:top_k]]
+        results.append((best, scores[best]))
+    return results
+
+
+def assert_same_results(results, expected):
+    assert len(results) == len(expected)
+    for (positions, scores), (expected_positions, expected_scores) in zip(results, expected):
+        np.testing.assert_array_equal(positions, expected_positions)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    # Several blocks per search, so the running top-k merge is exercised
+    monkeypatch.setattr(vector_index, "SEARCH_BLOCK_ROWS", 64)
+
+
+@pytest.mark.parametrize("dtype", DTYPES)
+def test_exact_search_matches_brute_force(dtype):
+    index = VectorIndex.build([f"c{i}" for i in range(500)], make_embeddings(500), dtype)
+    queries = make_embeddings(6, seed=1)
+    assert_same_results(index.search(queries, 10), brute_force(index, queries, 10))
+
+    mask = np.random.default_rng(2).random(500) < 0.1
+    assert_same_results(index.search(queries, 10, mask), brute_force(index, queries, 10, mask))
+
+    # Fewer allowed positions than top_k
+    mask = np.zeros(500, dtype=bool)
+    mask[[3, 77, 400]] = True
+    assert_same_results(index.search(queries, 10, mask), brute_force(index, queries, 10, mask))
+
+
+@pytest.mark.parametrize("dtype", DTYPES)
+def test_quantized_scores_stay_close_to_float32(dtype):
+    embeddings = make_embeddings(200)
+    index = VectorIndex.build([f"c{i}" for i in range(200)], embeddings, dtype)
+    query = make_embeddings(1, seed=3)
+    positions, scores = index.search(query, 5)[0]
+    unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    exact = unit[positions] @ (query[0] / np.linalg.norm(query[0]))
+    np.testing.assert_allclose(scores, exact, atol=2e-3 if dtype == "float16" else 2e-2)
+
+
+def test_ivf_search_with_every_list_probed_is_exact():
+    index = VectorIndex.build([f"c{i}" for i in range(600)], make_embeddings(600, seed=4))
+    index.train(n_lists=12)
+    index._build_lists()
+    queries = make_embeddings(5, seed=5)
+    assert_same_results(index.search(queries, 8, nprobe=12), brute_force(index, queries, 8))
+
+    mask = np.arange(600) % 5 == 0
+    assert_same_results(index.search(queries, 8, mask, nprobe=12), brute_force(index, queries, 8, mask))
+
+    # Fewer probes only look at part of the index, but never outside the mask
+    for positions, _ in index.search(queries, 8, mask, nprobe=2):
+        assert mask[positions].all()
+
+
+@pytest.mark.parametrize("dtype", DTYPES)
+def test_incremental_updates_equal_a_rebuild(tmp_path, dtype):
+    ids = [f"c{i}" for i in range(300)]
+    embeddings = make_embeddings(300, seed=6)
+    index = VectorIndex.build(ids[:250], embeddings[:250], dtype)
+    index.save(str(tmp_path / "vectors"))
+
+    index = VectorIndex.load(str(tmp_path / "vectors"))
+    assert index.remove_ids(ids[100:150]) == 50
+    index.add(ids[250:], embeddings[250:])
+    index.save(str(tmp_path / "vectors"))
+
+    kept = [i for i in range(300) if not 100 <= i < 150]
+    rebuilt = VectorIndex.build([ids[i] for i in kept], embeddings[kept], dtype)
+    queries = make_embeddings(4, seed=7)
+    for loaded in (index, VectorIndex.load(str(tmp_path / "vectors"))):
+        assert loaded.chunk_ids == rebuilt.chunk_ids
+        np.testing.assert_array_equal(np.asarray(loaded.vectors), rebuilt.vectors)
+        assert_same_results(loaded.search(queries, 10), rebuilt.search(queries, 10))
+
+
+def test_empty_index():
+    index = VectorIndex.build([], [])
+    positions, scores = index.search(make_embeddings(1), 5)[0]
+    assert len(positions) == len(scores) == 0
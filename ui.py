@@ -1,8 +1,9 @@
 import streamlit as st
 import requests
+import json
 
 # Configuration
-API_URL = "http://127.0.0.1:8000/ask"
+API_URL = "http://127.0.0.1:8000/ask/stream"
 st.set_page_config(page_title="AI History RAG", layout="wide")
 
 # --- UI Elements ---
@@ -31,30 +32,39 @@ if prompt := st.chat_input("What was the Dartmouth workshop?"):
         message_placeholder.markdown("Thinking...")
         
         try:
-            # Call the FastAPI backend
+            # Call the streaming endpoint and render tokens as they arrive
             payload = {"query": prompt}
-            response = requests.post(API_URL, json=payload, timeout=600) # 2 minute timeout
-            response.raise_for_status() # Raise an error for bad status codes
-            
-            data = response.json()
-            answer = data.get("answer", "I couldn't find an answer.")
-            citiations = data.get("citiations", [])
-            #timings = data.get("timings", {})
+            answer = ""
+            citations = []
+            with requests.post(API_URL, json=payload, stream=True, timeout=600) as response:
+                response.raise_for_status() # Raise an error for bad status codes
+
+                event = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                    elif line.startswith("data:"):
+                        data = json.loads(line[len("data:"):])
+                        if event == "token":
+                            answer += data["text"]
+                            message_placeholder.markdown(answer + "▌")
+                        elif event == "done":
+                            answer = data.get("answer", answer) or "I couldn't find an answer."
+                            citations = data.get("citations", [])
+
             # We check if the answer is the specific refusal message.
             if "cannot answer" in answer:
             # Display a friendlier, more conversational message.
                 message_placeholder.warning("It looks like that question is outside my knowledge base. I can only answer questions about the history of AI based on my documents.")
             else:  
-            # Simulate stream of response with spaces
                 message_placeholder.markdown(answer)
 
             #Display expandable citations
-            if citiations :
+            if citations:
                 with st.expander("Show Sources"):
                     for citation in citations:
                         st.caption(citation) #Display each clean citation
             full_response = answer            
-            #st.caption(f"Total time: {timings.get('total', 'N/A')}")
 
         except requests.exceptions.RequestException as e:
             message_placeholder.error(f"Failed to get a response from the backend. Error: {e}")